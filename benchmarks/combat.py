@@ -0,0 +1,107 @@
+# Combat benchmark: scoring every item against every enemy
+#
+# Compares fighting copies of each enemy one pair at a time through
+# Engine.fight (what a bot would have to do without the batch API) against
+# combat.evaluate, with and without NumPy.
+#
+#   python benchmarks/combat.py [--enemies 1000] [--items 20]
+
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from engine import Engine  # noqa: E402
+from character import Enemy, Boss, Ninja  # noqa: E402
+from item import Item  # noqa: E402
+from inventory import Inventory  # noqa: E402
+from generator import ITEMS, BOSS_WEAKNESS  # noqa: E402
+import combat  # noqa: E402
+
+
+def build(enemies, items, seed=0):
+    """Make an engine, plus a random mix of enemies and items"""
+    rng = random.Random(seed)
+    engine = Engine(seed=seed)
+    cave = engine.current_cave
+    kinds = ITEMS + [BOSS_WEAKNESS]
+    names = [name for (name, *_) in kinds]
+
+    characters = []
+    for _ in range(enemies):
+        roll = rng.random()
+        if roll < 0.05:
+            character = Boss("Shogun", "The final boss", cave)
+        elif roll < 0.1:
+            character = Ninja(cave)
+        else:
+            character = Enemy("Goblin", "A goblin", rng.randint(5, 60), cave)
+        character.set_weakness(rng.choice(names + [None]))
+        characters.append(character)
+
+    inventory = []
+    for _ in range(items):
+        (name, emoji, description, cost, damage) = rng.choice(kinds)
+        inventory.append(Item(name, emoji, description, cost, damage))
+    return engine, characters, inventory
+
+
+def one_at_a_time(engine, characters, items):
+    """Fight a copy of every enemy with every item through the engine"""
+    cave = engine.current_cave
+    defeated = 0
+    inventories = [Inventory([item]) for item in items]
+    for character in characters:
+        for (item, inventory) in zip(items, inventories):
+            fought = copy.copy(character)
+            cave.clear_characters()
+            cave.add_character(fought)
+            engine.items = inventory
+            engine.alive = True
+            engine.current_cave = cave
+            happened = engine.fight(fought, item)
+            defeated += any(type(event).__name__ in ("EnemyDefeated", "BossDefeated") for event in happened)
+    return defeated
+
+
+def timed(run, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time batch combat against one fight at a time")
+    parser.add_argument("--enemies", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine, characters, items = build(args.enemies, args.items)
+    pairs = args.enemies * args.items
+    print(f"{args.enemies} enemies x {args.items} items = {pairs} fights, best of {args.repeat}:")
+
+    runs = [("one at a time", lambda: one_at_a_time(engine, characters, items)),
+            ("batch, python", lambda: combat.evaluate(characters, items, use_numpy=False))]
+    if combat.numpy is not None:
+        runs.append(("batch, numpy", lambda: combat.evaluate(characters, items, use_numpy=True)))
+    else:
+        print("(NumPy isn't installed, skipping it)")
+
+    baseline = None
+    for (what, run) in runs:
+        seconds = timed(run, args.repeat)
+        baseline = baseline or seconds
+        print(f"  {what:<16}{seconds * 1000:>9.1f}ms {pairs / seconds:>14,.0f} fights/s {baseline / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# Memory benchmark: bytes per cave, character and item
+#
+# Compares the current slotted/flyweight entity classes against copies of the
+# old plain dict-backed classes, by building N of each and measuring how much
+# memory tracemalloc sees allocated. Then does the same for a whole generated
+# map, generating it once with the old classes swapped in and once as it is.
+#
+#   python benchmarks/memory.py [--count 100000]
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cave import Cave  # noqa: E402
+from character import Enemy, Friendly  # noqa: E402
+from item import Item  # noqa: E402
+from generator import ProceduralGenerator  # noqa: E402
+import generator  # noqa: E402
+
+
+# --- the old dict-backed entities, kept here for comparison ---
+
+class LegacyCave:
+    def __init__(self, num, name, description, map):
+        self.num = num
+        self.name = name
+        self.description = description
+        self.map = map
+        self.characters = []
+        self.items = set()
+
+    def add_character(self, new_character):
+        self.characters.append(new_character)
+
+
+class LegacyShop(LegacyCave):
+    def __init__(self, num, description, map):
+        super().__init__(num, "Shop", description, map)
+        self.for_sale = []  # one Item per unit
+
+    def add_shop_item(self, new_item):
+        self.for_sale.append(new_item)
+
+
+class LegacyCharacter:
+    def __init__(self, name, description, cave):
+        self.name = name
+        self.description = description
+        self.cave = cave
+        self.conversation = None
+
+    def set_conversation(self, new_conv):
+        self.conversation = new_conv
+
+
+class LegacyEnemy(LegacyCharacter):
+    def __init__(self, name, description, health, cave):
+        super().__init__(name, description, cave)
+        self.health = health
+        self.total_health = health
+        self.weakness_item_name = None
+        self.drop = None
+
+    def set_weakness(self, weakness):
+        self.weakness_item_name = weakness
+
+    def set_drop(self, item):
+        self.drop = item
+
+
+class LegacyBoss(LegacyEnemy):
+    def __init__(self, name, description, cave):
+        super().__init__(name, description, 1_000_000, cave)
+
+
+class LegacyNinja(LegacyEnemy):
+    def __init__(self, cave):
+        super().__init__("Ninja", "A black shadowy figure that looks ready to strike", 1, cave)
+
+
+class LegacyItem:
+    def __init__(self, name, emoji, description, cost, damage=0):
+        self.name = name
+        self.emoji = emoji
+        self.description = description
+        self.cost = cost
+        self.damage = damage
+
+
+def _text(template):
+    """Build a string at runtime, like text decoded from a file or generated
+
+    Literal strings in source are already shared, which would hide the
+    effect of interning.
+    """
+    return (template + " ")[:-1]
+
+
+def measure(build, count):
+    """Return the bytes allocated per object by calling build(i) `count` times"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # don't count the list holding them
+    per_object = (after - before - sys.getsizeof(kept)) / count
+    del kept
+    return per_object
+
+
+# what the generator builds its maps from, and the old classes to swap in
+LEGACY_CLASSES = {"Cave": LegacyCave, "Shop": LegacyShop, "Item": LegacyItem, "Enemy": LegacyEnemy,
+                  "Friendly": LegacyCharacter, "Boss": LegacyBoss, "Ninja": LegacyNinja}
+
+
+def measure_map(count, legacy=False):
+    """Return the bytes allocated per cave for a whole generated map
+
+    With legacy=True the map is generated with the old classes instead.
+    """
+    swapped = {}
+    if legacy:
+        swapped = {name: getattr(generator, name) for name in LEGACY_CLASSES}
+        for (name, cls) in LEGACY_CLASSES.items():
+            setattr(generator, name, cls)
+    try:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        kept = ProceduralGenerator(count, seed=0).generate(None)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+    finally:
+        for (name, cls) in swapped.items():
+            setattr(generator, name, cls)
+    return (after - before) / count
+
+
+def run(count):
+    """Run every measurement, returning a list of (what, before, after) bytes per object"""
+    name = "Dungeon"
+    description = "Echoes of unseen horrors lurk beyond the flickering torchlight"
+    enemy_name = "Reanimated Skeleton"
+    enemy_description = "A spooky scary skeleton... AAH IT MOVES!"
+
+    results = []
+    results.append(("cave",
+                    measure(lambda i: LegacyCave(i, _text(name), _text(description), None), count),
+                    measure(lambda i: Cave(i, _text(name), _text(description), None), count)))
+    results.append(("enemy",
+                    measure(lambda i: LegacyEnemy(_text(enemy_name), _text(enemy_description), 30, None), count),
+                    measure(lambda i: Enemy(_text(enemy_name), _text(enemy_description), 30, None), count)))
+    results.append(("friendly",
+                    measure(lambda i: LegacyCharacter(_text("Red Slime"), _text("A small red blob"), None), count),
+                    measure(lambda i: Friendly(_text("Red Slime"), _text("A small red blob"), None), count)))
+    results.append(("item",
+                    measure(lambda i: LegacyItem(_text("Axe"), "🪓", _text("A sharpened hatchet"), 15, 15), count),
+                    measure(lambda i: Item(_text("Axe"), "🪓", _text("A sharpened hatchet"), 15, 15), count)))
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure memory used per game entity")
+    parser.add_argument("--count", type=int, default=100_000,
+                        help="how many of each entity to build (default: 100000)")
+    args = parser.parse_args()
+
+    print(f"Bytes per entity, {args.count} of each:")
+    print(f"{'entity':<10}{'before':>10}{'after':>10}{'saved':>8}")
+    for (what, before, after) in run(args.count):
+        print(f"{what:<10}{before:>10.0f}{after:>10.0f}{1 - after / before:>8.0%}")
+
+    # a whole generated map, including links, characters and shop stock
+    before = measure_map(args.count, legacy=True)
+    after = measure_map(args.count)
+    print(f"Generated map of {args.count} caves: {before:.0f} -> {after:.0f} bytes per cave in total "
+          f"({1 - after / before:.0%} saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+# Benchmark suite for the game's hot paths
+#
+# Times map generation, link lookups, status rendering, text width and box
+# drawing, command dispatch and whole scripted playthroughs, on the built-in
+# map and procedural maps of a few sizes. Results can be saved as JSON and
+# compared against an earlier run to spot regressions between commits:
+#
+#   python benchmarks/run.py --json before.json
+#   (make changes)
+#   python benchmarks/run.py --json after.json --compare before.json
+#
+# Terminal output is thrown away while timing, so this measures the Python
+# side of rendering, not the terminal.
+
+import contextlib
+import io
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from engine import Engine  # noqa: E402
+from game import Game  # noqa: E402
+from map import MapGraph  # noqa: E402
+from generator import ProceduralGenerator  # noqa: E402
+import display  # noqa: E402
+import simulate  # noqa: E402
+
+BUILTIN = "builtin"  # the hand-made 13 cave map, as a size
+DEFAULT_SIZES = [BUILTIN, 1_000, 100_000]
+
+
+class Sink:
+    """A stdout that throws away everything written to it"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def build_world(size, seed=0):
+    """An engine with the built-in map, or a procedural map of `size` caves"""
+    if size == BUILTIN:
+        return Engine(seed=seed)
+    return Engine(lambda engine: ProceduralGenerator(size, seed=seed).generate(engine), seed=seed)
+
+
+def sample_caves(world, count, seed=0):
+    """Pick caves at random, the same ones every run"""
+    rng = random.Random(seed)
+    return [world.get_cave(rng.randrange(1, world.size)) for _ in range(count)]
+
+
+@contextlib.contextmanager
+def quiet(answers=""):
+    """Throw away output, and answer input() prompts from a string"""
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(answers)
+    try:
+        with contextlib.redirect_stdout(Sink()):
+            yield
+    finally:
+        sys.stdin = stdin
+
+
+# ---
+# Cases. Each takes a map size and returns (run, ops): a function to time,
+# and how many operations one call of it does
+# ---
+
+CASES = {}
+
+
+def case(name, max_size=None):
+    """Register a benchmark case. Sizes over max_size are skipped"""
+    def register(setup):
+        CASES[name] = (setup, max_size)
+        return setup
+    return register
+
+
+@case("generate")
+def bench_generate(size):
+    if size == BUILTIN:
+        return (lambda: MapGraph.generate(None)), 1
+    return (lambda: ProceduralGenerator(size, seed=0).generate(None)), size
+
+
+@case("linked_caves")
+def bench_linked_caves(size):
+    world = build_world(size).map
+    caves = sample_caves(world, 10_000)
+
+    def run():
+        for cave in caves:
+            world.linked_caves(cave)
+    return run, len(caves)
+
+
+@case("check_link")
+def bench_check_link(size):
+    world = build_world(size).map
+    rng = random.Random(0)
+    pairs = []
+    for cave in sample_caves(world, 5_000):
+        # half linked pairs, half random ones (almost never linked)
+        pairs.append((cave.num, rng.choice(world.linked_caves(cave)).num))
+        pairs.append((cave.num, rng.randrange(1, world.size)))
+
+    def run():
+        for (a, b) in pairs:
+            world.check_link(a, b)
+    return run, len(pairs)
+
+
+@case("status")
+def bench_status(size):
+    engine = build_world(size)
+    with quiet():
+        game = Game(engine)
+    caves = sample_caves(engine.map, 2_000)
+
+    def run():
+        with quiet():
+            for cave in caves:
+                engine.current_cave = cave
+                game.print_status()
+    return run, len(caves)
+
+
+# a mix of plain, styled and emoji text, like the game prints
+TEXTS = [
+    "You are in cave [12]: A Dungeon",
+    f"You are in cave [{display.bold(12)}]: A Dungeon",
+    f"  The {display.colour(1, display.underline('Shogun'))}: The final boss",
+    "🛍️  There is a shop here! Use the 'shop' command to check it out!",
+    f"You've bought a brand new {display.bold('🪓 Axe')}! You now have {display.colour(220, '$5')}.",
+    "Echoes of unseen horrors lurk beyond the flickering torchlight",
+]
+
+
+@case("visual_len", max_size=BUILTIN)
+def bench_visual_len(size):
+    texts = TEXTS * 500
+
+    def run():
+        for text in texts:
+            display.visual_len(text)
+    return run, len(texts)
+
+
+@case("boxes", max_size=BUILTIN)
+def bench_boxes(size):
+    count = 300
+
+    def run():
+        # every box waits for Enter once
+        with quiet("\n" * (3 * count)):
+            for _ in range(count):
+                display.alert_box(TEXTS[3])
+                display.multiline_alert_box(TEXTS, colour_code=4)
+                display.speech_box(TEXTS[5], "Shogun", colour_code=8)
+    return run, 3 * count
+
+
+@case("onecmd")
+def bench_onecmd(size):
+    engine = build_world(size)
+    with quiet():
+        game = Game(engine)
+    # commands that don't wait for input
+    far = engine.map.size - 1
+    lines = ["inv", "refresh", f"move {far}", "move x", "move", "talk", "nonsense", "help inv"] * 250
+
+    def run():
+        with quiet():
+            for line in lines:
+                game.onecmd(line)
+    return run, len(lines)
+
+
+class ScriptedGame(Game):
+    """A Game that plays a recorded list of commands, answering its prompts too"""
+
+    def __init__(self, engine, script):
+        super().__init__(engine)
+        self.cmdqueue = [line for (line, _) in script]
+        self.answers = [answers for (_, answers) in script]
+
+    def precmd(self, line):
+        # each command gets its own answers, plus spare Enters for any
+        # "Press Enter to Continue"s
+        sys.stdin = io.StringIO(self.answers.pop(0) + "\n" * 10)
+        return line
+
+
+def record_playthrough(size, seed, max_turns=300):
+    """Play a game with the simulator's scripted bot, returning the Game commands to replay it"""
+    engine = Engine(partial(simulate.build_map, simulate.Settings(size=None if size == BUILTIN else size)), seed=seed)
+    rng = random.Random(seed)
+    script = []
+    for _ in range(max_turns):
+        command = simulate.scripted_policy(engine, rng)
+        engine.execute(command)
+        # the same thing, as typed into the game's menus
+        match command.split():
+            case ["fight", character, item]:
+                script.append(("fight", f"{character}\n{item}\n"))
+            case ["buy", item]:
+                script.append(("shop", f"{item}\n"))
+            case _:
+                script.append((command, ""))
+        if engine.won or not engine.alive:
+            break
+    else:
+        script.append(("quit", "y\n"))
+    return script
+
+
+@case("playthrough", max_size=1_000)
+def bench_playthrough(size):
+    seed = 1
+    script = record_playthrough(size, seed)
+    build = partial(simulate.build_map, simulate.Settings(size=None if size == BUILTIN else size))
+
+    def run():
+        # includes building the world, the game changes it
+        with quiet():
+            game = ScriptedGame(Engine(build, seed=seed), script)
+            game.cmdloop()
+    return run, len(script)
+
+
+# ---
+# Running and reporting
+# ---
+
+def fits(size, max_size):
+    if max_size is None:
+        return True
+    if max_size == BUILTIN:
+        return size == BUILTIN
+    return size == BUILTIN or size <= max_size
+
+
+def time_case(run, repeat):
+    """Return the time of each of `repeat` calls to run"""
+    run()  # warm up
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names, sizes, repeat):
+    results = []
+    for name in names:
+        (setup, max_size) = CASES[name]
+        for size in sizes:
+            if not fits(size, max_size):
+                continue
+            (run, ops) = setup(size)
+            times = time_case(run, repeat)
+            best = min(times)
+            result = {
+                "case": name,
+                "size": size,
+                "ops": ops,
+                "best": best,
+                "median": statistics.median(times),
+                "per_op_us": best / ops * 1e6,
+            }
+            results.append(result)
+            print(f"{name:<14}{size!s:>9}{ops:>9}{best * 1000:>12.2f}ms{result['per_op_us']:>12.2f}us/op")
+    return results
+
+
+def compare(results, path):
+    """Print how each result changed since a saved run"""
+    import json
+
+    with open(path) as file:
+        before = {(r["case"], r["size"]): r for r in json.load(file)["results"]}
+    print(f"\nCompared with {path}:")
+    for result in results:
+        old = before.get((result["case"], result["size"]))
+        if old is None:
+            continue
+        change = result["per_op_us"] / old["per_op_us"] - 1
+        print(f"{result['case']:<14}{result['size']!s:>9}{old['per_op_us']:>12.2f} ->{result['per_op_us']:>10.2f}us/op {change:>+8.1%}")
+
+
+def main():
+    import argparse
+    import json
+
+    def size(text):
+        return text if text == BUILTIN else int(text)
+
+    parser = argparse.ArgumentParser(description="Time the game's hot paths")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=size, default=DEFAULT_SIZES,
+                        help=f"map sizes to run on, '{BUILTIN}' for the built-in map (default: {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=5, help="times to run each case, the best is kept")
+    parser.add_argument("--json", default=None, help="save the results to this file")
+    parser.add_argument("--compare", default=None, help="compare with results saved by an earlier run")
+    args = parser.parse_args()
+
+    print(f"{'case':<14}{'size':>9}{'ops':>9}{'best':>14}{'per op':>14}")
+    results = run_suite(args.cases, args.sizes, args.repeat)
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump({
+                "commit": git_commit(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "results": results,
+            }, file, indent=2)
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,124 @@
+from stock import Stock
+
+# stdlib
+import sys
+
+# shared by every cave without items, so empty caves don't each need a set
+_NO_ITEMS = frozenset()
+
+
+class Characters:
+    """The characters in a cave, in the order they were added, indexed by role
+
+    Reads like a list (len, iteration, indexing from 0), but adding and
+    removing a character is O(1), and so is checking whether there's a
+    character with a given role (see character.ROLES). Indexing copies the
+    characters into a list the first time after a change, which is fine for
+    menus.
+    """
+    __slots__ = ("all", "roles", "ordered")
+
+    def __init__(self):
+        # character -> None. dicts keep the order keys were added in
+        self.all = {}
+        # role -> how many characters have it. Counts rather than sets of
+        # characters, there are a lot of caves on large maps and few
+        # characters in each
+        self.roles = {}
+        self.ordered = None  # list(self.all), made when first indexed
+
+    def add(self, character):
+        """Add a character, which mustn't be here already"""
+        self.all[character] = None
+        self.roles[character.role] = self.roles.get(character.role, 0) + 1
+        self.ordered = None
+
+    def remove(self, character):
+        """Remove a character, raising ValueError if it isn't here (like list.remove)"""
+        if character not in self.all:
+            raise ValueError(f"{character!r} is not in this cave")
+        del self.all[character]
+        if self.roles[character.role] == 1:
+            del self.roles[character.role]
+        else:
+            self.roles[character.role] -= 1
+        self.ordered = None
+
+    def of_role(self, role):
+        """The characters with a role, in order"""
+        if role not in self.roles:
+            return []
+        return [character for character in self.all if character.role == role]
+
+    def has_role(self, role):
+        return role in self.roles
+
+    def count(self, role):
+        """How many characters have a role"""
+        return self.roles.get(role, 0)
+
+    def __len__(self):
+        return len(self.all)
+
+    def __iter__(self):
+        return iter(self.all)
+
+    def __contains__(self, character):
+        return character in self.all
+
+    def __getitem__(self, index):
+        if self.ordered is None:
+            self.ordered = list(self.all)
+        return self.ordered[index]
+
+
+# shared by every cave without characters, like _NO_ITEMS. Never added to
+_NO_CHARACTERS = Characters()
+
+
 class Cave:
     """Represents a single room in the game the player may enter. Must have a unique number assigned to it
 
     May be composed of Characters and Items
+
+    revision goes up whenever anything shown about the cave changes (through
+    the methods here, or its characters' setters), so what's been drawn for
+    it can be cached until then.
     """
+    # large maps have a lot of caves, so skip the per-instance __dict__
+    __slots__ = ("num", "name", "description", "map", "characters", "items", "revision")
+
     def __init__(self, num, name, description, map):
         self.num = num
-        self.name = name
-        self.description = description
+        # names and descriptions repeat a lot between caves, share them
+        self.name = sys.intern(name)
+        self.description = sys.intern(description)
         self.map = map
 
         # Optional attributes
-        self.characters = []
-        self.items = set() # similarly, an item should only appear once in a room
+        self.characters = _NO_CHARACTERS
+        self.items = _NO_ITEMS # similarly, an item should only appear once in a room
+
+        self.revision = 0
+
+    def touch(self):
+        """Mark this cave as changed, see revision"""
+        self.revision += 1
 
     # Setters and getters    
     def set_description(self, new_desc):
         """Sets a new description for this cave, if the provided description is not None"""
         if new_desc is not None:
-            self.description = new_desc
+            self.description = sys.intern(new_desc)
+            self.revision += 1
     def get_description(self):
         return self.description
 
     def set_name(self, new_name):
         """Sets a new name for this cave, if the provided name is not None"""
         if new_name is not None:
-            self.name = new_name
+            self.name = sys.intern(new_name)
+            self.revision += 1
     def get_name(self):
         return self.name
 
@@ -33,21 +127,43 @@ class Cave:
         return self.items
     
     def add_item(self, new_item):
+        if self.items is _NO_ITEMS:
+            self.items = set()
         self.items.add(new_item)
+        self.revision += 1
 
     def remove_item(self, item):
+        if item not in self.items:
+            raise KeyError(item)
         self.items.remove(item)
+        self.revision += 1
 
     def clear_items(self):
         """Remove all items from this cave"""
-        self.items.clear()
+        self.items = _NO_ITEMS
+        self.revision += 1
 
     # character handling
     def add_character(self, new_character):
-        self.characters.append(new_character)
+        if new_character in self.characters:
+            return  # a character can only be in a cave once
+        if self.characters is _NO_CHARACTERS:
+            self.characters = Characters()
+        self.characters.add(new_character)
+        if self.map is not None:
+            self.map.roles.add(new_character.role, self.num)
+        self.revision += 1
 
     def remove_character(self, character):
         self.characters.remove(character)
+        if self.map is not None:
+            self.map.roles.remove(character.role, self.num)
+        self.revision += 1
+
+    def clear_characters(self):
+        """Remove all characters from this cave"""
+        for character in list(self.characters):
+            self.remove_character(character)
 
     def get_characters(self):
         return self.characters
@@ -57,18 +173,31 @@ class Cave:
 
 class Shop(Cave):
     """A special type of Cave with a shop where players can buy items"""
+    __slots__ = ("for_sale",)
 
     def __init__(self, num, description, map):
         super().__init__(num, "Shop", description, map)
 
         # no characters exist in the shop
 
-        self.for_sale = [] # items for sale
+        # items for sale, cheapest first. the kinds of item are shared with
+        # the map's other shops
+        self.for_sale = Stock(getattr(map, "shop_catalog", None))
 
-    def add_shop_item(self, new_item):
-        self.for_sale.append(new_item)
+    def add_shop_item(self, new_item, count=1):
+        """Stock `count` more of an item"""
+        self.for_sale.add(new_item, count)
+        self.revision += 1
 
     def remove_shop_item(self, item):
-        self.for_sale.remove(item)
+        """Take one of an item out of stock, returning it as a new Item (see Stock.take)"""
+        bought = self.for_sale.take(item)
+        self.revision += 1
+        return bought
+
+    def clear_shop_items(self):
+        """Remove everything from this shop's stock"""
+        self.for_sale = Stock(self.for_sale.catalog)
+        self.revision += 1
 
     
\ No newline at end of file
@@ -1,12 +1,31 @@
-import display
+import sys
+
+# what part a character plays, see Character.role. Caves and the map index
+# their characters by these (see cave.Characters and map.RoleIndex)
+ENEMY = "enemy"
+BOSS = "boss"
+NINJA = "ninja"
+FRIENDLY = "friendly"
+ROLES = (ENEMY, BOSS, NINJA, FRIENDLY)
+
+
+def _intern(text):
+    """Intern a string so repeated names and lines share one copy. Passes None through"""
+    if text is None:
+        return None
+    return sys.intern(text)
+
 
 class Character:
     """Represents a non-player character with an optional voice line
     """
+    # no per-instance __dict__, there can be a lot of characters on large maps
+    __slots__ = ("name", "description", "cave", "conversation")
+    role = None  # one of the roles above, set by each subclass
 
     def __init__(self, name, description, cave):
-        self.name = name
-        self.description = description
+        self.name = _intern(name)
+        self.description = _intern(description)
         self.cave = cave
 
         # Optional attributes
@@ -16,7 +35,8 @@ class Character:
     def set_description(self, new_desc):
         """Sets a new description for this character, if the provided description is not None"""
         if new_desc is not None:
-            self.description = new_desc
+            self.description = _intern(new_desc)
+            self.__touch_cave()
 
     def get_description(self):
         return self.description
@@ -24,14 +44,20 @@ class Character:
     def set_name(self, new_name):
         """Sets a new name for this character, if the provided name is not None"""
         if new_name is not None:
-            self.name = new_name
+            self.name = _intern(new_name)
+            self.__touch_cave()
 
     def get_name(self):
         return self.name
 
+    def __touch_cave(self):
+        # the cave shows this character's name and description
+        if self.cave is not None:
+            self.cave.touch()
+
     def set_conversation(self, new_conv):
         """Sets this character's voice line, overriding any existing voice line"""
-        self.conversation = new_conv
+        self.conversation = _intern(new_conv)
 
     def get_conversation(self):
         return self.conversation
@@ -40,6 +66,8 @@ class Character:
 class Enemy(Character):
     """Represents a character that acts as an enemy to the player
     """
+    __slots__ = ("health", "total_health", "weakness_item_name", "drop")
+    role = ENEMY
 
     def __init__(self, name, description, health, cave):
         super().__init__(name, description, cave)  # initialise superclass
@@ -54,7 +82,7 @@ class Enemy(Character):
     # Setters and getters
     def set_weakness(self, weakness):
         """Sets this enemy's weakness, overriding any existing value. Pass None for no weakness"""
-        self.weakness_item_name = weakness
+        self.weakness_item_name = _intern(weakness)
 
     def get_weakness(self):
         return self.weakness_item_name
@@ -96,12 +124,14 @@ class Boss(Enemy):
        On Boss kill, the boss will drop currencies that will allow the player to purchase the obsidian key from the shop
        in order to unlock the hidden ending which is located in shop 10.
     """
+    __slots__ = ()
+    role = BOSS
+
     def __init__(self, name, description, cave):
         super().__init__(name, description, 1_000_000, cave)
     
     def fight(self, item):
-        # Boss fight sequence
-        display.speech_box("You dare challenge me, little fool?", self.name)
+        """Fight sequence for the boss. Returns whether the boss was defeated"""
         # You can only defeat a boss with its weakness
         if item.name != self.weakness_item_name:
             return False
@@ -109,21 +139,25 @@ class Boss(Enemy):
 
 class Ninja(Enemy):
     """A special type of enemy that can kidnap the player and transport them to a random cave"""
+    __slots__ = ()
+    role = NINJA
 
     def __init__(self, cave):
         super().__init__("Ninja", "A black shadowy figure that looks ready to strike", 1, cave) # health doesn't matter, you can't fight ninjas
 
     def fight(self, item):
-        """If a player chooses to fight with a ninja they will kidnap them"""
+        """If a player chooses to fight with a ninja they will kidnap them
+
+        Returns the random cave the player is sent to
+        """
         # kidnapping procedure
-        display.alert_box(f"You try to fight the ninja with your {item.name}, but they quickly drop a smoke bomb!")
-        random_cave = self.cave.map.random_cave()
-        # send player to random cave
-        self.cave.map.game.set_cave(random_cave.num)
-        display.alert_box(f"The smoke clears and you're suddenly in a different cave!")
+        return self.cave.map.random_cave()
 
 
 class Friendly(Character):
+    __slots__ = ()
+    role = FRIENDLY
+
     def __init__(self, name, description, cave):
         super().__init__(name, description, cave) # initialise super class
         self.conversation = None
\ No newline at end of file
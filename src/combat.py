@@ -0,0 +1,216 @@
+# Batch combat: work out lots of fights at once
+#
+# Engine.fight resolves one item against one enemy, and changes the game as
+# it goes. Balance sweeps and bots want to score every item in the inventory
+# against every enemy in range each turn, so this lays the enemies and items
+# out as columns (health, damage, weakness...) and works out every pairing in
+# one go, without changing anything. The results follow the same rules as
+# Engine.fight.
+#
+# Uses NumPy if it's installed, and plain Python lists otherwise.
+
+from engine import Engine
+from character import Enemy, ENEMY, BOSS, NINJA, FRIENDLY
+
+# stdlib
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# how a character reacts to being fought
+KIND_ENEMY = 0
+KIND_BOSS = 1
+KIND_NINJA = 2
+KIND_FRIENDLY = 3  # can't be fought at all
+
+ROLE_KINDS = {ENEMY: KIND_ENEMY, BOSS: KIND_BOSS, NINJA: KIND_NINJA, FRIENDLY: KIND_FRIENDLY}
+
+NO_WEAKNESS = -1
+
+
+def character_kind(character):
+    """Return the KIND_* for a character"""
+    kind = ROLE_KINDS.get(character.role)
+    if kind is not None:
+        return kind
+    raise ValueError(f"Can't fight character '{character.name}' of type {type(character).__name__}")
+
+
+class Combatants:
+    """The enemies and items to be matched up, as columns
+
+    Item names are swapped for small numbers, so checking an item against an
+    enemy's weakness is a number comparison.
+    """
+
+    def __init__(self, characters, items):
+        self.characters = list(characters)
+        self.items = list(items)
+
+        name_ids = {}
+        for item in self.items:
+            name_ids.setdefault(item.name, len(name_ids))
+
+        self.kind = []
+        self.health = []
+        self.total_health = []
+        self.weakness = []  # id of the weakness's name, NO_WEAKNESS if none of the items are it
+        for character in self.characters:
+            self.kind.append(character_kind(character))
+            if isinstance(character, Enemy):
+                self.health.append(character.health)
+                self.total_health.append(character.total_health)
+                self.weakness.append(name_ids.get(character.weakness_item_name, NO_WEAKNESS))
+            else:
+                self.health.append(0)
+                self.total_health.append(0)
+                self.weakness.append(NO_WEAKNESS)
+
+        self.damage = [item.damage for item in self.items]
+        self.name = [name_ids[item.name] for item in self.items]
+
+
+class CombatTable:
+    """What would happen if each character were fought with each item
+
+    Every column is indexed [character][item], in the order they were given,
+    and is a 2D NumPy array (or a list of lists without NumPy):
+
+        damage       damage the fight reports dealing
+        health_after the enemy's health afterwards
+        weakness     whether the item is the character's weakness
+        defeated     whether the character is defeated
+        reward       coins the player gets for it
+        fatal        whether the player dies (the boss, without its weakness)
+        teleported   whether a ninja sends the player to a random cave
+        blocked      whether the fight isn't allowed (friendly characters)
+    """
+
+    def __init__(self, combatants, damage, health_after, weakness, defeated, reward, fatal, teleported, blocked):
+        self.characters = combatants.characters
+        self.items = combatants.items
+        self.damage = damage
+        self.health_after = health_after
+        self.weakness = weakness
+        self.defeated = defeated
+        self.reward = reward
+        self.fatal = fatal
+        self.teleported = teleported
+        self.blocked = blocked
+
+    def best_items(self):
+        """For each character, the index of the best item to fight them with, or None
+
+        The best item is one that defeats them (the most rewarding one, then
+        the hardest hitting), otherwise the one that does the most damage.
+        Items that would kill the player, get them teleported, or do nothing
+        are never picked.
+        """
+        if numpy is not None and isinstance(self.fatal, numpy.ndarray):
+            return self.__best_items_numpy()
+
+        best = []
+        for c in range(len(self.characters)):
+            best_score = (0, 0)
+            best_item = None
+            for i in range(len(self.items)):
+                if self.fatal[c][i] or self.teleported[c][i] or self.blocked[c][i]:
+                    continue
+                score = (int(self.reward[c][i]) + 1 if self.defeated[c][i] else 0, int(self.damage[c][i]))
+                if score > best_score:
+                    best_score = score
+                    best_item = i
+            best.append(best_item)
+        return best
+
+    def __best_items_numpy(self):
+        if not len(self.items):
+            return [None] * len(self.characters)
+        # one number ordering the cells like the (reward, damage) tuples above:
+        # defeating comes first, damage (never negative) breaks ties
+        damage = self.damage.astype(numpy.int64)
+        scale = int(damage.max()) + 1
+        score = numpy.where(self.defeated, self.reward.astype(numpy.int64) + 1, 0) * scale + damage
+        score = numpy.where(self.fatal | self.teleported | self.blocked, 0, score)
+        # argmax picks the first of equal scores, like the loop
+        best = score.argmax(axis=1)
+        found = score[numpy.arange(len(self.characters)), best] > 0
+        return [int(i) if ok else None for (i, ok) in zip(best.tolist(), found.tolist())]
+
+
+def evaluate(characters, items, reward_factor=Engine.reward_factor, use_numpy=None):
+    """Work out fighting each character with each item, returning a CombatTable
+
+    Nothing is changed; the characters keep their health. Pass
+    use_numpy=False to use plain Python even if NumPy is installed.
+    """
+    combatants = Combatants(characters, items)
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy:
+        return _evaluate_numpy(combatants, reward_factor)
+    return _evaluate_python(combatants, reward_factor)
+
+
+def _evaluate_numpy(combatants, reward_factor):
+    # characters down the rows, items across the columns
+    kind = numpy.array(combatants.kind, dtype=numpy.int8).reshape(-1, 1)
+    health = numpy.array(combatants.health, dtype=numpy.int64).reshape(-1, 1)
+    total_health = numpy.array(combatants.total_health, dtype=numpy.int64).reshape(-1, 1)
+    weakness_id = numpy.array(combatants.weakness, dtype=numpy.int64).reshape(-1, 1)
+    item_damage = numpy.array(combatants.damage, dtype=numpy.int64).reshape(1, -1)
+    name = numpy.array(combatants.name, dtype=numpy.int64).reshape(1, -1)
+
+    shape = (len(combatants.characters), len(combatants.items))
+    enemy = numpy.broadcast_to(kind == KIND_ENEMY, shape)
+    boss = numpy.broadcast_to(kind == KIND_BOSS, shape)
+
+    weakness = numpy.broadcast_to(weakness_id == name, shape)
+    # items that do no damage don't do anything to regular enemies, even their weakness
+    effective = enemy & (item_damage > 0)
+    defeated = (boss & weakness) | (effective & ((item_damage >= health) | weakness))
+    damage = numpy.where(effective, numpy.minimum(item_damage, total_health), 0)
+    health_after = numpy.where(effective, numpy.maximum(health - item_damage, 0), health)
+    # only regular enemies give coins
+    rewards = numpy.rint(numpy.sqrt(reward_factor * total_health)).astype(numpy.int64)
+    reward = numpy.where(defeated & enemy, rewards, 0)
+
+    return CombatTable(
+        combatants, damage, health_after, weakness, defeated, reward,
+        fatal=boss & ~weakness,
+        teleported=numpy.broadcast_to(kind == KIND_NINJA, shape),
+        blocked=numpy.broadcast_to(kind == KIND_FRIENDLY, shape),
+    )
+
+
+def _evaluate_python(combatants, reward_factor):
+    columns = [[] for _ in range(8)]
+    for (kind, health, total_health, weakness_id) in zip(
+            combatants.kind, combatants.health, combatants.total_health, combatants.weakness):
+        rows = [[] for _ in range(8)]
+        reward = round(math.sqrt(reward_factor * total_health))
+        for (item_damage, name) in zip(combatants.damage, combatants.name):
+            weakness = weakness_id == name
+            effective = kind == KIND_ENEMY and item_damage > 0
+            if kind == KIND_BOSS:
+                defeated = weakness
+            else:
+                defeated = effective and (item_damage >= health or weakness)
+            outcome = (
+                min(item_damage, total_health) if effective else 0,
+                max(health - item_damage, 0) if effective else health,
+                weakness,
+                defeated,
+                reward if defeated and kind == KIND_ENEMY else 0,
+                kind == KIND_BOSS and not weakness,
+                kind == KIND_NINJA,
+                kind == KIND_FRIENDLY,
+            )
+            for (row, value) in zip(rows, outcome):
+                row.append(value)
+        for (column, row) in zip(columns, rows):
+            column.append(row)
+    return CombatTable(combatants, *columns)
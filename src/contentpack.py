@@ -0,0 +1,374 @@
+# Content packs: worlds described in TOML files
+#
+# A content pack lists a world's items and caves, with each cave's links,
+# characters and shop stock, so new worlds can be made without touching the
+# code (MapGraph.generate is the built-in world, written out as Python):
+#
+#   [items.axe]                  # "axe" is how the rest of the pack refers to it
+#   name = "Axe"
+#   emoji = "🪓"
+#   description = "A sharpened hatchet"
+#   cost = 15
+#   damage = 15
+#
+#   [[caves]]
+#   number = 2
+#   shop = true                  # shops are always called "Shop"
+#   description = "A nice and cozy room with a counter and some products"
+#   links = [1]                  # links go both ways, list them on either cave
+#   stock = ["axe", { item = "candle", count = 3 }]
+#
+#   [[caves.characters]]
+#   role = "enemy"               # enemy, boss, ninja or friendly
+#   name = "Bat"
+#   description = "A small filthy creature with sharp teeth"
+#   health = 20                  # enemies only
+#   weakness = "flamethrower"    # enemies and bosses, an item
+#   drop = "dagger"              # enemies and bosses, an item
+#   conversation = "Squeak!"
+#
+# The player starts in cave 1. Parsing a big pack takes a while, so the
+# parsed world is compiled into a binary map file (see mapfile.py) in a
+# __packcache__ folder next to the pack, and loaded from there (lazily, with
+# mmap) for as long as the pack doesn't change.
+#
+#   python src/main.py --world worlds/shogunate.toml
+#   python src/contentpack.py compile worlds/shogunate.toml
+#   python src/contentpack.py export my_world.toml [--size 5000]
+
+from map import MapGraph
+from cave import Cave, Shop
+from item import Item, CATALOG
+from character import Enemy, Boss, Ninja, Friendly, ENEMY, BOSS, NINJA, FRIENDLY, ROLES
+import mapfile
+
+# stdlib
+import glob
+import hashlib
+import json
+import os
+import tomllib
+
+CACHE_DIR = "__packcache__"
+# maps bigger than this use the sparse links backend, see MapGraph
+SPARSE_SIZE = 1_000
+
+
+def _error(path, where, message):
+    return ValueError(f"'{path}': {where}: {message}")
+
+
+def _text(path, where, table, key, required=True):
+    value = table.get(key)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str):
+        raise _error(path, where, f"'{key}' should be text")
+    return value
+
+
+def _number(path, where, table, key, default=None):
+    value = table.get(key, default)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise _error(path, where, f"'{key}' should be a whole number")
+    return value
+
+
+def _items(path, pack):
+    """Read the [items] table into {key: ItemDefinition}"""
+    definitions = {}
+    items = pack.get("items", {})
+    if not isinstance(items, dict):
+        raise _error(path, "items", "should be a table of items")
+    for (key, table) in items.items():
+        where = f"item '{key}'"
+        if not isinstance(table, dict):
+            raise _error(path, where, "should be a table")
+        definitions[key] = CATALOG.define(
+            _text(path, where, table, "name"), _text(path, where, table, "emoji"),
+            _text(path, where, table, "description"), _number(path, where, table, "cost"),
+            _number(path, where, table, "damage", 0))
+    return definitions
+
+
+def _list(path, where, table, key):
+    value = table.get(key, [])
+    if not isinstance(value, list):
+        raise _error(path, where, f"'{key}' should be a list")
+    return value
+
+
+def _item(path, where, definitions, key):
+    """Make an Item from its key in [items], None for no item"""
+    if key is None:
+        return None
+    definition = definitions.get(key) if isinstance(key, str) else None
+    if definition is None:
+        raise _error(path, where, f"unknown item '{key}'")
+    return Item.from_definition(definition)
+
+
+def _character(path, where, definitions, table, cave):
+    role = table.get("role")
+    if role not in ROLES:
+        raise _error(path, where, f"'role' should be one of {', '.join(ROLES)}")
+    if role == ENEMY:
+        character = Enemy(_text(path, where, table, "name"), _text(path, where, table, "description"),
+                          _number(path, where, table, "health"), cave)
+    elif role == BOSS:
+        character = Boss(_text(path, where, table, "name"), _text(path, where, table, "description"), cave)
+    elif role == NINJA:
+        character = Ninja(cave)
+    else:
+        character = Friendly(_text(path, where, table, "name"), _text(path, where, table, "description"), cave)
+
+    if role != FRIENDLY:
+        weakness = _item(path, where, definitions, table.get("weakness"))
+        character.set_weakness(weakness.name if weakness is not None else None)
+        character.set_drop(_item(path, where, definitions, table.get("drop")))
+    character.set_conversation(_text(path, where, table, "conversation", required=False))
+    return character
+
+
+def read_pack(path, game=None):
+    """Parse a content pack into a MapGraph
+
+    Raises ValueError if the pack isn't valid TOML or doesn't describe a
+    world properly.
+    """
+    try:
+        with open(path, "rb") as file:
+            pack = tomllib.load(file)
+    except tomllib.TOMLDecodeError as error:
+        raise ValueError(f"'{path}' is not a valid content pack: {error}")
+
+    definitions = _items(path, pack)
+    caves = pack.get("caves", [])
+    if not isinstance(caves, list) or not all(isinstance(table, dict) for table in caves):
+        raise _error(path, "caves", "should be a list of caves ([[caves]])")
+
+    numbers = set()
+    for (i, table) in enumerate(caves):
+        number = _number(path, f"cave #{i + 1}", table, "number")
+        if number < 1:
+            raise _error(path, f"cave {number}", "cave numbers start at 1")
+        if number in numbers:
+            raise _error(path, f"cave {number}", "there's another cave with this number")
+        numbers.add(number)
+    if 1 not in numbers:
+        raise _error(path, "caves", "there's no cave 1, where the player starts")
+
+    size = max(numbers) + 1
+    world = MapGraph(game, size, "sparse" if size > SPARSE_SIZE else "matrix")
+    # links are added once every cave is there, so they can point forwards
+    links = []
+    for table in caves:
+        number = table["number"]
+        where = f"cave {number}"
+        description = _text(path, where, table, "description")
+        if table.get("shop", False):
+            cave = Shop(number, description, world)
+            for entry in _list(path, where, table, "stock"):
+                (key, count) = (entry, 1) if not isinstance(entry, dict) else \
+                    (entry.get("item"), _number(path, where, entry, "count", 1))
+                if key is None:
+                    raise _error(path, where, "stock tables need an 'item'")
+                cave.add_shop_item(_item(path, where, definitions, key), count)
+        else:
+            if "stock" in table:
+                raise _error(path, where, "only shops ('shop = true') can have stock")
+            cave = Cave(number, _text(path, where, table, "name"), description, world)
+
+        for (i, character) in enumerate(_list(path, where, table, "characters")):
+            if not isinstance(character, dict):
+                raise _error(path, where, "characters should be tables ([[caves.characters]])")
+            cave.add_character(_character(path, f"{where}, character #{i + 1}", definitions, character, cave))
+
+        linked = _list(path, where, table, "links")
+        for link in linked:
+            if link == number:
+                raise _error(path, where, "a cave can't link to itself")
+            if link not in numbers:
+                raise _error(path, where, f"linked to cave {link}, which doesn't exist")
+        links.append((cave, linked))
+        world.add_cave(cave, [])
+
+    for (cave, linked) in links:
+        world.add_cave(cave, linked)
+    return world
+
+
+def cache_path(path):
+    """Where the compiled map file for a pack goes, given what's in the pack now"""
+    with open(path, "rb") as file:
+        digest = hashlib.sha256(file.read())
+    # a new map file format means compiling again too
+    digest.update(str(mapfile.VERSION).encode())
+    (folder, name) = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, CACHE_DIR, f"{name}.{digest.hexdigest()[:16]}.map")
+
+
+def compile_pack(path):
+    """Compile a pack into a map file, unless it's been compiled since it last changed
+
+    Returns the map file's path, or None if it couldn't be written (e.g. the
+    pack is in a read-only folder).
+    """
+    compiled = cache_path(path)
+    if os.path.exists(compiled):
+        return compiled
+
+    world = read_pack(path)
+    try:
+        os.makedirs(os.path.dirname(compiled), exist_ok=True)
+        temporary = f"{compiled}.{os.getpid()}.tmp"
+        mapfile.save_map(world, temporary)
+        os.replace(temporary, compiled)
+    except OSError:
+        return None
+
+    # throw away what was compiled from older versions of the pack
+    pattern = os.path.join(glob.escape(os.path.dirname(compiled)),
+                           glob.escape(os.path.basename(path)) + ".*.map")
+    for old in glob.glob(pattern):
+        if old != compiled:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return compiled
+
+
+def load_pack(game, path):
+    """Load a content pack as a MapGraph, from its compiled map file if possible"""
+    compiled = compile_pack(path)
+    if compiled is None:
+        return read_pack(path, game)
+    return mapfile.load_map(game, compiled)
+
+
+def load_world(game, path):
+    """Load a world template: a content pack (.toml) or a map file written by mapfile.py"""
+    if path.endswith(".toml"):
+        return load_pack(game, path)
+    return mapfile.load_map(game, path)
+
+
+def _toml(value):
+    """Write a string, number, bool or list of them as TOML"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, list):
+        return "[" + ", ".join(_toml(element) for element in value) + "]"
+    if isinstance(value, dict):
+        return "{ " + ", ".join(f"{key} = {_toml(element)}" for (key, element) in value.items()) + " }"
+    # TOML basic strings use the same escapes as JSON
+    return json.dumps(value, ensure_ascii=False)
+
+
+def export_pack(world, path):
+    """Write a MapGraph out as a content pack"""
+    keys = {}  # (name, emoji, description, cost, damage) -> key in [items]
+    item_lines = []
+
+    def item_key(item):
+        if item is None:
+            return None
+        found = (item.name, item.emoji, item.description, item.cost, item.damage)
+        key = keys.get(found)
+        if key is None:
+            # keys are left unquoted, so keep to letters, digits and _
+            key = base = "".join(c if c.isascii() and c.isalnum() else "_" for c in item.name.lower()) or "item"
+            suffix = 2
+            while key in keys.values():
+                key = f"{base}_{suffix}"
+                suffix += 1
+            keys[found] = key
+            item_lines.extend([f"[items.{key}]", f"name = {_toml(item.name)}", f"emoji = {_toml(item.emoji)}",
+                               f"description = {_toml(item.description)}", f"cost = {item.cost}",
+                               f"damage = {item.damage}", ""])
+        return key
+
+    cave_lines = []
+    for num in range(world.size):
+        cave = world.get_cave(num)
+        if cave is None:
+            continue
+        cave_lines.extend(["[[caves]]", f"number = {num}"])
+        if isinstance(cave, Shop):
+            cave_lines.append("shop = true")
+        else:
+            cave_lines.append(f"name = {_toml(cave.name)}")
+        cave_lines.append(f"description = {_toml(cave.description)}")
+        # each link once, on the lower numbered cave
+        cave_lines.append(f"links = {_toml([link for link in world.links.neighbours(num) if link > num])}")
+        if isinstance(cave, Shop):
+            stock = []
+            for item in cave.for_sale:
+                count = cave.for_sale.count(item)
+                stock.append(item_key(item) if count == 1 else {"item": item_key(item), "count": count})
+            cave_lines.append(f"stock = {_toml(stock)}")
+        cave_lines.append("")
+
+        for character in cave.characters:
+            cave_lines.extend(["[[caves.characters]]", f"role = {_toml(character.role)}"])
+            if character.role != NINJA:
+                cave_lines.extend([f"name = {_toml(character.name)}",
+                                   f"description = {_toml(character.description)}"])
+            if character.role == ENEMY:
+                cave_lines.append(f"health = {character.total_health}")
+            if character.role != FRIENDLY:
+                if character.weakness_item_name is not None:
+                    weakness = CATALOG.get(character.weakness_item_name)
+                    if weakness is None:
+                        raise ValueError(f"Can't export the weakness of '{character.name}', "
+                                         f"there's no item called '{character.weakness_item_name}'")
+                    cave_lines.append(f"weakness = {_toml(item_key(Item.from_definition(weakness)))}")
+                if character.drop is not None:
+                    cave_lines.append(f"drop = {_toml(item_key(character.drop))}")
+            if character.conversation is not None:
+                cave_lines.append(f"conversation = {_toml(character.conversation)}")
+            cave_lines.append("")
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(item_lines + cave_lines))
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Compile or write content packs")
+    commands = parser.add_subparsers(dest="action", required=True)
+    compile_parser = commands.add_parser("compile", help="check a pack and compile it into its cached map file")
+    compile_parser.add_argument("path")
+    export_parser = commands.add_parser("export", help="write a world out as a pack, to start a new one from")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--size", type=int, default=None,
+                               help="write a procedural map with this many caves (default: the built-in map)")
+    export_parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.action == "compile":
+        compiled = compile_pack(args.path)
+        if compiled is None:
+            read_pack(args.path)
+            print(f"'{args.path}' is valid, but its compiled map file couldn't be written")
+        else:
+            print(f"Compiled to {compiled} in {time.perf_counter() - started:.3f}s")
+        return
+
+    if args.size is None:
+        world = MapGraph.generate(None)
+    else:
+        from generator import ProceduralGenerator
+        world = ProceduralGenerator(args.size, seed=args.seed).generate(None)
+    export_pack(world, args.path)
+    print(f"Wrote {args.path} in {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
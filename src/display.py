@@ -1,8 +1,19 @@
 # Helper functions for handling the terminal UI
 
+import width
+import output
+
+# stdlib
 import sys
-import os
-import re
+
+# the Screen everything is drawn on in "diff" mode, None in "plain" mode
+renderer = None
+# the lineedit.LineEditor reading the player's input, None if input is read normally
+editor = None
+# whether input is a script rather than a player, see start_batch
+batch = False
+# in batch mode, how much output is held back before it's written out
+BATCH_OUTPUT = 64 * 1024
 
 
 def prompt(message: str, level: int, return_type: str, guard):
@@ -27,7 +38,7 @@ def prompt(message: str, level: int, return_type: str, guard):
     print(f"{message} · Accepts {bold(type_human_name[return_type])}")
     while True:
         input_msg = bold(f"{level * '>'}> ")
-        response = input(input_msg)
+        response = ask(input_msg)
 
         # check guard unless the type needs to be converted
         if guard is not None and return_type != "int":
@@ -60,8 +71,10 @@ def prompt(message: str, level: int, return_type: str, guard):
 def confirm(message: str):
     """Prompt the user with a Y/N confirmation"""
     print(f"{message} [y/N] and then press Enter?")
+    sys.stdout.flush()  # reading stdin directly doesn't flush like input() does
     try:
-        response = sys.stdin.readline().lower()
+        # batch mode echoes the answer, like every other prompt's
+        response = (ask() if batch else sys.stdin.readline()).lower()
 
         if response.startswith('y'):
             return True
@@ -72,18 +85,48 @@ def confirm(message: str):
         return False
 
 
+def ask(prompt: str = ""):
+    """Read a line typed in answer to a prompt, like input()
+
+    In batch mode the prompt and the answer are both printed, so the output
+    reads like a transcript. Raises EOFError if there's no more input.
+    """
+    if not batch:
+        return input(prompt)
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError
+    line = line.removesuffix("\n")
+    print(f"{prompt}{line}")
+    return line
+
+
+def pause(message: str = "> Press Enter to Continue <"):
+    """Wait for the player to press Enter. Skipped in batch mode"""
+    if batch:
+        return
+    print(message)
+    input()
+
+
 def bold(msg: str):
     """Makes the passed text bold in the terminal by adding ANSI codes"""
+    if batch:
+        return f"{msg}"
     return f"\x1B[1m{msg}\x1B[22m"
 
 
 def dim(msg: str):
     """Makes the passed text dimmer in the terminal by adding ANSI codes"""
+    if batch:
+        return f"{msg}"
     return f"\x1B[2m{msg}\x1B[22m"
 
 
 def underline(msg: str):
     """Makes the passed text underlined in the terminal by adding ANSI codes"""
+    if batch:
+        return f"{msg}"
     return f"\x1B[4m{msg}\x1B[24m"
 
 
@@ -93,50 +136,125 @@ def print_hint(hint: str):
 
 
 def clear():
-    """Clears the terminal"""
-    print("\033[H\033[J", end="")
+    """Clears the terminal
 
+    In "diff" mode this starts a new frame instead, see set_renderer
+    """
+    if batch:
+        return
+    if renderer is not None:
+        renderer.begin_frame()
+        return
+    print("\033[H\033[J", end="")
 
-def colour(code: int, msg: str):
-    """Makes the passed text coloured using ANSI 256-colour codes"""
-    return f"\x1B[38;5;{code}m{msg}\x1B[39m"
 
+def set_renderer(mode: str):
+    """Choose how the screen is redrawn. Valid modes are:
+        - plain: clear the terminal and print everything again (the default)
+        - diff: only send the rows that changed since the last frame (see screen.py)
 
-def set_raw(stdin):
-    """Set the TTY mode to raw for *nix-based systems. No effect on Windows"""
-    if os.name == "nt":  # windows
-        import msvcrt
-    else:  # *nix
-        import tty
-        import termios
-        normal_tty = termios.tcgetattr(stdin)
-        tty.setraw(stdin)
-        return normal_tty
+    Either way output is held back until the game waits for input, then sent
+    in one write (see output.py). Replaces sys.stdout, and sys.stdin in diff
+    mode, so call it before creating a Game.
+    """
+    global renderer
+    sys.stdout.flush()
+    # the streams underneath, if set_renderer was already called
+    stdout = sys.stdout.stream if isinstance(sys.stdout, output.Output) or renderer is not None else sys.stdout
+    stdin = sys.stdin.stream if renderer is not None else sys.stdin
+    match mode:
+        case "plain":
+            sys.stdout = output.Output(stdout)
+            sys.stdin = stdin
+            renderer = None
+        case "diff":
+            import screen
+            renderer = screen.Screen(stdout)
+            sys.stdout = renderer
+            sys.stdin = screen.ScreenInput(renderer, stdin)
+        case _:
+            raise ValueError(f"Unknown renderer mode '{mode}'")
+    return renderer
+
+
+def start_batch():
+    """Run with input from a script (a pipe or file) rather than a player
+
+    Commands and answers are read a line at a time, nothing waits for
+    Enter, the screen isn't cleared and there's no colour or styling. Output
+    is written out in large blocks rather than before every prompt. Call
+    after set_renderer("plain"), and stop_batch when done.
+    """
+    global batch
+    batch = True
+    if isinstance(sys.stdout, output.Output):
+        sys.stdout.hold = BATCH_OUTPUT
 
 
-def set_cooked(stdin, normal_tty):
-    """Set the TTY mode back to cooked. Has no effect on Windows"""
-    if os.name == "nt":  # windows
-        import msvcrt
-    else:  # *nix
-        import tty
-        import termios
-        termios.tcsetattr(
-            stdin, termios.TCSADRAIN, normal_tty)
+def stop_batch():
+    """Write out any output start_batch held back"""
+    global batch
+    batch = False
+    if isinstance(sys.stdout, output.Output):
+        sys.stdout.hold = 0
+    sys.stdout.flush()
 
 
-def read_raw_char(stdin):
-    """Read a single raw character from the tty.
+def start_line_editor():
+    """Read all input through a line editor (see lineedit.py), with the terminal in
+    cbreak mode until stop_line_editor is called
 
-    Must be a raw tty if used on *nix systems
+    Does nothing if stdin isn't a terminal. Call after set_renderer, it replaces sys.stdin.
+    """
+    global editor
+    # the diff renderer's ScreenInput isn't needed, the editor's echo is printed through the Screen
+    stdin = sys.stdin.stream if renderer is not None else sys.stdin
+    if editor is not None or not stdin.isatty():
+        return
+    import lineedit
+    editor = lineedit.LineEditor(stdin)
+    editor.start()
+    sys.stdin = lineedit.EditorInput(editor)
+
+
+def stop_line_editor():
+    """Put the terminal back to normal after start_line_editor"""
+    global editor
+    if editor is None:
+        return
+    editor.stop()
+    sys.stdin = editor.keys.stream
+    if renderer is not None:
+        import screen
+        sys.stdin = screen.ScreenInput(renderer, sys.stdin)
+    editor = None
+
+
+def read_line(prompt: str, placeholder="", completer=None):
+    """Read a command from the player, or None if there's no more input
+
+    With the line editor running, up/down go through earlier commands and Tab
+    calls completer (see lineedit.LineEditor.read_line). The placeholder is
+    shown while nothing has been typed.
     """
+    if editor is not None:
+        return editor.read_line(prompt, placeholder, completer, history=True)
+    try:
+        return ask(prompt)
+    except EOFError:
+        return None
+
 
-    if os.name == "nt":
-        import msvcrt
-        char = msvcrt.getwch()
-        return str(char)
-    else:
-        return stdin.read(1)
+def output_stats():
+    """The output.Stats for what's been printed since set_renderer, or None if it wasn't called"""
+    return getattr(sys.stdout, "stats", None)
+
+
+def colour(code: int, msg: str):
+    """Makes the passed text coloured using ANSI 256-colour codes"""
+    if batch:
+        return f"{msg}"
+    return f"\x1B[38;5;{code}m{msg}\x1B[39m"
 
 
 def alert_box(msg: str):
@@ -148,8 +266,7 @@ def alert_box(msg: str):
     print(f"{colour(1, '║')} {msg} {colour(1, '║')}")  # msg row
     print(colour(1, f"╚{'═' * internal_len}╝"))  # bottom row
     print("")  # empty line
-    print("> Press Enter to Continue <")
-    input()  # wait for enter key
+    pause()
     clear()
 
 
@@ -157,15 +274,15 @@ def multiline_alert_box(msgs: list[str], colour_code=1):  # colour_code is 1
     """A multi-line console-based alert box. Each line should be its own item in the list"""
     clear()
     # 2 spaces padding, find longest line
-    internal_len = 2 + visual_len(max(msgs, key=visual_len))
+    line_lens = width.widths(msgs)
+    internal_len = 2 + max(line_lens)
     print(colour(colour_code, f"╔{'═' * internal_len}╗"))  # top row
-    for line in msgs:
+    for (line, line_len) in zip(msgs, line_lens):
         #                                                to account for padding space _______
-        print(f"{colour(colour_code, '║')} {line}{' ' * (internal_len - visual_len(line) - 1)}{colour(colour_code, '║')}")
+        print(f"{colour(colour_code, '║')} {line}{' ' * (internal_len - line_len - 1)}{colour(colour_code, '║')}")
     print(colour(colour_code, f"╚{'═' * internal_len}╝"))  # bottom row
     print("")  # empty line
-    print("> Press Enter to Continue <")
-    input()  # wait for enter key
+    pause()
     clear()
 
 
@@ -182,17 +299,16 @@ def speech_box(msg: str, speaker: str, colour_code=1):  # colour_code 1 is red
     print(f"{colour(colour_code, '║')}{' ' * speaker_padding}— {speaker} {colour(colour_code, '║')}")
     print(colour(colour_code, f"╚{'═' * internal_len}╝"))  # bottom row
     print("")  # empty line
-    print("> Press Enter to Continue <")
-    input()  # wait for enter key
+    pause()
     clear()
 
 
 def visual_len(test: str) -> int:
-    """Get the visual (column) length of a string by excluding ANSI control characters"""
-    # Finding ANSI control characters
-    regex = re.compile(
-        "[\\u001B\\u009B][[\\]()#;?]*(?:(?:(?:(?:;[-a-zA-Z\\d\\/#&.:=?%@~_]+)*|[a-zA-Z\\d]+(?:;[-a-zA-Z\\d\\/#&.:=?%@~_]*)*)?(?:\\u0007|\\u001B\\u005C|\\u009C))|(?:(?:\\d{1,4}(?:;\\d{0,4})*)?[\\dA-PR-TZcf-nq-uy=><~]))")
-    return len(regex.sub("", test))
+    """Get the visual (column) length of a string, excluding ANSI control characters
+
+    Wide characters and emoji count as two columns. See width.py
+    """
+    return width.text_width(test)
 
 
 def print_healthbar(name: str, health: int, max_health: int):
@@ -0,0 +1,201 @@
+# Precomputed distances between caves, for route finding
+
+from array import array
+from collections import OrderedDict
+
+
+UNREACHABLE = -1
+
+
+def _nearer(a, b):
+    """Return the smaller of two distances, ignoring unreachable ones"""
+    if a == UNREACHABLE or (b != UNREACHABLE and b < a):
+        return b
+    return a
+
+
+class DistanceIndex:
+    """Answers "how far is cave B from cave A" and "which way to cave B"
+
+    Small maps (up to `exact_limit` caves) get an exact distance table: a BFS
+    from every cave, done once per connected component, so both questions
+    are answered with a lookup.
+
+    Large maps would need size * size memory for that, so instead a handful
+    of landmark caves are picked and a BFS is done from each of them. The
+    distance between two caves is then estimated through the best landmark
+    (never an underestimate). Routing on large maps is exact: the first time
+    a cave is used as a destination, a BFS from it is done and kept in a
+    small cache, so every step after that is a lookup. Bots heading to the
+    same place share the cached BFS.
+
+    The index is a snapshot, it must be rebuilt if the map's links change.
+    MapGraph.get_distances takes care of this.
+    """
+
+    def __init__(self, map, exact_limit=1024, landmarks=16, cache_size=64):
+        self.size = map.size
+        # neighbour lists for every cave, looked up many times in each BFS
+        self.adjacency = map.links.adjacency_lists()
+        self.cache_size = cache_size
+
+        # component[n] is an ID shared by all caves reachable from n
+        self.component = array("i", [UNREACHABLE]) * self.size
+        self.exact = None  # exact[a][b], small maps only
+        self.landmarks = []  # list of (cave number, distances from it)
+        self.trees = OrderedDict()  # destination -> distances to it, LRU
+
+        if self.size <= exact_limit:
+            self.exact = [None] * self.size
+            for cave in range(self.size):
+                if self.component[cave] == UNREACHABLE:
+                    self.__label_component(cave, cave)
+                # one BFS per cave, which only visits its own component
+                self.exact[cave] = self.__bfs(cave)
+        else:
+            self.__pick_landmarks(landmarks)
+
+    def __bfs(self, source):
+        """Return an array of distances from `source` to every cave"""
+        dist = array("i", [UNREACHABLE]) * self.size
+        dist[source] = 0
+        adjacency = self.adjacency
+        # walk out one layer of caves at a time
+        layer = [source]
+        next_dist = 0
+        while layer:
+            next_dist += 1
+            next_layer = []
+            for cave in layer:
+                for linked in adjacency[cave]:
+                    if dist[linked] == UNREACHABLE:
+                        dist[linked] = next_dist
+                        next_layer.append(linked)
+            layer = next_layer
+        return dist
+
+    def __label_component(self, source, component_id):
+        """Mark every cave reachable from `source` with `component_id`"""
+        component = self.component
+        component[source] = component_id
+        stack = [source]
+        while stack:
+            cave = stack.pop()
+            for linked in self.adjacency[cave]:
+                if component[linked] == UNREACHABLE:
+                    component[linked] = component_id
+                    stack.append(linked)
+
+    def __pick_landmarks(self, count):
+        """Pick landmarks far apart from each other in each component
+
+        Each new landmark is the cave furthest from all the landmarks picked
+        so far, which spreads them out over the map.
+        """
+        for cave in range(self.size):
+            if self.component[cave] == UNREACHABLE:
+                self.__label_component(cave, cave)
+
+        # closest[n] is the distance from n to its nearest landmark so far
+        closest = None
+        # start every component off with its first cave as a landmark
+        # (caves with no links at all are skipped, they can't be travelled to)
+        candidates = [cave for cave in range(self.size)
+                      if self.component[cave] == cave and self.adjacency[cave]]
+        while candidates and len(self.landmarks) < count:
+            for landmark in candidates:
+                dist = self.__bfs(landmark)
+                self.landmarks.append((landmark, dist))
+                if closest is None:
+                    closest = array("i", dist)
+                else:
+                    closest = array("i", map(_nearer, closest, dist))
+
+            # next landmark is the furthest cave from any existing landmark
+            furthest = max(range(self.size), key=closest.__getitem__)
+            candidates = [furthest] if closest[furthest] > 0 else []
+
+    def __tree(self, destination):
+        """Get the distances to `destination` from every cave, from the cache if possible"""
+        tree = self.trees.get(destination)
+        if tree is not None:
+            self.trees.move_to_end(destination)
+            return tree
+
+        tree = self.__bfs(destination)
+        self.trees[destination] = tree
+        if len(self.trees) > self.cache_size:
+            self.trees.popitem(last=False)  # drop least recently used
+        return tree
+
+    def __valid(self, num):
+        return 0 <= num < self.size
+
+    def reachable(self, a, b):
+        """Whether there is any route from cave number `a` to `b`"""
+        if not (self.__valid(a) and self.__valid(b)):
+            return False
+        return self.component[a] == self.component[b]
+
+    def distance(self, a, b):
+        """Return the number of moves from cave number `a` to `b`
+
+        Returns None if there's no route. On large maps this is an estimate
+        (never shorter than the real distance) unless a route to either cave
+        has already been worked out.
+        """
+        if a == b:
+            # even a cave with no links (which has no component) is 0 moves from itself
+            return 0 if self.__valid(a) else None
+        if not self.reachable(a, b):
+            return None
+
+        if self.exact is not None:
+            return self.exact[a][b]
+
+        # the map is undirected, so a tree to either end will do
+        for (source, target) in ((b, a), (a, b)):
+            tree = self.trees.get(source)
+            if tree is not None:
+                return tree[target]
+
+        best = None
+        for (_, dist) in self.landmarks:
+            if dist[a] != UNREACHABLE and dist[b] != UNREACHABLE:
+                through = dist[a] + dist[b]
+                if best is None or through < best:
+                    best = through
+        return best
+
+    def next_hop(self, a, b):
+        """Return the number of the cave to move to from `a` to get closer to `b`
+
+        Returns None if `a` is `b` or there's no route.
+        """
+        if a == b or not self.reachable(a, b):
+            return None
+
+        if self.exact is not None:
+            # distances are symmetric, so row b holds the distances to b
+            dist = self.exact[b]
+        else:
+            dist = self.__tree(b)
+
+        for linked in self.adjacency[a]:
+            if dist[linked] == dist[a] - 1:
+                return linked
+
+    def route(self, a, b):
+        """Return the list of cave numbers to move through to get from `a` to `b`
+
+        The list ends with `b` and does not include `a`. Returns None if
+        there's no route.
+        """
+        if not self.reachable(a, b):
+            return None
+
+        route = []
+        while a != b:
+            a = self.next_hop(a, b)
+            route.append(a)
+        return route
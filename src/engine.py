@@ -0,0 +1,290 @@
+from map import MapGraph
+from character import FRIENDLY, BOSS, NINJA
+from cave import Shop
+from inventory import Inventory
+import events
+import parsing
+
+# stdlib
+import math
+import random
+
+
+class Engine:
+    """The rules of the game, with no terminal input or output
+
+    Each command method carries out one player action and returns a list of
+    events describing what happened (see events.py). Nothing is printed and
+    nothing waits for input, so front ends decide how to show the events and
+    many engines can run side by side in one process.
+
+    Commands can also be given as text with the execute method, e.g.
+    "fight 1 2" fights the first character in the cave with the second item
+    in the inventory, numbered as they would be in the game's menus.
+    """
+
+    # coins for defeating an enemy are round(sqrt(reward_factor * health))
+    reward_factor = 20
+
+    def __init__(self, build_map=MapGraph.generate, seed=None):
+        # all the randomness in a game comes from here, so the same seed
+        # plays out the same way
+        self.rng = random.Random(seed)
+
+        self.alive = True
+        self.won = False  # whether the boss has been defeated
+        self.map = build_map(self)
+        self.map.rng = self.rng
+        # initially the player begins in the starting cave
+        self.current_cave = self.map.get_cave(1)
+
+        self.purse = 20  # the player's coins
+        self.items = Inventory()
+        self.unclaimed_drop = None  # the boss's drop, until claim_drop
+        # numbers of the caves whose characters or stock have changed since
+        # the world was built, so a save only needs those (see savegame.py)
+        self.touched = set()
+
+    def reward(self, total_health):
+        """Coins given for defeating an enemy with this much health
+
+        Increases at a decreasing rate
+        """
+        return round(math.sqrt(self.reward_factor * total_health))
+
+    def has_item(self, name):
+        """Whether the player has an item with this name"""
+        return self.items.has(name)
+
+    # ---
+    # Movement
+    # ---
+
+    def set_cave(self, cave_num):
+        """Put the player in a cave by number, regardless of links"""
+        if not self.alive:
+            return [events.Rejected(events.DEAD)]
+
+        if cave_num == self.current_cave.num:
+            return []  # don't change caves if they are in the same cave already
+
+        # EASTER EGG
+        if cave_num == 10 and self.has_item("Obsidian Key"):
+            return [events.SecretUnlocked(self.map.get_cave(cave_num))]
+
+        from_cave = self.current_cave
+        self.current_cave = self.map.get_cave(cave_num)
+        return [events.Moved(from_cave, self.current_cave)]
+
+    def move(self, cave_num):
+        """Go to a cave linked to the one the player is in"""
+        if cave_num == self.current_cave.num:
+            return [events.Rejected(events.SAME_CAVE, cave_num)]
+
+        # Check cave accessibility
+        if not self.map.check_link(self.current_cave.num, cave_num):
+            return [events.Rejected(events.NO_LINK, cave_num)]
+
+        return self.set_cave(cave_num)
+
+    def travel(self, cave_num):
+        """Walk to any reachable cave, one linked cave at a time"""
+        if cave_num < 0 or self.map.get_cave(cave_num) is None:
+            return [events.Rejected(events.INVALID_CAVE, cave_num)]
+
+        if cave_num == self.current_cave.num:
+            return [events.Rejected(events.SAME_CAVE, cave_num)]
+
+        distances = self.map.get_distances()
+        if not distances.reachable(self.current_cave.num, cave_num):
+            return [events.Rejected(events.NO_ROUTE, cave_num)]
+
+        # walk one cave at a time, so anything that happens on entering a
+        # cave still happens on the way
+        happened = []
+        while self.current_cave.num != cave_num:
+            step = self.set_cave(distances.next_hop(self.current_cave.num, cave_num))
+            happened.extend(step)
+            if not any(isinstance(event, events.Moved) for event in step):
+                break  # something stopped the journey
+        return happened
+
+    # ---
+    # Fighting
+    # ---
+
+    def fight_blocked(self, character=None):
+        """Return a Rejected event if a fight can't happen, otherwise None
+
+        Pass a character to also check that they can be fought.
+        """
+        if not self.alive:
+            return events.Rejected(events.DEAD)
+        if not len(self.current_cave.characters):
+            return events.Rejected(events.NO_CHARACTERS)
+        if not len(self.items):
+            return events.Rejected(events.NO_ITEMS)
+        if character is not None:
+            if character not in self.current_cave.characters:
+                return events.Rejected(events.INVALID_CHARACTER, character)
+            # do not permit players to fight friendly characters
+            if character.role == FRIENDLY:
+                return events.Rejected(events.FRIENDLY, character)
+        return None
+
+    def fight(self, character, item):
+        """Fight a character in the current cave with one of the player's items"""
+        blocked = self.fight_blocked(character)
+        if blocked is not None:
+            return [blocked]
+        if item not in self.items:
+            return [events.Rejected(events.INVALID_ITEM, item)]
+
+        # Boss battle
+        if character.role == BOSS:
+            if not character.fight(item):
+                self.alive = False
+                return [events.PlayerDied(character, item)]
+            self.won = True
+            self.unclaimed_drop = character.get_drop()
+            return [events.BossDefeated(character, item)]
+
+        # Ninja battles
+        if character.role == NINJA:
+            from_cave = self.current_cave
+            random_cave = character.fight(item)
+            # send player to random cave. the teleport covers the move itself,
+            # but anything else about arriving (e.g. the secret cave) still happens
+            arrived = self.set_cave(random_cave.num)
+            return [events.Teleported(character, item, from_cave, self.current_cave)] + \
+                [event for event in arrived if not isinstance(event, events.Moved)]
+
+        # Regular battles
+        if item.get_damage() == 0:
+            return [events.ItemIneffective(character, item)]
+
+        health_before = character.get_health()
+        won_fight = character.fight(item)
+        self.touched.add(self.current_cave.num)
+        damage = min(item.damage, character.get_total_health())
+        happened = [events.EnemyDamaged(character, item, damage, health_before, won_fight)]
+        if won_fight:
+            # give player currency proportional to enemy health
+            given = self.reward(character.get_total_health())
+            self.purse += given
+            # remove character from cave
+            self.current_cave.remove_character(character)
+            happened.append(events.EnemyDefeated(character, item, given, self.purse))
+        return happened
+
+    def claim_drop(self):
+        """After defeating the boss, take its drop and carry on exploring"""
+        if self.unclaimed_drop is None:
+            return [events.Rejected(events.NOTHING_TO_CLAIM)]
+        item = self.unclaimed_drop
+        self.unclaimed_drop = None
+        self.items.add(item)
+        return [events.ItemReceived(item)]
+
+    # ---
+    # Talking and shopping
+    # ---
+
+    def talk_blocked(self):
+        """Return a Rejected event if there's no one to talk to, otherwise None"""
+        if not len(self.current_cave.characters):
+            return events.Rejected(events.NO_CHARACTERS)
+        return None
+
+    def talk(self, character):
+        """Talk to a character in the current cave"""
+        blocked = self.talk_blocked()
+        if blocked is not None:
+            return [blocked]
+        if character not in self.current_cave.characters:
+            return [events.Rejected(events.INVALID_CHARACTER, character)]
+        if character.conversation is None:
+            return [events.Rejected(events.SILENT, character)]
+        return [events.Talked(character, character.conversation)]
+
+    def shop_blocked(self):
+        """Return a Rejected event if there's nothing to buy here, otherwise None"""
+        if not isinstance(self.current_cave, Shop):
+            return events.Rejected(events.NOT_A_SHOP)
+        if not len(self.current_cave.for_sale):  # out of stock! (no items for sale)
+            return events.Rejected(events.OUT_OF_STOCK)
+        return None
+
+    def buy(self, item):
+        """Buy an item from the shop in the current cave"""
+        blocked = self.shop_blocked()
+        if blocked is not None:
+            return [blocked]
+        if item not in self.current_cave.for_sale:
+            return [events.Rejected(events.INVALID_ITEM, item)]
+        if item.cost > self.purse:
+            return [events.Rejected(events.CANNOT_AFFORD, item)]
+
+        # remove from shop items, add to player's items
+        item = self.current_cave.remove_shop_item(item)
+        self.items.add(item)
+        self.touched.add(self.current_cave.num)
+        self.purse -= item.cost
+        return [events.ItemBought(item, self.current_cave, self.purse)]
+
+    # ---
+    # Text commands
+    # ---
+
+    def execute(self, line):
+        """Carry out a text command and return the events
+
+        Accepts:
+            move <cave>, travel <cave>, fight <character> <item>,
+            talk <character>, buy <item>, continue
+        where characters and items are numbered from 1 as in the menus.
+        """
+        if not line.split():
+            return [events.Rejected(events.UNKNOWN_COMMAND, line)]
+        command, *args = line.split()
+        numbers = [parsing.parse_int(arg) for arg in args]
+        for (arg, number) in zip(args, numbers):
+            if number is None:
+                return [events.Rejected(events.BAD_ARGUMENT, arg)]
+
+        match (command, numbers):
+            case ("move", [cave_num]):
+                return self.move(cave_num)
+            case ("travel", [cave_num]):
+                return self.travel(cave_num)
+            case ("fight", [character_num, item_num]):
+                character = self.__pick(self.current_cave.characters, character_num)
+                if character is None:
+                    return [self.fight_blocked() or events.Rejected(events.INVALID_CHARACTER, character_num)]
+                item = self.__pick(self.items.kinds(), item_num)
+                if item is None:
+                    return [self.fight_blocked(character) or events.Rejected(events.INVALID_ITEM, item_num)]
+                return self.fight(character, item)
+            case ("talk", [character_num]):
+                character = self.__pick(self.current_cave.characters, character_num)
+                if character is None:
+                    return [self.talk_blocked() or events.Rejected(events.INVALID_CHARACTER, character_num)]
+                return self.talk(character)
+            case ("buy", [item_num]):
+                blocked = self.shop_blocked()
+                if blocked is not None:
+                    return [blocked]
+                item = self.__pick(self.current_cave.for_sale, item_num)
+                if item is None:
+                    return [events.Rejected(events.INVALID_ITEM, item_num)]
+                return self.buy(item)
+            case ("continue", []):
+                return self.claim_drop()
+            case _:
+                return [events.Rejected(events.UNKNOWN_COMMAND, line)]
+
+    def __pick(self, options, number):
+        """Get an option by its number in a menu (from 1), or None if out of range"""
+        if 1 <= number <= len(options):
+            return options[number - 1]
+        return None
@@ -0,0 +1,214 @@
+# Events reported by the game engine
+#
+# Every engine command returns a list of these describing what happened,
+# which a front end (the terminal UI, a server, a bot...) can then show or
+# act on however it likes. Front ends can also pass them on through an
+# EventBus, so other parts of the game (saving, profiling...) can react to
+# each command's events without the front end knowing about them.
+
+
+class Event:
+    """Something that happened in the game as the result of a command"""
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Rejected(Event):
+    """A command couldn't be carried out
+
+    `reason` is one of the reason strings below, `subject` is whatever the
+    reason is about (a cave number, a character, an item...), if anything.
+    """
+    __slots__ = ("reason", "subject")
+
+    def __init__(self, reason, subject=None):
+        self.reason = reason
+        self.subject = subject
+
+
+# reasons a command can be rejected
+UNKNOWN_COMMAND = "unknown_command"
+BAD_ARGUMENT = "bad_argument"  # subject: the argument
+DEAD = "dead"
+SAME_CAVE = "same_cave"  # subject: cave number
+NO_LINK = "no_link"  # subject: cave number
+INVALID_CAVE = "invalid_cave"  # subject: cave number
+NO_ROUTE = "no_route"  # subject: cave number
+NO_CHARACTERS = "no_characters"
+NO_ITEMS = "no_items"
+INVALID_CHARACTER = "invalid_character"  # subject: character number
+INVALID_ITEM = "invalid_item"  # subject: item number
+FRIENDLY = "friendly"  # subject: character
+SILENT = "silent"  # subject: character
+NOT_A_SHOP = "not_a_shop"
+OUT_OF_STOCK = "out_of_stock"
+CANNOT_AFFORD = "cannot_afford"  # subject: item
+NOTHING_TO_CLAIM = "nothing_to_claim"
+
+
+class Moved(Event):
+    """The player moved from one cave to another"""
+    __slots__ = ("from_cave", "to_cave")
+
+    def __init__(self, from_cave, to_cave):
+        self.from_cave = from_cave
+        self.to_cave = to_cave
+
+
+class SecretUnlocked(Event):
+    """The player tried to enter the secret cave with the key"""
+    __slots__ = ("cave",)
+
+    def __init__(self, cave):
+        self.cave = cave
+
+
+class Talked(Event):
+    """A character said their voice line"""
+    __slots__ = ("character", "conversation")
+
+    def __init__(self, character, conversation):
+        self.character = character
+        self.conversation = conversation
+
+
+class ItemIneffective(Event):
+    """The player fought an enemy with an item that does no damage"""
+    __slots__ = ("enemy", "item")
+
+    def __init__(self, enemy, item):
+        self.enemy = enemy
+        self.item = item
+
+
+class EnemyDamaged(Event):
+    """The player hit an enemy with an item"""
+    __slots__ = ("enemy", "item", "damage", "health_before", "defeated")
+
+    def __init__(self, enemy, item, damage, health_before, defeated):
+        self.enemy = enemy
+        self.item = item
+        self.damage = damage
+        self.health_before = health_before
+        self.defeated = defeated  # an EnemyDefeated event follows if True
+
+
+class EnemyDefeated(Event):
+    """An enemy was defeated and removed from its cave"""
+    __slots__ = ("enemy", "item", "reward", "purse")
+
+    def __init__(self, enemy, item, reward, purse):
+        self.enemy = enemy
+        self.item = item
+        self.reward = reward  # coins given to the player
+        self.purse = purse  # the player's coins afterwards
+
+
+class Teleported(Event):
+    """A ninja sent the player to a random cave"""
+    __slots__ = ("ninja", "item", "from_cave", "to_cave")
+
+    def __init__(self, ninja, item, from_cave, to_cave):
+        self.ninja = ninja
+        self.item = item
+        self.from_cave = from_cave
+        self.to_cave = to_cave
+
+
+class BossDefeated(Event):
+    """The player defeated the boss and won the game
+
+    The game can carry on afterwards, see Engine.claim_drop
+    """
+    __slots__ = ("boss", "item")
+
+    def __init__(self, boss, item):
+        self.boss = boss
+        self.item = item
+
+
+class PlayerDied(Event):
+    """The player was killed, the game is over"""
+    __slots__ = ("enemy", "item")
+
+    def __init__(self, enemy, item):
+        self.enemy = enemy
+        self.item = item
+
+
+class ItemBought(Event):
+    """The player bought an item from a shop"""
+    __slots__ = ("item", "shop", "purse")
+
+    def __init__(self, item, shop, purse):
+        self.item = item
+        self.shop = shop
+        self.purse = purse  # the player's coins afterwards
+
+
+class ItemReceived(Event):
+    """The player was given an item, e.g. the boss's drop"""
+    __slots__ = ("item",)
+
+    def __init__(self, item):
+        self.item = item
+
+
+class Refreshed(Event):
+    """The player asked for the screen to be drawn again
+
+    Published by front ends rather than the engine, nothing in the game changes.
+    """
+    __slots__ = ()
+
+
+# events after which the game needs saving again
+CHANGES_STATE = (Moved, EnemyDamaged, EnemyDefeated, Teleported, BossDefeated, PlayerDied, ItemBought,
+                 ItemReceived)
+
+
+class EventBus:
+    """Hands events to subscribers, a command's worth at a time
+
+    Events are published as they happen, then dispatched once the command is
+    done: each subscriber is called once with the list of that command's
+    events it subscribed to, in the order they happened, or not at all if
+    there weren't any. So something that redraws or saves does it once per
+    command, and only after commands that matter to it.
+    """
+    __slots__ = ("subscribers", "pending")
+
+    def __init__(self):
+        self.subscribers = []  # (handler, event types)
+        self.pending = []  # published since the last dispatch
+
+    def subscribe(self, handler, *types):
+        """Call handler(events) after each command with its events of these types
+
+        Subscribes to every event if no types are given.
+        """
+        self.subscribers.append((handler, types or (Event,)))
+        return handler
+
+    def unsubscribe(self, handler):
+        self.subscribers = [(subscribed, types) for (subscribed, types) in self.subscribers
+                            if subscribed != handler]
+
+    def publish(self, happened):
+        """Queue a list of events for the next dispatch"""
+        self.pending.extend(happened)
+
+    def dispatch(self):
+        """Hand everything published since the last dispatch to the subscribers"""
+        if not self.pending:
+            return
+        happened = self.pending
+        self.pending = []
+        # a handler may subscribe or unsubscribe others
+        for (handler, types) in list(self.subscribers):
+            selected = [event for event in happened if isinstance(event, types)]
+            if selected:
+                handler(selected)
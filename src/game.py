@@ -1,35 +1,50 @@
-from map import MapGraph
-from item import Item
-from character import Enemy, Friendly, Boss, Ninja
-from cave import Cave, Shop
+from engine import Engine
+from character import BOSS
+from cave import Shop
 import display
+import events
 import parsing
 
 # stdlib
 import cmd
-import sys
-import math
+from collections import OrderedDict
+
+# events after which the status message is printed again, because they
+# cleared the screen or changed what it shows
+REDRAW_ON = (events.Moved, events.SecretUnlocked, events.Talked, events.EnemyDamaged, events.EnemyDefeated,
+             events.Teleported, events.ItemReceived, events.Refreshed)
 
 
 class Game(cmd.Cmd):
+    """The terminal UI for the game
+
+    The rules of the game live in the Engine. This reads commands and menu
+    choices from the player, passes them on to the engine and shows the
+    events that come back. The events are also published on `bus`, and
+    dispatched to its subscribers (e.g. autosaving) after each command.
+    """
+
     prompt = "> "
     ruler = "-"
+    status_cache_size = 256  # caves whose status messages are kept
+    shop_page_size = 10  # items shown at a time in the shop menu
+    journal = None  # the journal.JournalWriter recording this game, if any
+    profiler = None  # the profiler.Profiler timing this game's commands, if any
 
     nohelp = "Command '%s' not found!"
 
-    def __init__(self):
+    def __init__(self, engine=None):
         super().__init__(None)  # override complete key (no completion)
 
-        self.alive = True
+        self.bus = events.EventBus()
         # Whether the status message needs to be printed again
-        self.__dirty = True
-        # Generate map
-        self.map = MapGraph.generate(self)
-        # initially the player begins in the starting cave
-        self.current_cave = self.map.get_cave(1)
-
-        self.purse = 20  # the player's coins
-        self.items = []
+        self.__redraw = True
+        self.bus.subscribe(self.__redraw_status, *REDRAW_ON)
+        # cave number -> (cave, cave revision, link revision, status message),
+        # least recently shown first
+        self.__status_cache = OrderedDict()
+        # Generate map, unless an engine has already been set up
+        self.engine = engine if engine is not None else Engine()
 
     def tutorial(self):
         display.clear()
@@ -58,6 +73,7 @@ class Game(cmd.Cmd):
         print("To interact with your environment you can issue commands to the game")
         print("The following commands are available:")
         print("  move:    Move to a connected cave. Specify the number of the cave.")
+        print("  travel:  Travel to any cave you can reach, walking through the caves on the way.")
         print("  fight:   Start a fight with any character in the current cave. You need an item to fight them with!")
         print("  talk:    Talk to a character in the current cave")
         print("  shop:    Open up the shop, if there is one in this cave")
@@ -81,50 +97,201 @@ class Game(cmd.Cmd):
     def start(self):
         self.cmdloop()
 
+    # The game's state lives in the engine, these are kept for convenience
+
+    @property
+    def map(self):
+        return self.engine.map
+
+    @property
+    def current_cave(self):
+        return self.engine.current_cave
+
+    @property
+    def alive(self):
+        return self.engine.alive
+
+    @property
+    def purse(self):
+        return self.engine.purse
+
+    @property
+    def items(self):
+        return self.engine.items
+
     def set_cave(self, cave_num):
         """Set the current cave by number
 
         Does nothing if the player is not alive
         """
+        return self.render(self.engine.set_cave(cave_num))
 
-        if not self.alive:
-            return
+    def __redraw_status(self, happened):
+        """Print the status message again before the next command"""
+        self.__redraw = True
 
-        if cave_num == self.current_cave.num:
-            return  # don't change caves if they are in the same cave already
-
-        # EASTER EGG
-        if cave_num == 10 and any(map(lambda item: item.name == "Obsidian Key", self.items)):
-            display.multiline_alert_box([
-                "A loud rumbling sound fills the cave as an anient hallway breaks apart...",
-                "",
-                "A shining scroll of text appears as torhes on the walls got lit up one after the other"
-            ], colour_code=5)
-            display.multiline_alert_box([
-                "You've unlocked a pathway to the hall of memorials",
-                "A golden door creeked open",
-                "There stood three named statues:",
-                "",
-                "Jim, Max, and Gavin",
-            ], colour_code=4)
-            display.multiline_alert_box([
-                "-*- Credits -*-",
-                "Lead Developer: Jim",
-                "Assistant Developer: Max",
-                "Documentation Expert: Gavin",
-                "Diagram Wranglers: Gavin and Max"
-            ], colour_code=6)
-            return True
+    # ---
+    # Rendering engine events
+    # ---
 
-        self.current_cave = self.map.get_cave(cave_num)
-        self.__set_dirty()
+    def render(self, happened):
+        """Show a list of events from the engine in the terminal
 
-    def __set_dirty(self):
-        """Set status message to refresh on the next loop iteration"""
-        self.__dirty = True
+        Each event is passed to the on_<EventName> method, and published on
+        the bus. Returns True if the game should stop.
+        """
+        self.bus.publish(happened)
+        profiler = self.profiler
+        previous = profiler.enter("render") if profiler is not None else None
+        try:
+            stop = None
+            for event in happened:
+                handler = getattr(self, "on_" + type(event).__name__)
+                stop = handler(event) or stop
+            return stop
+        finally:
+            if profiler is not None:
+                profiler.leave(previous)
+
+    def on_Rejected(self, event):
+        match event.reason:
+            case events.SAME_CAVE:
+                print(f"You're already at cave {display.bold(event.subject)}!")
+            case events.NO_LINK:
+                print("You can't go that way!")
+            case events.INVALID_CAVE:
+                print(f"'{event.subject}' was not a valid cave!")
+                display.print_hint("If you want to travel to cave 12, type 'travel 12'")
+            case events.NO_ROUTE:
+                print("There's no way to get there from here!")
+            case events.NO_CHARACTERS:
+                print("There is no one here.")
+            case events.NO_ITEMS:
+                print("You have no items to fight with!")
+                display.print_hint(
+                    "Buy items in Shops, or find them in certain caves")
+            case events.FRIENDLY:
+                print(
+                    f"{event.subject.name} is a friend, not a foe! You can't fight them")
+            case events.SILENT:
+                print(
+                    f"This {event.subject.name} doesn't want to talk to you.")
+            case events.NOT_A_SHOP:
+                print("There isn't a shop here!")
+                display.print_hint(
+                    "You can only open the shop in caves that have a shop in them!")
+            case events.OUT_OF_STOCK:
+                print("This shop is out of stock!")
+            case events.CANNOT_AFFORD:
+                print(
+                    f"Hey! You can't afford that item. You only have {display.colour(220, f'${self.purse}')}")
+            case _:
+                print("You can't do that right now.")
+
+    def on_Moved(self, event):
+        pass  # the status message for the new cave is printed after the command
+
+    def on_SecretUnlocked(self, event):
+        display.multiline_alert_box([
+            "A loud rumbling sound fills the cave as an anient hallway breaks apart...",
+            "",
+            "A shining scroll of text appears as torhes on the walls got lit up one after the other"
+        ], colour_code=5)
+        display.multiline_alert_box([
+            "You've unlocked a pathway to the hall of memorials",
+            "A golden door creeked open",
+            "There stood three named statues:",
+            "",
+            "Jim, Max, and Gavin",
+        ], colour_code=4)
+        display.multiline_alert_box([
+            "-*- Credits -*-",
+            "Lead Developer: Jim",
+            "Assistant Developer: Max",
+            "Documentation Expert: Gavin",
+            "Diagram Wranglers: Gavin and Max"
+        ], colour_code=6)
+
+    def on_Talked(self, event):
+        display.speech_box(event.conversation,
+                           event.character.name, colour_code=8)
+
+    def on_ItemIneffective(self, event):
+        print(
+            f"You try to use your {display.bold(event.item.name)} but to no avail! It is not very effective.")
 
-    def __unset_dirty(self):
-        self.__dirty = False
+    def on_EnemyDamaged(self, event):
+        enemy = event.enemy
+        starting_health = enemy.get_total_health()
+        display.clear()
+        display.print_healthbar(enemy.name, event.health_before, starting_health)
+        print("")  # empty line
+        print(f"You use your {display.bold(event.item.name)} to fight the {display.underline(enemy.name)}, dealing {display.colour(1, event.damage)} damage!")
+        display.pause()
+        display.clear()
+        display.print_healthbar(enemy.name, enemy.get_health(), starting_health)
+        print("")  # blank line
+        if not event.defeated:
+            print(
+                f"You fight valiantly with your {display.bold(event.item.name)}, but the {display.underline(enemy.name)} is not defeated!")
+            print("")  # empty line
+            display.pause()
+
+    def on_EnemyDefeated(self, event):
+        print(
+            f"Bravo! You have defeated this {display.underline(event.enemy.name)}! For this you have received {display.colour(220, f'${event.reward}')}.")
+        print("")  # blank line
+        display.pause()
+
+    def on_Teleported(self, event):
+        display.alert_box(f"You try to fight the ninja with your {event.item.name}, but they quickly drop a smoke bomb!")
+        display.alert_box(f"The smoke clears and you're suddenly in a different cave!")
+
+    def on_PlayerDied(self, event):
+        if event.enemy.role == BOSS:
+            display.speech_box("You dare challenge me, little fool?", event.enemy.name)
+        display.multiline_alert_box([
+            f"You use your {display.bold(event.item.name)}, but the {display.underline(event.enemy.name)} doesn't even budge!",
+            "",  # empty line
+            "He strikes you with one fell swoop of his katana...",
+            "",  # 2 empty lines
+            "",
+            display.bold(display.underline(
+                display.colour(1, "GAME OVER!!!")))
+        ])
+        return True  # stop loop
+
+    def on_BossDefeated(self, event):
+        display.speech_box("You dare challenge me, little fool?", event.boss.name)
+        display.multiline_alert_box([
+            # Only weapon is crossbow
+            f"You aim your {display.bold('Crossbow')} at the mighty {display.underline(event.boss.name)}...",
+            "",
+            "He lunges at you, shiny katana ready to strike!"],
+            colour_code=1)
+        display.multiline_alert_box([
+            f"Suddenly, a mighty thud echoes around the cavern, as the {display.underline(event.boss.name)} falls to the ground",
+            ""
+        ], colour_code=2)
+        print("")
+        print(
+            "CONGRATULATIONS for defeating the final boss and escaping the Shogunate's Caverns!")
+        print("")
+        print("Press Enter to quit")
+        print(
+            "    or press c and Enter to continue exploring the caves (quit anytime with the quit command)")
+        choice = display.ask("> ")
+        if choice == "c":
+            # Give item
+            return self.render(self.engine.claim_drop())  # Continue the caves
+        return True
+
+    def on_ItemReceived(self, event):
+        pass  # shown in the inventory, the status message is printed again after the command
+
+    def on_ItemBought(self, event):
+        print(f"You've bought a brand new {display.bold(f'{event.item.emoji} {event.item.name}')}! You now have {
+              display.colour(220, f'${event.purse}')}.")
 
     # ---
     # Commands
@@ -133,7 +300,7 @@ class Game(cmd.Cmd):
     def do_refresh(self, arg):
         """Refresh the game window to clear up clutter"""
 
-        self.__set_dirty()
+        self.bus.publish([events.Refreshed()])
 
     def do_quit(self, arg):
         """Quit and close the game"""
@@ -161,35 +328,43 @@ class Game(cmd.Cmd):
             display.print_hint("If you want to go to cave 2, type 'move 2'")
             return
 
-        if input_int == self.current_cave.num:
-            return print(f"You're already at cave {display.bold(input_int)}!")
-
-        # Check cave accessibility
-        if not self.map.check_link(self.current_cave.num, input_int):
-            return print("You can't go that way!")
+        return self.render(self.engine.move(input_int))
 
-        # Set players cave
-        self.set_cave(input_int)
+    def do_travel(self, arg):
+        """Travel to any cave you can reach, walking through the caves on the way"""
 
-    def do_fight(self, arg):
-        """Start a fight with a character"""
-        characters = self.current_cave.characters
-        if not len(characters):
-            print("There is no one to fight here.")
+        # check arg has actual characters
+        if not len(arg):
+            print(
+                f"No cave number specified! Please try again, specifying a cave number!")
+            display.print_hint("If you want to travel to cave 12, type 'travel 12'")
             return
 
-        if not len(self.items):
-            print("You have no items to fight with!")
-            display.print_hint(
-                "Buy items in Shops, or find them in certain caves")
+        input_int = parsing.parse_int(arg)
+
+        if input_int is None:
+            print(f"'{arg}' was not a valid cave!")
+            display.print_hint("If you want to travel to cave 12, type 'travel 12'")
             return
 
+        return self.render(self.engine.travel(input_int))
+
+    def do_fight(self, arg):
+        """Start a fight with a character"""
+        blocked = self.engine.fight_blocked()
+        if blocked is not None:
+            if blocked.reason == events.NO_CHARACTERS:
+                print("There is no one to fight here.")
+                return
+            return self.render([blocked])
+
+        characters = self.current_cave.characters
         print("Select a character to fight by inputting the number in brackets next to their name!")
 
         for (i, character) in enumerate(characters):
             # print i + 1 next to characters' names
             name = display.underline(character.name)
-            if isinstance(character, Boss):
+            if character.role == BOSS:
                 name = display.colour(1, name)
             print(f"├╴ [{i + 1}]: {name}")
         print(f"╰╴ [{len(characters) + 1}]: Cancel fight")
@@ -205,134 +380,47 @@ class Game(cmd.Cmd):
         # subtract 1 to balance out the i + 1 earlier
         selected_character = characters[fight_with_int - 1]
 
-        # do not permit players to fight friendly characters
-        if isinstance(selected_character, Friendly):
-            print(
-                f"{selected_character.name} is a friend, not a foe! You can't fight them")
-            return
+        # e.g. friendly characters can't be fought
+        blocked = self.engine.fight_blocked(selected_character)
+        if blocked is not None:
+            return self.render([blocked])
 
         print("Please select one item you want to use in battle.")
-        for (i, item) in enumerate(self.items):
+        # identical items are stacked, one line each
+        kinds = self.items.kinds()
+        best = self.items.best_against(selected_character)
+        for (i, item) in enumerate(kinds):
             # print i + 1 next to items' names
-            print(f"├╴ [{i + 1}]: {item.emoji}  {item.name}")
-        print(f"╰╴ [{len(self.items) + 1}]: Cancel fight")
+            hint = display.dim("  (best choice)") if item is best and len(kinds) > 1 else ""
+            print(f"├╴ [{i + 1}]: {item.emoji}  {self.__item_name(item)}{hint}")
+        print(f"╰╴ [{len(kinds) + 1}]: Cancel fight")
 
         fight_item_int = display.prompt("Please select an item", 1, "int", lambda num: "That isn't an item you have!" if num > len(
-            self.items) + 1 or num <= 0 else True)
+            kinds) + 1 or num <= 0 else True)
 
-        if fight_item_int == len(self.items) + 1:
+        if fight_item_int == len(kinds) + 1:
             print("Fight cancelled")
             return
 
-        selected_item = self.items[fight_item_int - 1]
-
-        # Boss battle
-        if isinstance(selected_character, Boss):
-            # handle boss battle
-            won_battle = selected_character.fight(selected_item)
-            if not won_battle:
-                self.alive = False
-                display.multiline_alert_box([
-                    f"You use your {display.bold(selected_item.name)}, but the {display.underline(selected_character.name)} doesn't even budge!",
-                    "",  # empty line
-                    "He strikes you with one fell swoop of his katana...",
-                    "",  # 2 empty lines
-                    "",
-                    display.bold(display.underline(
-                        display.colour(1, "GAME OVER!!!")))
-                ])
-                return True  # stop loop
-            else:
-                # won!
-                display.multiline_alert_box([
-                    # Only weapon is crossbow
-                    f"You aim your {display.bold('Crossbow')} at the mighty {display.underline(selected_character.name)}...",
-                    "",
-                    "He lunges at you, shiny katana ready to strike!"],
-                    colour_code=1)
-                display.multiline_alert_box([
-                    f"Suddenly, a mighty thud echoes around the cavern, as the {display.underline(selected_character.name)} falls to the ground",
-                    ""
-                ], colour_code=2)
-                print("")
-                print(
-                    "CONGRATULATIONS for defeating the final boss and escaping the Shogunate's Caverns!")
-                print("")
-                print("Press Enter to quit")
-                print(
-                    "    or press c and Enter to continue exploring the caves (quit anytime with the quit command)")
-                choice = input("> ")
-                if choice == "c":
-                    # Give item
-                    self.items.append(selected_character.get_drop())
-                    self.__set_dirty()
-                    return  # Continue the caves
-                else:
-                    return True
-
-        # Ninja battles
-        if isinstance(selected_character, Ninja):
-            selected_character.fight(selected_item)  # execute fight right away
-            return
-
-        # Regular battles
-        if selected_item.get_damage() == 0:
-            print(
-                f"You try to use your {display.bold(selected_item.name)} but to no avail! It is not very effective.")
-            return
-
-        # Battle sequence
-        starting_health = selected_character.get_total_health()
-        display.clear()
-        display.print_healthbar(selected_character.name,
-                                selected_character.get_health(), starting_health)
-        print("")  # empty line
-        won_fight = selected_character.fight(selected_item)  # execute fight
-        print(f"You use your {display.bold(selected_item.name)} to fight the {display.underline(selected_character.name)}, dealing {display.colour(1, min(selected_item.damage, starting_health))} damage!")
-        print("> Press Enter to Continue <")
-        input()  # wait for enter
-        display.clear()
-        display.print_healthbar(selected_character.name,
-                                selected_character.get_health(), starting_health)
-        print("")  # blank line
-        if won_fight:
-            # give player currency proportional to enemy health
-            # function increases at a decreasing rate
-            given = round(math.sqrt(20 * starting_health))
-            self.purse += given
-            print(
-                f"Bravo! You have defeated this {display.underline(selected_character.name)}! For this you have received {display.colour(220, f'${given}')}.")
-            # remove character from cave
-            self.current_cave.remove_character(selected_character)
-            # check for dropped items
-            items_to_give = selected_character.get_drop()
-            print("")  # blank line
-            print("> Press Enter to Continue <")
-            input()
-        else:
-            print(
-                f"You fight valiantly with your {display.bold(selected_item.name)}, but the {display.underline(selected_character.name)} is not defeated!")
-            print("")  # empty line
-            print("> Press Enter to Continue <")
-            input()
-
-        self.__set_dirty()
+        selected_item = kinds[fight_item_int - 1]
 
         # FEAT: Fight sequence
+        return self.render(self.engine.fight(selected_character, selected_item))
 
     def do_talk(self, arg):
         """Start a conversation with a specific character"""
-        characters = self.current_cave.characters
-        if not len(characters):
+        blocked = self.engine.talk_blocked()
+        if blocked is not None:
             print("There is no one here to talk to!")
             return
 
+        characters = self.current_cave.characters
         print("Select a character to talk to by inputting the numbers next to their name")
 
         for (i, character) in enumerate(characters):
             # print i + 1 next to characters' names
             name = display.underline(character.name)
-            if isinstance(character, Boss):
+            if character.role == BOSS:
                 name = display.colour(1, name)
             print(f"├╴ [{i + 1}]: {name}")
             print(f"│    └╌╌ {character.description}")
@@ -347,71 +435,80 @@ class Game(cmd.Cmd):
             return
 
         selected_character = characters[talk_with_int - 1]
-
-        if selected_character.conversation is None:
-            print(
-                f"This {selected_character.name} doesn't want to talk to you.")
-            return
-
-        display.speech_box(selected_character.conversation,
-                           selected_character.name, colour_code=8)
-        self.__set_dirty()
+        return self.render(self.engine.talk(selected_character))
 
     def do_shop(self, arg):
         """Open up the shop in this cave, if there is one"""
         # FEAT: Shopping system
-        if not isinstance(self.current_cave, Shop):
-            print("There isn't a shop here!")
-            display.print_hint(
-                "You can only open the shop in caves that have a shop in them!")
-            return
-
-        if not len(self.current_cave.for_sale):  # out of stock! (no items for sale)
-            print("This shop is out of stock!")
-            return
+        blocked = self.engine.shop_blocked()
+        if blocked is not None:
+            return self.render([blocked])
 
+        for_sale = self.current_cave.for_sale
         print(
             f"Welcome to the shop in cave {display.bold(self.current_cave.num)}, a place of safety where transactions are done.")
         print("Please select the item you wish to purchase by entering its number in brackets!")
 
-        print(f"You have {display.colour(220, f'${self.purse}')
-                          } | The following items are for sale:")
-
-        for (i, item) in enumerate(self.current_cave.for_sale):
-            cost_display = f"${item.cost}"
-            # if the player cannot afford the item, colour it red
-            if item.cost > self.purse:
-                cost_display = display.colour(160, cost_display)
-            else:  # else make it green
-                cost_display = display.colour(34, cost_display)
-            print(f"├╴ [{i + 1}] {item.emoji} {item.name} ({cost_display})")
-            print(f"│    └╌╌ {item.description}")
-        print(
-            f"╰╴ [{len(self.current_cave.for_sale) + 1}] Leave without buying anything")
-
-        item_int = display.prompt("Please select an item", 1, "int", lambda num: "That isn't a valid item!" if num > (len(
-            self.current_cave.for_sale) + 1) or num <= 0 else True)
+        # big shops are shown a page at a time, with n and p to turn pages
+        pages = for_sale.pages(self.shop_page_size)
+        page = 0
+        while True:
+            print(f"You have {display.colour(220, f'${self.purse}')
+                              } | The following items are for sale:")
+            if pages > 1:
+                print(display.dim(f"(page {page + 1} of {pages})"))
+
+            # prices are sorted, so everything before this can be afforded
+            affordable = for_sale.affordable(self.purse)
+            first = page * self.shop_page_size
+            for (i, item) in enumerate(for_sale.page(page, self.shop_page_size), first):
+                cost_display = f"${item.cost}"
+                # if the player cannot afford the item, colour it red
+                if i >= affordable:
+                    cost_display = display.colour(160, cost_display)
+                else:  # else make it green
+                    cost_display = display.colour(34, cost_display)
+                count = for_sale.count(item)
+                in_stock = f" x{count}" if count > 1 else ""
+                print(f"├╴ [{i + 1}] {item.emoji} {item.name}{in_stock} ({cost_display})")
+                print(f"│    └╌╌ {item.description}")
+            if page + 1 < pages:
+                print("├╴ [n] Next page")
+            if page > 0:
+                print("├╴ [p] Previous page")
+            print(
+                f"╰╴ [{len(for_sale) + 1}] Leave without buying anything")
 
-        if item_int == len(self.current_cave.for_sale) + 1:
+            if pages == 1:
+                item_int = display.prompt("Please select an item", 1, "int", lambda num: "That isn't a valid item!" if num > (len(
+                    for_sale) + 1) or num <= 0 else True)
+            else:
+                choice = display.prompt("Please select an item, or turn the page", 1, "str",
+                                        lambda text: self.__shop_choice(text, page, pages))
+                if choice in ("n", "p"):
+                    page += 1 if choice == "n" else -1
+                    continue
+                item_int = int(choice)
+            break
+
+        if item_int == len(for_sale) + 1:
             # exit shop
             print("Leaving the shop!")
             return
 
         # handle buying items
-        item_selected = self.current_cave.for_sale[item_int - 1]
-
-        if item_selected.cost > self.purse:
-            print(
-                f"Hey! You can't afford that item. You only have {display.colour(220, f'${self.purse}')}")
-            return
-
-        # add to player's items, remove from shop items
-        self.items.append(item_selected)
-        self.current_cave.remove_shop_item(item_selected)
-        self.purse -= item_selected.cost
-
-        print(f"You've bought a brand new {display.bold(f'{item_selected.emoji} {item_selected.name}')}! You now have {
-              display.colour(220, f'${self.purse}')}.")
+        return self.render(self.engine.buy(for_sale[item_int - 1]))
+
+    def __shop_choice(self, text, page, pages):
+        """Guard for the paged shop menu: an item number, or n/p to turn the page"""
+        if text == "n":
+            return True if page + 1 < pages else "This is the last page"
+        if text == "p":
+            return True if page > 0 else "This is the first page"
+        number = parsing.parse_int(text)
+        if number is None or not 0 < number <= len(self.current_cave.for_sale) + 1:
+            return "That isn't a valid item!"
+        return True
 
     def do_inv(self, arg):
         """Check what items you currently have and show how much money you've got"""
@@ -423,11 +520,94 @@ class Game(cmd.Cmd):
 
         print(
             f"You have {display.bold(len(self.items))} item(s) and {display.colour(220, f'${self.purse}')}")
-        for (i, item) in enumerate(self.items):
-            if i == len(self.items) - 1:  # last item has a different special character
-                print(f"╰╴ {item.emoji} {item.name}")
+        kinds = self.items.kinds()
+        for (i, item) in enumerate(kinds):
+            if i == len(kinds) - 1:  # last item has a different special character
+                print(f"╰╴ {item.emoji} {self.__item_name(item)}")
             else:
-                print(f"├╴ {item.emoji} {item.name}")
+                print(f"├╴ {item.emoji} {self.__item_name(item)}")
+
+    def __item_name(self, item):
+        """An item's name, with how many there are if they're stacked"""
+        count = self.items.count(item)
+        return item.name if count == 1 else f"{item.name} x{count}"
+
+    def print_status(self):
+        """Clear the screen and print the status message for the current cave"""
+        profiler = self.profiler
+        previous = profiler.enter("render") if profiler is not None else None
+        try:
+            display.clear()
+            print(self.status_message(self.current_cave), end="")
+        finally:
+            if profiler is not None:
+                profiler.leave(previous)
+
+    def status_message(self, cave):
+        """The status message for a cave, as one string
+
+        Kept until the cave changes (see Cave.revision) or the map's links do,
+        so going back to a cave doesn't build it all again.
+        """
+        cache = self.__status_cache
+        entry = cache.get(cave.num)
+        if entry is not None and entry[0] is cave and entry[1] == cave.revision \
+                and entry[2] == self.map.link_revision:
+            cache.move_to_end(cave.num)
+            return entry[3]
+
+        message = self.__build_status(cave)
+        cache[cave.num] = (cave, cave.revision, self.map.link_revision, message)
+        cache.move_to_end(cave.num)
+        if len(cache) > self.status_cache_size:
+            cache.popitem(last=False)
+        return message
+
+    def __build_status(self, cave):
+        characters = cave.get_characters()
+        linked_caves = self.map.linked_caves(cave)
+        # get numbers of each cave linked to this one
+        linked_caves_str = ", ".join(
+            map(lambda cave: f"[{cave.num}]", linked_caves))
+
+        lines = [
+            "---*---*---",
+            f"You are in cave [{display.bold(cave.num)}]: A {cave.name}",
+            "-----------",
+            f"{cave.description}",
+            f"This cave is linked to caves {linked_caves_str}",
+        ]
+        if isinstance(cave, Shop):
+            lines.append(
+                "🛍️  There is a shop here! Use the 'shop' command to check it out!")
+        lines.append("-----------")
+        if len(characters) > 0:
+            lines.append(f"You aren't alone in here! You see:")
+            for character in characters:
+                if character.role == BOSS:
+                    # bosses are red
+                    lines.append(
+                        f"  The {display.colour(1, display.underline(character.name))}: {character.description}")
+                else:
+                    lines.append(
+                        f"  A {display.underline(character.name)}: {character.description}")
+        else:
+            lines.append(f"It seems like there is no one else here")
+        lines.append("---*---*---")
+        return "\n".join(lines) + "\n"
+
+    def complete_command(self, before):
+        """Tab completion for the command prompt, see lineedit.LineEditor.read_line
+
+        Completes command names, and the caves linked to this one for move.
+        """
+        (command, space, arg) = before.partition(" ")
+        if not space:
+            return 0, self.completenames(command)
+        if command == "move":
+            linked = (str(cave.num) for cave in self.map.linked_caves(self.current_cave))
+            return len(before) - len(arg), [num for num in linked if num.startswith(arg)]
+        return len(before), []
 
     # ---
     # Overridden methods
@@ -436,6 +616,27 @@ class Game(cmd.Cmd):
     def emptyline(self):
         pass  # no-op
 
+    def onecmd(self, line):
+        try:
+            if self.journal is None:
+                return super().onecmd(line)
+            # record the command, and the answers to any prompts it asks
+            self.journal.command(line)
+            try:
+                return super().onecmd(line)
+            finally:
+                self.journal.end_command()
+        finally:
+            # subscribers hear about everything the command did at once
+            self.bus.dispatch()
+
+    def precmd(self, line):
+        if self.profiler is not None:
+            name = self.parseline(line)[0]
+            # unknown commands are counted together, rather than one histogram per typo
+            self.profiler.start_command(name if name is not None and hasattr(self, "do_" + name) else "(other)")
+        return line
+
     def default(self, line):
         print("Command not found. Please try again!")
 
@@ -448,130 +649,21 @@ class Game(cmd.Cmd):
             # whether to stop the loop
             stop = None
             while not stop:
-                # if dirty, unset dirty and print status message
-                if self.__dirty:
-                    self.__unset_dirty()
-
-                    characters = self.current_cave.get_characters()
-                    linked_caves = self.map.linked_caves(self.current_cave)
-                    # get numbers of each cave linked to this one
-                    linked_caves_str = ", ".join(
-                        map(lambda cave: f"[{cave.num}]", linked_caves))
-
-                    # begin status message
-                    display.clear()
-                    print("---*---*---")
-                    print(
-                        f"You are in cave [{display.bold(self.current_cave.num)}]: A {self.current_cave.name}")
-                    print("-----------")
-                    print(f"{self.current_cave.description}")
-                    print(f"This cave is linked to caves {linked_caves_str}")
-                    if isinstance(self.current_cave, Shop):
-                        print(
-                            "🛍️  There is a shop here! Use the 'shop' command to check it out!")
-                    print("-----------")
-                    if len(characters) > 0:
-                        print(f"You aren't alone in here! You see:")
-                        for character in characters:
-                            if isinstance(character, Boss):
-                                # bosses are red
-                                print(
-                                    f"  The {display.colour(1, display.underline(character.name))}: {character.description}")
-                            else:
-                                print(
-                                    f"  A {display.underline(character.name)}: {character.description}")
-                    else:
-                        print(f"It seems like there is no one else here")
-                    print("---*---*---")
-                    # end status message
+                # print the status message again if the last command asked for it
+                if self.__redraw:
+                    self.__redraw = False
+                    self.print_status()
+
+                # the status message shown after a command counts as part of it
+                if self.profiler is not None:
+                    self.profiler.finish_command()
 
                 if self.cmdqueue:
                     line = self.cmdqueue.pop(0)
                 else:
-                    self.stdout.write(self.prompt)
-                    self.stdout.write(display.dim("(command)"))
-                    # send cursor to correct starting location
-                    self.stdout.write("\033[1000D")
-                    self.stdout.write(f"\033[{len(self.prompt)}C")
-                    self.stdout.flush()
-                    # Construct a line from reading each character from stdin
-                    line = ""
-                    cursor = 0  # position of typing cursor
-                    # set tty to raw to disable buffering
-                    normal_tty = display.set_raw(self.stdin)
-                    while True:
-                        char = display.read_raw_char(
-                            self.stdin)  # read one character
-                        char_code = ord(char)
-
-                        # user hit enter key
-                        if char == '\r' or char == '\n':
-                            break  # exit
-
-                        # backspace key
-                        if char_code == 127 or char_code == 8:  # ASCII 8: windows backspace
-                            # delete one character
-                            if cursor > 0:
-                                line = line[:cursor - 1] + line[cursor:]
-                            cursor = max(cursor - 1, 0)
-
-                        # special key handling (*nix '[' sequence),
-                        # 3 character sequences starting with [
-                        if char_code == 27:  # '['
-                            next1, next2 = ord(display.read_raw_char(self.stdin)), ord(
-                                display.read_raw_char(self.stdin))
-
-                            if next1 == 91:  # keys between letters and numpad
-                                if next2 in [50, 53, 54]:  # ins, pgup, pgdn
-                                    next3 = display.read_raw_char(self.stdin)
-                                    # no op, just swallow "~" sign
-
-                                if next2 == 51:  # delete key
-                                    next3 = display.read_raw_char(self.stdin)
-                                    if next3 == "~":
-                                        line = line[:cursor] + \
-                                            line[cursor + 1:]
-
-                                # arrow keys
-                                if next2 == 68:  # left
-                                    cursor = max(cursor - 1, 0)
-                                if next2 == 67:  # right
-                                    cursor = min(
-                                        len(line), cursor + 1)
-
-                        # special key handling (win)
-                        # 2 character sequence starting with \x00
-                        if char == '\x00':  # char_code == 48
-                            next_char = display.read_raw_char(
-                                self.stdin)  # get next char
-
-                            if next_char == 'K':  # left arrow
-                                cursor = max(cursor - 1, 0)
-
-                            if next_char == 'M':  # right arrow
-                                cursor = min(len(line), cursor + 1)
-
-                        # if character is regular ASCII character
-                        # add to line buffer and +1 to index
-                        if 32 <= char_code < 127:
-                            line = line[:cursor] + char + line[cursor:]
-                            cursor += 1
-
-                        # refresh (erase and reprint) buffered line
-                        # send cursor to line start
-                        self.stdout.write("\033[1000D")
-                        self.stdout.write("\033[0K")  # erase line
-                        self.stdout.write(self.prompt + line)  # re-print line
-                        if len(line) == 0:
-                            self.stdout.write(display.dim("(command)"))
-                        # send cursor to line start
-                        self.stdout.write("\033[1000D")
-                        # set cursor pos
-                        self.stdout.write(f"\033[{cursor + len(self.prompt)}C")
-                        self.stdout.flush()  # flush to terminal
-                    # loop done, reset tty to normal
-                    display.set_cooked(self.stdin, normal_tty)
-                    print("")  # Print newline
+                    line = display.read_line(self.prompt, display.dim("(command)"), self.complete_command)
+                    if line is None:
+                        break  # no more input
 
                     if not len(line):
                         line = 'EOF'
@@ -584,4 +676,5 @@ class Game(cmd.Cmd):
 
             self.postloop()
         finally:
-            pass
+            if self.profiler is not None:
+                self.profiler.finish_command()
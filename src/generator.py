@@ -0,0 +1,285 @@
+# Procedural generator for large cave systems
+
+from map import MapGraph
+from cave import Cave, Shop
+from item import Item
+from character import Enemy, Friendly, Boss, Ninja
+
+# stdlib
+import random
+import time
+import tracemalloc
+
+
+# Content pools the generator picks from. Every generated cave shares these
+# strings rather than making its own copies
+
+CAVE_TYPES = [
+    ("Cave", "A small cave underground. No light seeps through although there are cracks in the ceiling"),
+    ("Bottomless Pit", "Deep, dark, bottomless, hole with a small ledge around the edge. Take care with your footing!"),
+    ("Dungeon", "Echoes of unseen horrors lurk beyond the flickering torchlight"),
+    ("Dungeon", "A large room with some equipment and metallic racks"),
+    ("Lava Tube", "A long, cold tunnel lined with ancient lava flows"),
+    ("Grotto", "A cathedral of stone where time pools in the hush of dripping stalactites"),
+    ("Shallow Pit", "A shallow pit. Careful where you step!"),
+    ("Whispering Hollow", "A glimpse of light and some gentle gusts of air seep through the gaps between the rocks. There is an eerie feeling here."),
+    ("Cavern", "An enormous space with echoing walls and a damp, mossy floor."),
+    ("Grotto", "A shadowed sanctuary where time drips like water from the jagged limestone."),
+]
+
+SHOP_DESCRIPTIONS = [
+    "A nice and cozy room with a counter and some products",
+    "A small room lit by flickering candlelights. A counter and some products are for sale.",
+]
+
+# (name, emoji, description, cost, damage)
+ITEMS = [
+    ("Axe", "🪓", "A sharpened hatchet", 15, 15),
+    ("Longsword", "🗡️ ", "A sharp but rusty blade", 20, 20),
+    ("Flamethrower", "🔥", "A makeshift flamethrower made from a lighter and a deo can", 15, 15),
+    ("Candle", "🕯️ ", "A half-burnt candle with dried on wax", 5, 0),
+    ("Cricket Bat", "🏏", "Swing for your life", 40, 15),
+]
+
+# the boss's weakness, at least one shop is guaranteed to sell it
+BOSS_WEAKNESS = ("Crossbow", "🏹", "A powerful bow with ancient writing inscribed on it", 45, 30)
+
+# (name, description, health, weakness, conversation)
+ENEMIES = [
+    ("Reanimated Skeleton", "A spooky scary skeleton... AAH IT MOVES!", 30, None, "*teeth chattering loudly*"),
+    ("Bat", "A small filthy creature with sharp teeth", 20, "Flamethrower", None),
+    ("Dark Mage", "A tall figure in an obsidian-coloured trench coat", 50, None, "Have you seen the key somewhere? It is quite important..."),
+    ("Goblin", "A little green stinky beast with an eye for your gold", 5, None, "Got any gold?"),
+]
+
+# (name, description, conversation)
+FRIENDLIES = [
+    ("Lost Villager", "A disheveled villager with a cast on their right arm", "You need to help me to get out of this maze! The Shogun won't let us leave!"),
+    ("Red Slime", "A small red blob that's just ✨ vibing ✨", "Hello! It's cold in here, isn't it?"),
+    ("Minchu", "A very cute ragdoll cat that seems to be lost", "Meow... I think my owner is in the cave next to here... *purrs*"),
+]
+
+
+class GenerationStats:
+    """How long a generation run took and how much memory it used"""
+
+    def __init__(self, caves, links, seconds, peak_memory):
+        self.caves = caves
+        self.links = links
+        self.seconds = seconds
+        # peak bytes allocated while generating, None if not traced
+        self.peak_memory = peak_memory
+
+    def report(self):
+        """Return a one-line human readable summary"""
+        summary = f"Generated {self.caves} caves and {self.links} links in {self.seconds:.2f}s ({self.caves / max(self.seconds, 1e-9):,.0f} caves/s)"
+        if self.peak_memory is not None:
+            summary += f", peak memory {self.peak_memory / (1024 * 1024):.1f} MiB"
+        return summary
+
+
+class ProceduralGenerator:
+    """Generates a seeded, randomly laid out MapGraph of any size
+
+    The same seed and settings always produce the same map. Caves are
+    numbered from 1 (the starting cave) to `size`, and every cave is
+    reachable from every other cave. No cave has more than `max_degree`
+    links.
+
+    Caves are streamed into the map in chunks of `chunk_size`, so no list of
+    every cave is ever built up besides the map itself.
+    """
+
+    def __init__(self, size, seed=None, max_degree=4, loop_chance=0.2, chunk_size=4096,
+                 shop_chance=0.02, enemy_chance=0.25, ninja_chance=0.01, friendly_chance=0.05):
+        if size < 3:
+            raise ValueError("A generated map needs at least 3 caves")
+        if max_degree < 3:
+            raise ValueError("max_degree must be at least 3")
+
+        self.size = size
+        self.seed = seed
+        self.max_degree = max_degree
+        self.loop_chance = loop_chance  # chance of a cave getting a second link
+        self.chunk_size = chunk_size
+
+        # chances of each cave holding something, rolled in this order
+        self.shop_chance = shop_chance
+        self.enemy_chance = enemy_chance
+        self.ninja_chance = ninja_chance
+        self.friendly_chance = friendly_chance
+
+        self.stats = None  # filled in after generate is called
+
+    def generate(self, game, trace_memory=False):
+        """Generate a new MapGraph, storing timing info in self.stats
+
+        If trace_memory is True, peak memory is measured with tracemalloc,
+        which makes generation noticeably slower.
+        """
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+
+        rng = random.Random(self.seed)
+        # sparse backend, a matrix this big would not fit in memory
+        new_map = MapGraph(game, 1, "sparse")
+        links = 0
+        for chunk in self.__chunks(rng, new_map):
+            # make room for the whole chunk at once
+            new_map.grow(chunk[-1][0].num + 1)
+            for (cave, cave_links) in chunk:
+                new_map.add_cave(cave, cave_links)
+                links += len(cave_links)
+
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.stats = GenerationStats(
+            self.size, links, time.perf_counter() - started, peak)
+
+        return new_map
+
+    def __chunks(self, rng, new_map):
+        """Yield lists of (cave, links) tuples, chunk_size caves at a time"""
+
+        # the boss and a shop selling its weakness are placed up front so
+        # every map is winnable. cave 1 is kept safe as the starting cave
+        boss_cave = rng.randint(2, self.size)
+        weakness_shop = boss_cave
+        while weakness_shop == boss_cave:
+            weakness_shop = rng.randint(2, self.size)
+
+        # degree[n] is the number of links cave n has so far
+        degree = bytearray(1)
+        # caves that can still take another link, for picking link targets
+        # quickly. caves are swapped out once they are full
+        open_caves = []
+
+        chunk = []
+        for num in range(1, self.size + 1):
+            cave_links = []
+            if open_caves:
+                cave_links.append(self.__take_link(rng, open_caves, degree))
+                # sometimes link to a second cave, making loops in the map
+                if open_caves and rng.random() < self.loop_chance:
+                    other = self.__take_link(rng, open_caves, degree)
+                    if other != cave_links[0]:
+                        cave_links.append(other)
+                    else:
+                        degree[other] -= 1  # undo, same cave twice
+                        if degree[other] == self.max_degree - 1:
+                            # __take_link swapped it out for being full, it isn't now
+                            open_caves.append(other)
+
+            degree.append(len(cave_links))
+            if len(cave_links) < self.max_degree:
+                open_caves.append(num)
+
+            if num == boss_cave:
+                cave = self.__boss_cave(rng, num, new_map)
+            elif num == weakness_shop:
+                cave = self.__shop(rng, num, new_map, weakness=True)
+            elif num == 1:
+                name, description = CAVE_TYPES[0]
+                cave = Cave(num, name, description, new_map)
+            else:
+                cave = self.__random_cave(rng, num, new_map)
+
+            chunk.append((cave, cave_links))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def __take_link(self, rng, open_caves, degree):
+        """Pick a random cave that can take another link and count the link"""
+        i = rng.randrange(len(open_caves))
+        num = open_caves[i]
+        degree[num] += 1
+        if degree[num] >= self.max_degree:
+            # full, swap with the last cave and drop it
+            open_caves[i] = open_caves[-1]
+            open_caves.pop()
+        return num
+
+    def __random_cave(self, rng, num, new_map):
+        """Make a cave with random contents"""
+        roll = rng.random()
+        if roll < self.shop_chance:
+            return self.__shop(rng, num, new_map)
+
+        name, description = rng.choice(CAVE_TYPES)
+        cave = Cave(num, name, description, new_map)
+        roll -= self.shop_chance
+
+        if roll < self.enemy_chance:
+            name, description, health, weakness, conversation = rng.choice(ENEMIES)
+            enemy = Enemy(name, description, health, cave)
+            enemy.set_weakness(weakness)
+            enemy.set_conversation(conversation)
+            cave.add_character(enemy)
+            return cave
+        roll -= self.enemy_chance
+
+        if roll < self.ninja_chance:
+            cave.add_character(Ninja(cave))
+            return cave
+        roll -= self.ninja_chance
+
+        if roll < self.friendly_chance:
+            name, description, conversation = rng.choice(FRIENDLIES)
+            friendly = Friendly(name, description, cave)
+            friendly.set_conversation(conversation)
+            cave.add_character(friendly)
+
+        return cave
+
+    def __shop(self, rng, num, new_map, weakness=False):
+        """Make a shop stocked with a few random items"""
+        shop = Shop(num, rng.choice(SHOP_DESCRIPTIONS), new_map)
+        for stock in rng.sample(ITEMS, rng.randint(1, 3)):
+            shop.add_shop_item(Item(*stock))
+        if weakness:
+            shop.add_shop_item(Item(*BOSS_WEAKNESS))
+        shopkeeper = Friendly("Shopkeeper", "A friendly shopkeeper", shop)
+        shopkeeper.set_conversation("Heyo! It's dangerous to go alone, buy something!")
+        shop.add_character(shopkeeper)
+        return shop
+
+    def __boss_cave(self, rng, num, new_map):
+        """Make the cave the boss lives in"""
+        cave = Cave(num, "Cavern", "An enormous space with a throne-like chair in the middle.", new_map)
+        shogun = Boss("Shogun of Bizarre",
+                      "A strong and vigilant samurai with a sharp katana in hand", cave)
+        shogun.set_drop(Item(
+            "Obsidian Key", "🔑", "A priceless key made of purple obsidian... could it unlock the way out?", 1_000_000))
+        shogun.set_weakness(BOSS_WEAKNESS[0])
+        cave.add_character(shogun)
+        return cave
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generate a large cave system and report how long it took")
+    parser.add_argument("size", type=int, help="number of caves to generate")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-degree", type=int, default=4)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="measure peak memory with tracemalloc (slower)")
+    args = parser.parse_args()
+
+    generator = ProceduralGenerator(args.size, seed=args.seed, max_degree=args.max_degree)
+    generator.generate(None, trace_memory=args.trace_memory)
+    print(generator.stats.report())
+    try:
+        import resource  # not available on windows
+        # ru_maxrss is in KiB on linux
+        print(f"Peak resident memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+    except ImportError:
+        pass
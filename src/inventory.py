@@ -0,0 +1,152 @@
+# The player's items
+#
+# Identical items (the same catalog definition, with the same damage) are
+# stacked together, so a player with a hundred candles has one line in the
+# menus, not a hundred. Stacks are kept in the order they were first picked
+# up, indexed by name and by damage, so "do I have the Crossbow" and "what
+# should I fight this with" don't need to look through the whole inventory.
+
+from character import BOSS, NINJA
+
+# stdlib
+from bisect import bisect_left, insort
+
+
+class _Stack:
+    """Items of one kind, in the order they were added"""
+    __slots__ = ("key", "seq", "items")
+
+    def __init__(self, key, seq):
+        self.key = key
+        self.seq = seq  # when the stack was started, for ordering
+        self.items = {}  # Item -> None, dicts keep the order keys were added in
+
+    @property
+    def item(self):
+        """The item shown for the whole stack"""
+        return next(iter(self.items))
+
+    def damage_key(self):
+        """Where this stack goes in Inventory.by_damage"""
+        return (-self.item.damage, self.seq)
+
+
+class Inventory:
+    """The items the player is carrying
+
+    len() and iteration go over every item, copies included. Menus show
+    kinds(): one item per stack, numbered from 1 with number().
+    """
+
+    def __init__(self, items=()):
+        # (definition, damage override) -> _Stack, in the order they were started
+        self.stacks = {}
+        # Item -> the _Stack it's in
+        self.stack_of = {}
+        # name -> {_Stack: None}, first one first
+        self.by_name = {}
+        # (-damage, seq, _Stack) for every stack, hardest hitting first
+        self.by_damage = []
+        self.seq = 0
+        self.size = 0
+        self.listed = None  # kinds(), made when first asked for after a change
+        self.numbers = None  # Item -> number, for number()
+
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        """Add an item. Adding an item that's already here does nothing"""
+        if item in self.stack_of:
+            return
+        key = (item.definition, item.damage_override)
+        stack = self.stacks.get(key)
+        if stack is None:
+            stack = self.stacks[key] = _Stack(key, self.seq)
+            self.seq += 1
+            stack.items[item] = None
+            self.by_name.setdefault(item.name, {})[stack] = None
+            insort(self.by_damage, stack.damage_key() + (stack,))
+        else:
+            stack.items[item] = None
+        self.stack_of[item] = stack
+        self.size += 1
+        self.listed = None
+
+    def remove(self, item):
+        """Remove an item, raising ValueError if it isn't here (like list.remove)"""
+        stack = self.stack_of.pop(item, None)
+        if stack is None:
+            raise ValueError(f"{item!r} is not in the inventory")
+        if len(stack.items) == 1:
+            # the last of its kind, the stack goes too
+            del self.by_damage[bisect_left(self.by_damage, stack.damage_key())]
+            del self.stacks[stack.key]
+            same_name = self.by_name[item.name]
+            del same_name[stack]
+            if not same_name:
+                del self.by_name[item.name]
+        del stack.items[item]
+        self.size -= 1
+        self.listed = None
+
+    def get(self, name):
+        """An item with this name, or None if there isn't one"""
+        stacks = self.by_name.get(name)
+        if not stacks:
+            return None
+        return next(iter(stacks)).item
+
+    def has(self, name):
+        return name in self.by_name
+
+    def count(self, item):
+        """How many items are stacked with this one (including it), 0 if it isn't here"""
+        stack = self.stack_of.get(item)
+        return len(stack.items) if stack is not None else 0
+
+    def strongest(self):
+        """The item that does the most damage, the first picked up if there's a tie.
+        None if nothing does any damage"""
+        if not self.by_damage:
+            return None
+        item = self.by_damage[0][2].item
+        return item if item.damage > 0 else None
+
+    def best_against(self, enemy):
+        """The item to fight an enemy with: its weakness if there's one here,
+        otherwise the strongest item. None if nothing would help"""
+        weakness = getattr(enemy, "weakness_item_name", None)
+        if weakness is not None:
+            item = self.get(weakness)
+            if item is not None:
+                return item
+        if enemy.role in (BOSS, NINJA):
+            return None  # only its weakness beats the boss, and ninjas can't be beaten
+        return self.strongest()
+
+    def kinds(self):
+        """One item from each stack, in the order they were first picked up"""
+        if self.listed is None:
+            self.listed = [stack.item for stack in self.stacks.values()]
+            self.numbers = None
+        return self.listed
+
+    def number(self, item):
+        """The number (from 1) of an item's stack in kinds(), or None if it isn't here"""
+        stack = self.stack_of.get(item)
+        if stack is None:
+            return None
+        if self.numbers is None or self.listed is None:
+            self.numbers = {listed: i + 1 for (i, listed) in enumerate(self.kinds())}
+        return self.numbers[stack.item]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for stack in self.stacks.values():
+            yield from stack.items
+
+    def __contains__(self, item):
+        return item in self.stack_of
@@ -1,13 +1,103 @@
+import sys
+
+
+class ItemDefinition:
+    """The shared, unchanging details of a kind of item
+
+    Every Item of the same kind points at one ItemDefinition from the
+    catalog, rather than each keeping its own copy of the name, description
+    and so on. Definitions can't be changed once made.
+    """
+    __slots__ = ("name", "emoji", "description", "cost", "damage")
+
+    def __init__(self, name, emoji, description, cost, damage):
+        object.__setattr__(self, "name", sys.intern(name))
+        object.__setattr__(self, "emoji", sys.intern(emoji))
+        object.__setattr__(self, "description", sys.intern(description))
+        object.__setattr__(self, "cost", cost)
+        object.__setattr__(self, "damage", damage)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Item definitions can't be changed")
+
+
+class ItemCatalog:
+    """Holds one ItemDefinition per distinct kind of item"""
+
+    def __init__(self):
+        # (name, emoji, description, cost, damage) -> ItemDefinition
+        self.definitions = {}
+        # name -> the first ItemDefinition with that name
+        self.by_name = {}
+
+    def define(self, name, emoji, description, cost, damage=0):
+        """Get the definition for an item, adding it to the catalog if it's new"""
+        key = (name, emoji, description, cost, damage)
+        definition = self.definitions.get(key)
+        if definition is None:
+            definition = self.definitions[key] = ItemDefinition(*key)
+            self.by_name.setdefault(definition.name, definition)
+        return definition
+
+    def get(self, name):
+        """Get an item definition by name, or None if there isn't one"""
+        return self.by_name.get(name)
+
+    def create(self, name):
+        """Make a new Item from the definition with this name
+
+        Raises KeyError if there's no item with that name.
+        """
+        return Item.from_definition(self.by_name[name])
+
+
+# the catalog every Item is defined in
+CATALOG = ItemCatalog()
+
+
 class Item:
     """Represents an item in the game
+
+    The name, emoji, description and cost come from a shared ItemDefinition
+    in the catalog. Only state that can differ between two copies of the same
+    item (its damage, if changed with set_damage) is kept on the Item itself.
     """
+    __slots__ = ("definition", "damage_override")
 
     def __init__(self, name, emoji, description, cost, damage=0):
-        self.name = name
-        self.emoji = emoji
-        self.description = description
-        self.cost = cost
-        self.damage = damage # damage the item does
+        self.definition = CATALOG.define(name, emoji, description, cost, damage)
+        self.damage_override = None
+
+    @staticmethod
+    def from_definition(definition):
+        """Make a new Item from an existing ItemDefinition"""
+        item = Item.__new__(Item)
+        item.definition = definition
+        item.damage_override = None
+        return item
+
+    @property
+    def name(self):
+        return self.definition.name
+
+    @property
+    def emoji(self):
+        return self.definition.emoji
+
+    @property
+    def description(self):
+        return self.definition.description
+
+    @property
+    def cost(self):
+        return self.definition.cost
+
+    @property
+    def damage(self):
+        """Damage the item does"""
+        if self.damage_override is not None:
+            return self.damage_override
+        return self.definition.damage
 
     def get_display(self):
         """Return the name of the item along with its representative emoji"""
@@ -20,15 +110,15 @@ class Item:
     def get_description(self):
         """Return the item's description"""
         return self.description
-    
+
     def get_cost(self):
         """Return this item's cost"""
         return self.cost
 
     def get_damage(self):
         """Return this item's damage"""
-        return self.damage 
+        return self.damage
 
     def set_damage(self, new_damage):
         """Set this item's damage"""
-        self.damage = new_damage
\ No newline at end of file
+        self.damage_override = new_damage
@@ -0,0 +1,374 @@
+# Command journals: record a game, and replay it exactly
+#
+# While recording, every command given to Game.onecmd is appended to a
+# binary journal, along with every line the player typed in answer to the
+# command's prompts (menus, confirmations, "Press Enter"...) and every
+# random number the map drew (e.g. where a ninja sends the player). A replay
+# feeds all of these back in without a terminal, as fast as the game can go,
+# so a player's bug report can be reproduced step by step, and recorded
+# sessions can be run by the thousand as tests or benchmarks:
+#
+#   python src/main.py --journal game.journal
+#   python src/journal.py replay game.journal [more.journal ...]
+#   python src/journal.py show game.journal
+#
+# File layout: a header (magic, version, the engine's seed and the world
+# template used, if any), then records appended as the game goes. Each
+# record is a kind byte followed by its fields; numbers are unsigned LEB128
+# varints and text is a varint length then UTF-8. The last record is
+# FINISH, with a summary of how the game ended, if the game got that far.
+
+from engine import Engine
+from game import Game
+
+# stdlib
+import contextlib
+import struct
+import sys
+import time
+
+MAGIC = b"SHGJ"
+VERSION = 1
+HEADER = struct.Struct("<4sHQ")  # magic, version, seed
+
+# record kinds
+COMMAND = 1  # text: a line given to Game.onecmd
+ANSWER = 2  # text: a line typed in while the command before it was running
+END_OF_INPUT = 3  # no fields: stdin closed while a command was running
+DRAW = 4  # number: a random number the map drew
+FINISH = 5  # numbers: cave, purse, item count, alive, won
+
+
+def _varint(number):
+    """Encode a non-negative int as an LEB128 varint"""
+    out = bytearray()
+    while number >= 0x80:
+        out.append(number & 0x7F | 0x80)
+        number >>= 7
+    out.append(number)
+    return bytes(out)
+
+
+def _read_varint(data, pos):
+    """Decode a varint from data at pos, returning (number, position after it)"""
+    number = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Journal ends in the middle of a record")
+        byte = data[pos]
+        pos += 1
+        number |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return number, pos
+        shift += 7
+
+
+def _text(text):
+    data = text.encode("utf-8")
+    return _varint(len(data)) + data
+
+
+def _read_text(data, pos):
+    (length, pos) = _read_varint(data, pos)
+    if pos + length > len(data):
+        raise ValueError("Journal ends in the middle of a record")
+    return str(data[pos:pos + length], "utf-8"), pos + length
+
+
+def _state(engine):
+    """The numbers in a FINISH record, to check a replay ended up in the same place"""
+    return (engine.current_cave.num, engine.purse, len(engine.items), int(engine.alive), int(engine.won))
+
+
+# ---
+# Recording
+# ---
+
+class JournalWriter:
+    """Appends records to a journal file
+
+    Records are kept in memory while a command runs and written out in one
+    go once it's done, so a crash loses at most the command it happened in.
+    """
+
+    def __init__(self, path, seed, world=None):
+        self.file = open(path, "wb")
+        self.pending = bytearray(HEADER.pack(MAGIC, VERSION, seed) + _text(world or ""))
+        self.in_command = False
+        self.flush()
+
+    def command(self, line):
+        """Record a command. Answers are recorded until end_command"""
+        self.pending.append(COMMAND)
+        self.pending += _text(line)
+        self.in_command = True
+
+    def end_command(self):
+        self.in_command = False
+        self.flush()
+
+    def answer(self, line):
+        """Record a line read from stdin, "" meaning end of input. Ignored outside of commands"""
+        if not self.in_command:
+            return  # e.g. the tutorial, which doesn't change the game
+        if line == "":
+            self.pending.append(END_OF_INPUT)
+        else:
+            self.pending.append(ANSWER)
+            self.pending += _text(line.removesuffix("\n"))
+
+    def draw(self, number):
+        self.pending.append(DRAW)
+        self.pending += _varint(number)
+
+    def finish(self, engine):
+        """Record how the game ended"""
+        self.pending.append(FINISH)
+        for number in _state(engine):
+            self.pending += _varint(number)
+        self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(self.pending)
+            self.file.flush()
+            self.pending.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class RecordingInput:
+    """Stands in for sys.stdin, recording every line read from it"""
+
+    def __init__(self, stream, journal):
+        self.stream = stream
+        self.journal = journal
+
+    def readline(self, *args):
+        line = self.stream.readline(*args)
+        self.journal.answer(line)
+        return line
+
+    def read(self, *args):
+        return self.stream.read(*args)
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    @property
+    def encoding(self):
+        return getattr(self.stream, "encoding", None) or "utf-8"
+
+
+class RecordingRandom:
+    """Stands in for the map's random.Random, recording every number it draws"""
+
+    def __init__(self, rng, journal):
+        self.rng = rng
+        self.journal = journal
+
+    def randrange(self, *args):
+        number = self.rng.randrange(*args)
+        self.journal.draw(number)
+        return number
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
+
+
+def start_recording(game, path, seed, world=None):
+    """Record a game to a journal at `path`, returning the JournalWriter
+
+    The game's engine must have been made with `seed` (and from the world
+    template at path `world`, if any). Replaces sys.stdin, so call it after
+    display.start_line_editor.
+    """
+    journal = JournalWriter(path, seed, world)
+    game.journal = journal
+    game.engine.map.rng = RecordingRandom(game.engine.map.rng, journal)
+    sys.stdin = RecordingInput(sys.stdin, journal)
+    return journal
+
+
+# ---
+# Replaying
+# ---
+
+class Journal:
+    """A journal read back from a file"""
+
+    def __init__(self, seed, world):
+        self.seed = seed
+        self.world = world  # path of the world template, None for the built-in map
+        self.commands = []  # (line, [answers...]), an answer of None is end of input
+        self.draws = []
+        self.finish = None  # the FINISH numbers, if the game got that far
+
+
+def read_journal(path):
+    """Read a journal file into a Journal"""
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"'{path}' is not a journal")
+    (magic, version, seed) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a journal")
+    if version != VERSION:
+        raise ValueError(f"'{path}' is journal version {version}, expected {VERSION}")
+    (world, pos) = _read_text(data, HEADER.size)
+    journal = Journal(seed, world or None)
+
+    while pos < len(data):
+        kind = data[pos]
+        pos += 1
+        if kind == COMMAND:
+            (line, pos) = _read_text(data, pos)
+            journal.commands.append((line, []))
+        elif kind in (ANSWER, END_OF_INPUT) and not journal.commands:
+            raise ValueError(f"'{path}' has an answer before any command")
+        elif kind == ANSWER:
+            (line, pos) = _read_text(data, pos)
+            journal.commands[-1][1].append(line)
+        elif kind == END_OF_INPUT:
+            journal.commands[-1][1].append(None)
+        elif kind == DRAW:
+            (number, pos) = _read_varint(data, pos)
+            journal.draws.append(number)
+        elif kind == FINISH:
+            numbers = []
+            for _ in range(5):
+                (number, pos) = _read_varint(data, pos)
+                numbers.append(number)
+            journal.finish = tuple(numbers)
+        else:
+            raise ValueError(f"'{path}' has an unknown record kind {kind}")
+    return journal
+
+
+class ReplayInput:
+    """Stands in for sys.stdin during a replay, giving back a command's recorded answers"""
+
+    def __init__(self, answers):
+        self.answers = iter(answers)
+
+    def readline(self, *args):
+        answer = next(self.answers, None)
+        return "" if answer is None else answer + "\n"
+
+    def isatty(self):
+        return False
+
+
+class ReplayRandom:
+    """Stands in for the map's random.Random during a replay, giving back the recorded draws"""
+
+    def __init__(self, draws):
+        self.draws = iter(draws)
+
+    def randrange(self, start, stop=None):
+        if stop is None:
+            (start, stop) = (0, start)
+        number = next(self.draws, None)
+        if number is None or not start <= number < stop:
+            raise ValueError("Replay went differently from the recording: the map drew an unexpected random number")
+        return number
+
+
+class Discard:
+    """A stdout that throws away everything written to it"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def build_engine(journal):
+    """An engine set up like the recorded one, drawing the recorded random numbers"""
+    if journal.world is None:
+        engine = Engine(seed=journal.seed)
+    else:
+        import contentpack
+        engine = Engine(lambda engine: contentpack.load_world(engine, journal.world), seed=journal.seed)
+    engine.map.rng = ReplayRandom(journal.draws)
+    return engine
+
+
+def replay(journal):
+    """Play a Journal's commands through a Game with no terminal, returning the Game
+
+    Raises ValueError if the game goes differently from the recording.
+    """
+    stdin = sys.stdin
+    try:
+        with contextlib.redirect_stdout(Discard()):
+            game = Game(build_engine(journal))
+            for (line, answers) in journal.commands:
+                sys.stdin = ReplayInput(answers)
+                if game.onecmd(line):
+                    break
+    finally:
+        sys.stdin = stdin
+
+    if journal.finish is not None and _state(game.engine) != journal.finish:
+        raise ValueError(f"Replay went differently from the recording: ended as {_state(game.engine)}, "
+                         f"recorded {journal.finish}")
+    return game
+
+
+def show(journal):
+    """Describe a Journal, as a list of lines"""
+    lines = [f"seed {journal.seed}, world {journal.world or 'built-in'}, {len(journal.commands)} commands, "
+             f"{len(journal.draws)} random draws"]
+    for (line, answers) in journal.commands:
+        lines.append(f"> {line}")
+        lines.extend(f"    {'(end of input)' if answer is None else repr(answer)}" for answer in answers)
+    if journal.finish is not None:
+        lines.append("finished in cave {}, with ${}, {} items, alive={}, won={}".format(*journal.finish))
+    return lines
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay or inspect recorded game journals")
+    commands = parser.add_subparsers(dest="action", required=True)
+    replay_parser = commands.add_parser("replay", help="replay journals as fast as possible, checking they end the same")
+    replay_parser.add_argument("paths", nargs="+")
+    replay_parser.add_argument("--repeat", type=int, default=1, help="replay every journal this many times")
+    show_parser = commands.add_parser("show", help="print a journal's commands and answers")
+    show_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.action == "show":
+        print("\n".join(show(read_journal(args.path))))
+        return
+
+    journals = [(path, read_journal(path)) for path in args.paths]
+    failed = 0
+    commands = 0
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for (path, journal) in journals:
+            try:
+                replay(journal)
+            except Exception as error:
+                failed += 1
+                print(f"{path}: {type(error).__name__}: {error}")
+            commands += len(journal.commands)
+    seconds = time.perf_counter() - started
+    print(f"Replayed {len(journals) * args.repeat} journals ({commands} commands) in {seconds:.3f}s, "
+          f"{commands / seconds:,.0f} commands/s, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
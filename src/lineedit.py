@@ -0,0 +1,421 @@
+# Line editor for reading the player's input
+#
+# The terminal is put in cbreak mode once, for the whole game: keys arrive
+# as they're pressed and aren't echoed, but output processing (newlines)
+# and Ctrl+C still work as normal. Keys are read in chunks, so pasted or
+# typed-ahead text is handled in one go, and the line lives in a gap buffer
+# so typing in the middle of it doesn't copy the whole line each time.
+# Only the part of the line after the cursor is redrawn on each edit.
+#
+# The command prompt gets history (up/down) and tab completion. Everything
+# else that reads input (input(), display.confirm...) goes through
+# EditorInput, which stands in for sys.stdin.
+
+import width
+
+# stdlib
+import codecs
+import enum
+import os
+import sys
+from collections import deque
+
+
+class Key(enum.Enum):
+    """Keys that aren't text"""
+    ENTER = "enter"
+    TAB = "tab"
+    BACKSPACE = "backspace"
+    DELETE = "delete"
+    LEFT = "left"
+    RIGHT = "right"
+    UP = "up"
+    DOWN = "down"
+    HOME = "home"
+    END = "end"
+    KILL_START = "kill start"  # Ctrl+U
+    KILL_END = "kill end"  # Ctrl+K
+    EOF = "eof"  # Ctrl+D, or stdin closing
+
+
+# escape sequences sent by *nix terminals, after "\x1b[" or "\x1bO"
+ESCAPES = {
+    "A": Key.UP, "B": Key.DOWN, "C": Key.RIGHT, "D": Key.LEFT, "H": Key.HOME, "F": Key.END,
+    "1~": Key.HOME, "7~": Key.HOME, "4~": Key.END, "8~": Key.END, "3~": Key.DELETE,
+}
+
+# the second character of Windows' two character keys
+WINDOWS_KEYS = {"H": Key.UP, "P": Key.DOWN, "M": Key.RIGHT, "K": Key.LEFT, "G": Key.HOME, "O": Key.END, "S": Key.DELETE}
+
+CONTROL_KEYS = {
+    "\r": Key.ENTER, "\n": Key.ENTER, "\t": Key.TAB, "\x7f": Key.BACKSPACE, "\x08": Key.BACKSPACE,
+    "\x01": Key.HOME, "\x05": Key.END, "\x02": Key.LEFT, "\x06": Key.RIGHT, "\x10": Key.UP, "\x0e": Key.DOWN,
+    "\x15": Key.KILL_START, "\x0b": Key.KILL_END, "\x04": Key.EOF,
+}
+
+
+class GapBuffer:
+    """The text of the line being edited, with a gap at the cursor
+
+    Typing and deleting at the cursor only touch the edge of the gap, and
+    moving the cursor only moves the characters between the old and new
+    position.
+    """
+
+    def __init__(self, text="", capacity=64):
+        self.chars = list(text) + [""] * capacity
+        self.start = len(text)  # the gap, which is where the cursor is
+        self.end = len(self.chars)
+
+    def __len__(self):
+        return len(self.chars) - (self.end - self.start)
+
+    @property
+    def cursor(self):
+        return self.start
+
+    def before(self):
+        """The text before the cursor"""
+        return "".join(self.chars[:self.start])
+
+    def after(self):
+        """The text after the cursor"""
+        return "".join(self.chars[self.end:])
+
+    def text(self):
+        return self.before() + self.after()
+
+    def insert(self, text):
+        """Insert text at the cursor, leaving the cursor after it"""
+        if self.end - self.start < len(text):
+            grow = max(len(text), len(self.chars))
+            self.chars[self.end:self.end] = [""] * grow
+            self.end += grow
+        self.chars[self.start:self.start + len(text)] = text
+        self.start += len(text)
+
+    def delete_before(self, count=1):
+        """Delete up to `count` characters before the cursor, returning them"""
+        count = min(count, self.start)
+        removed = "".join(self.chars[self.start - count:self.start])
+        self.start -= count
+        return removed
+
+    def delete_after(self, count=1):
+        """Delete up to `count` characters after the cursor, returning them"""
+        count = min(count, len(self.chars) - self.end)
+        removed = "".join(self.chars[self.end:self.end + count])
+        self.end += count
+        return removed
+
+    def move(self, position):
+        """Move the cursor to a position in the text"""
+        position = max(0, min(position, len(self)))
+        if position < self.start:
+            moved = self.start - position
+            self.chars[self.end - moved:self.end] = self.chars[position:self.start]
+            self.start = position
+            self.end -= moved
+        elif position > self.start:
+            moved = position - self.start
+            self.chars[self.start:position] = self.chars[self.end:self.end + moved]
+            self.start = position
+            self.end += moved
+
+    def set(self, text):
+        """Replace all the text, with the cursor at the end"""
+        self.chars = list(text) + [""] * max(64, len(self.chars) - len(text))
+        self.start = len(text)
+        self.end = len(self.chars)
+
+
+class KeyReader:
+    """Reads keys from the terminal, as many as are waiting at a time
+
+    Keys are text (one or more ordinary characters), or a Key for anything
+    else. Keys that arrive together (typed ahead, or a paste of several
+    lines) stay queued until they're handled, whatever reads them.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.__stdin__
+        self.decoder = codecs.getincrementaldecoder(getattr(self.stream, "encoding", None) or "utf-8")("replace")
+        self.pending = ""  # read but not turned into keys yet
+        self.parsed = deque()  # turned into keys but not handled yet
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def fill(self, wait=True):
+        """Read whatever's waiting on the terminal into pending. Returns False at end of file"""
+        if os.name == "nt":
+            import msvcrt
+            self.pending += msvcrt.getwch()
+            while msvcrt.kbhit():
+                self.pending += msvcrt.getwch()
+            return True
+
+        import select
+        if not wait and not select.select([self.stream], [], [], 0.05)[0]:
+            return True
+        data = os.read(self.fileno(), 4096)
+        if not data:
+            return False
+        self.pending += self.decoder.decode(data)
+        return True
+
+    def read(self, size=1):
+        """Read `size` characters, as they were typed"""
+        if self.parsed:
+            # keys queued up already come first. only text and Enter can be
+            # given back as characters
+            queued = "".join(key if isinstance(key, str) else "\n" if key == Key.ENTER else ""
+                             for key in self.parsed)
+            self.parsed.clear()
+            self.pending = queued + self.pending
+        while len(self.pending) < size:
+            if not self.fill():
+                break
+        (text, self.pending) = (self.pending[:size], self.pending[size:])
+        return text
+
+    def keys(self):
+        """Return the queue of keys waiting to be handled, reading more if there aren't any
+
+        Handle keys by popping them off the left, and leave the rest for next time.
+        """
+        keys = self.parsed
+        if keys:
+            return keys
+        if not self.pending and not self.fill():
+            keys.append(Key.EOF)
+            return keys
+        while self.pending:
+            (key, used) = self.__next_key(self.pending)
+            if not used:
+                # the rest of an escape sequence hasn't arrived yet. a lone
+                # Escape key press never gets one, so don't wait long
+                before = len(self.pending)
+                self.fill(wait=False)
+                if len(self.pending) > before:
+                    continue
+                used = 1  # swallow the Escape
+            self.pending = self.pending[used:]
+            if key is None:
+                continue
+            if isinstance(key, str) and keys and isinstance(keys[-1], str):
+                keys[-1] += key  # runs of text are inserted together
+            else:
+                keys.append(key)
+        return keys
+
+    def __next_key(self, text):
+        """Return (key, characters used) for the start of some text, or (None, 0) if it's cut off"""
+        char = text[0]
+        if char == "\x1b":
+            if len(text) > 1 and text[1] not in "[O":
+                return None, 1  # Alt+something, just keep the something
+            if len(text) < 3:
+                return None, 0
+            # parameters, then a final letter or ~
+            for (i, final) in enumerate(text[2:], start=2):
+                if final.isalpha() or final == "~":
+                    return ESCAPES.get(text[2:i + 1].lstrip("0123456789;") if final.isalpha() else text[2:i + 1]), i + 1
+            return None, 0
+        if os.name == "nt" and char in ("\x00", "\xe0"):  # Windows arrow keys etc.
+            if len(text) < 2:
+                return None, 0
+            return WINDOWS_KEYS.get(text[1]), 2
+        if char in CONTROL_KEYS:
+            return CONTROL_KEYS[char], 1
+        if char < " ":
+            return None, 1  # some other control key
+        return char, 1
+
+
+def _back(text):
+    """Move the cursor back over some text"""
+    columns = width.text_width(text)
+    return f"\x1b[{columns}D" if columns else ""
+
+
+class LineEditor:
+    """Reads lines from the player, echoing and editing them itself
+
+    Call start to put the terminal in cbreak mode and stop to put it back.
+    Output goes to sys.stdout (whatever it is at the time) so the buffered
+    output and diff renderer see it like any other printing.
+    """
+
+    def __init__(self, stdin=None, history_size=100):
+        self.keys = KeyReader(stdin)
+        self.history = deque(maxlen=history_size)
+        self.normal_mode = None  # the terminal's settings before start
+
+    def start(self):
+        """Put the terminal in cbreak mode, until stop is called. No effect on Windows"""
+        if os.name == "nt" or self.normal_mode is not None:
+            return
+        import termios
+        import tty
+        fd = self.keys.fileno()
+        self.normal_mode = termios.tcgetattr(fd)
+        tty.setcbreak(fd)
+
+    def stop(self):
+        """Put the terminal back how it was before start"""
+        if self.normal_mode is None:
+            return
+        import termios
+        termios.tcsetattr(self.keys.fileno(), termios.TCSADRAIN, self.normal_mode)
+        self.normal_mode = None
+
+    def read_line(self, prompt="", placeholder="", completer=None, history=False):
+        """Read a line, returning it without the newline, or None at end of file
+
+        The prompt is printed first. The placeholder is shown (after the
+        cursor) while the line is empty. completer is called with the text
+        before the cursor when Tab is pressed, and returns (start, candidates):
+        the candidates to replace the text from `start` up to the cursor with.
+        With history=True, up and down go through earlier lines, and this
+        line is added to them.
+        """
+        out = sys.stdout
+        line = GapBuffer()
+        browsing = len(self.history)  # which history entry is showing, len() for the new line
+        draft = ""  # the new line, while browsing history
+        last_key = None
+
+        out.write(prompt + placeholder + _back(placeholder))
+        out.flush()
+        while True:
+            keys = self.keys.keys()
+            while keys:
+                key = keys.popleft()
+                had_text = len(line) > 0
+                echo = ""
+                match key:
+                    case Key.ENTER:
+                        text = line.text()
+                        out.write(line.after() + "\n")
+                        out.flush()
+                        if history and text and (not self.history or self.history[-1] != text):
+                            self.history.append(text)
+                        return text
+                    case Key.EOF:
+                        if len(line) == 0:
+                            out.write("\n")
+                            out.flush()
+                            return None
+                        key = Key.DELETE
+                        echo = self.__delete_after(line)
+                    case Key.BACKSPACE:
+                        removed = line.delete_before()
+                        if removed:
+                            echo = _back(removed) + self.__tail(line, removed)
+                    case Key.DELETE:
+                        echo = self.__delete_after(line)
+                    case Key.LEFT:
+                        if line.cursor > 0:
+                            char = line.before()[-1]
+                            line.move(line.cursor - 1)
+                            echo = _back(char)
+                    case Key.RIGHT:
+                        if line.cursor < len(line):
+                            char = line.after()[0]
+                            line.move(line.cursor + 1)
+                            echo = char
+                    case Key.HOME:
+                        echo = _back(line.before())
+                        line.move(0)
+                    case Key.END:
+                        echo = line.after()
+                        line.move(len(line))
+                    case Key.KILL_START:
+                        removed = line.delete_before(line.cursor)
+                        echo = _back(removed) + self.__tail(line, removed)
+                    case Key.KILL_END:
+                        line.delete_after(len(line) - line.cursor)
+                        echo = "\x1b[K"
+                    case Key.UP | Key.DOWN if history:
+                        step = -1 if key == Key.UP else 1
+                        if 0 <= browsing + step <= len(self.history):
+                            if browsing == len(self.history):
+                                draft = line.text()
+                            browsing += step
+                            echo = self.__replace(line, self.history[browsing] if browsing < len(self.history) else draft)
+                    case Key.TAB if completer is not None:
+                        echo = self.__complete(line, completer, prompt + (placeholder + _back(placeholder) if not len(line) else ""),
+                                               listing=last_key == Key.TAB)
+                    case str():
+                        line.insert(key)
+                        echo = key + line.after() + _back(line.after())
+                if not had_text and len(line) and placeholder:
+                    echo += "\x1b[K" if not line.after() else ""
+                elif had_text and not len(line):
+                    echo += placeholder + _back(placeholder)
+                out.write(echo)
+                last_key = key
+            out.flush()
+
+    def __tail(self, line, removed):
+        """Redraw the text after the cursor, once `removed` has been taken out before it"""
+        after = line.after()
+        blank = " " * width.text_width(removed)
+        return after + blank + _back(after + blank)
+
+    def __delete_after(self, line):
+        removed = line.delete_after()
+        if not removed:
+            return ""
+        return self.__tail(line, removed)
+
+    def __replace(self, line, text):
+        """Swap the whole line for some other text, with the cursor at the end"""
+        echo = _back(line.before()) + text + "\x1b[K"
+        line.set(text)
+        return echo
+
+    def __complete(self, line, completer, prompt, listing):
+        # prompt is what to print before the line if the choices are listed
+        before = line.before()
+        (start, candidates) = completer(before)
+        candidates = sorted(set(candidates))
+        word = before[start:]
+        if len(candidates) == 1:
+            addition = candidates[0][len(word):] + " "
+        else:
+            addition = os.path.commonprefix(candidates)[len(word):] if candidates else ""
+        if addition:
+            line.insert(addition)
+            return addition + line.after() + _back(line.after())
+        if listing and len(candidates) > 1:
+            # second Tab in a row with nothing more to add, show the choices
+            # and then the line again underneath
+            return "\n" + "  ".join(candidates) + "\n" + prompt + line.text() + _back(line.after())
+        return ""
+
+
+class EditorInput:
+    """Stands in for sys.stdin, so input() and display.confirm read through the line editor
+
+    Has no fileno, so input() doesn't go around it to the terminal.
+    """
+
+    def __init__(self, editor):
+        self.editor = editor
+
+    def readline(self, *args):
+        line = self.editor.read_line()
+        return "" if line is None else line + "\n"
+
+    def read(self, size=1):
+        # raw keypresses, not echoed
+        return self.editor.keys.read(size)
+
+    def isatty(self):
+        return self.editor.keys.stream.isatty()
+
+    @property
+    def encoding(self):
+        return getattr(self.editor.keys.stream, "encoding", None) or "utf-8"
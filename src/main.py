@@ -1,20 +1,172 @@
-from game import Game
-import display
+# Start the game in the terminal
+#
+# Only what the title screen needs is imported before it's shown. The rest
+# of the game is imported and the world built while the title screen waits
+# for Enter, so the player sees something as soon as possible.
+#
+# When stdin isn't a terminal (commands piped in from a file), the game runs
+# in batch mode instead: no title screen or tutorial, one line of input per
+# command or answer, no pauses and plain output (see display.start_batch).
+
+# stdlib
+import argparse
+import sys
+import time
+
+# CPU time used getting Python going, up to this module running
+STARTUP_CPU = time.process_time()
+
+
+class Timings:
+    """How long each step of starting up took, for --timings"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.steps = []
+
+    def step(self, name):
+        """Record the time since the last step as `name`"""
+        now = time.perf_counter()
+        self.steps.append((name, now - self.last))
+        self.last = now
+
+    def mark(self, name):
+        """Record the time since main started as `name`"""
+        self.steps.append((name, time.perf_counter() - self.started))
+
+    def summary(self):
+        """Describe the steps, as a list of lines"""
+        lines = ["Startup timings:", f"  {'python startup (cpu)':<24}{STARTUP_CPU * 1000:>8.1f}ms"]
+        lines.extend(f"  {name:<24}{seconds * 1000:>8.1f}ms" for (name, seconds) in self.steps)
+        return lines
 
 
 def main():
-    # title screen
-    display.clear()
-    print("\n")
-    print("┏━━━━━━━━━━━━━━━━━━━━━┓")
-    print("┣ Shogunate's Caverns ┫")
-    print("┗━━━━━━━━━━━━━━━━━━━━━┛")
-    print("\033[?25l") # ANSI - try to make cursor invisible
-    input("> Press Enter to Start <")
-    print("\033[?25h") # make cursor visible again
-    game = Game()
-    display.clear()
-    game.tutorial()
-    game.start()
-
-main()
\ No newline at end of file
+    timings = Timings()
+    parser = argparse.ArgumentParser(description="Play Shogunate's Caverns")
+    parser.add_argument("--renderer", choices=["plain", "diff"], default="plain",
+                        help="'diff' only redraws what changed on screen, for slow connections")
+    parser.add_argument("--world", default=None,
+                        help="start from a prebuilt world template (a map file written by mapfile.py, "
+                             "or a content pack, see contentpack.py) instead of generating the map")
+    parser.add_argument("--journal", default=None,
+                        help="record the game to this file, to be replayed later with journal.py")
+    parser.add_argument("--save", default=None,
+                        help="carry on the game saved in this file, if there is one, and save to it after every command that changes something")
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="time every command and export histograms of the timings to this file "
+                             "(read them with profiler.py show PATH)")
+    parser.add_argument("--profile-every", type=float, default=60.0, metavar="SECONDS",
+                        help="how often to export the --profile histograms, as well as on SIGUSR1 and at the end")
+    parser.add_argument("--output-stats", action="store_true",
+                        help="print how many writes and bytes to the terminal were saved, when the game ends")
+    parser.add_argument("--timings", action="store_true",
+                        help="print how long starting up took, when the game ends")
+    args = parser.parse_args()
+    if args.journal is not None and args.save is not None:
+        # a replay always starts from a new game
+        parser.error("--journal can't be used with --save")
+    batch = not sys.stdin.isatty()
+    if args.journal is not None and batch:
+        # replays answer every pause, which batch mode skips
+        parser.error("--journal needs the game to be played in a terminal")
+    timings.step("arguments")
+
+    import display
+    timings.step("imports (title screen)")
+    if batch:
+        display.set_renderer("plain")  # there's no screen to diff against
+        display.start_batch()
+    else:
+        display.set_renderer(args.renderer)
+        display.start_line_editor()
+    timings.step("terminal setup")
+    recording = None  # the journal.JournalWriter, with --journal
+    profiling = None  # the profiler.Profiler, with --profile
+
+    try:
+        if not batch:
+            # title screen
+            display.clear()
+            print("\n")
+            print("┏━━━━━━━━━━━━━━━━━━━━━┓")
+            print("┣ Shogunate's Caverns ┫")
+            print("┗━━━━━━━━━━━━━━━━━━━━━┛")
+            print("\033[?25l") # ANSI - try to make cursor invisible
+            print("> Press Enter to Start <", end="")
+            sys.stdout.flush()
+            timings.step("title screen")
+            timings.mark("first prompt")
+
+        # get everything else ready while the player reads the title
+        from game import Game
+        from engine import Engine
+        if args.world is not None:
+            import contentpack
+        if args.journal is not None:
+            import journal
+            import random
+        if args.save is not None:
+            import os
+            import savegame
+            import events
+        if args.profile is not None:
+            import profiler
+            import signal
+        timings.step("imports (game)")
+        # a replay needs to know the seed
+        seed = random.randrange(2 ** 64) if args.journal is not None else None
+        world = args.world
+        engine = None
+        if args.save is not None and os.path.exists(args.save):
+            # the save knows which world it was played in
+            (engine, saved_world) = savegame.load(args.save, seed=seed)
+            if engine.alive:
+                world = saved_world
+            else:
+                engine = None  # the player died in that game, start a new one over it
+        if engine is None:
+            if world is None:
+                engine = Engine(seed=seed)
+            else:
+                engine = Engine(lambda engine: contentpack.load_world(engine, world), seed=seed)
+        timings.step("world")
+
+        if not batch:
+            input()
+            print("\033[?25h") # make cursor visible again
+        game = Game(engine)
+        if args.journal is not None:
+            recording = journal.start_recording(game, args.journal, seed, world)
+        if args.save is not None:
+            # commands that don't change anything (looking around, cancelled
+            # menus...) leave the save alone
+            game.bus.subscribe(lambda happened: savegame.save(game.engine, args.save, world), *events.CHANGES_STATE)
+        if args.profile is not None:
+            profiling = profiler.start_profiling(game, args.profile, args.profile_every)
+            if hasattr(signal, "SIGUSR1"):  # not on windows
+                signal.signal(signal.SIGUSR1, lambda signum, frame: profiling.export())
+        if not batch:
+            display.clear()
+            game.tutorial()
+        try:
+            game.start()
+        except EOFError:
+            pass  # input ran out in the middle of a command
+    finally:
+        if batch:
+            display.stop_batch()
+        sys.stdout.flush()
+        if recording is not None:
+            recording.finish(game.engine)
+            recording.close()
+        if profiling is not None:
+            profiling.export()
+        display.stop_line_editor()
+        if args.output_stats:
+            print("\n".join(display.output_stats().summary()), file=sys.stderr)
+        if args.timings:
+            print("\n".join(timings.summary()), file=sys.stderr)
+
+main()
@@ -2,24 +2,21 @@ from cave import Cave, Shop
 from item import Item
 from character import Ninja
 from character import Enemy, Friendly, Boss
+from stock import ShopCatalog
 import random
+from bisect import insort
 
 
-class MapGraph:
-    """Represents the in-game map of caves with a graph data structure
-
-    You probably want to call the static method "generate" on this to
-    instantiate a pre-generated MapGraph with all the caves already filled in.
-
-    Each cave is a node whilst the available paths between caves is treated as
-    an edge. The graph's data is stored within a 2D list (matrix). Currently,
-    the graph is NOT expandable (size passed at instantiation is fixed)!
+class MatrixLinks:
+    """Stores the links between caves in a dense 2D list (matrix)
 
-    This graph is undirected; if A -> B, then likewise B -> A implicitly.
+    Fast to check for small maps, but takes size * size memory and finding the
+    neighbours of a cave means scanning a whole row.
     """
 
-    def __init__(self, game, size):
-        self.game = game
+    name = "matrix"
+
+    def __init__(self, size):
         self.size = size
         # create the 2d-list for storing the connections
         # starts out like
@@ -35,30 +32,198 @@ class MapGraph:
         # see the add_edge method for impl details
         self.matrix = [[0] * size for _ in range(size)]
 
+    def grow(self, new_size):
+        """Grow the matrix so it can hold `new_size` caves"""
+        extra = new_size - self.size
+        if extra <= 0:
+            return
+        # widen the existing rows, then add the new ones
+        for row in self.matrix:
+            row.extend([0] * extra)
+        self.matrix.extend([0] * new_size for _ in range(extra))
+        self.size = new_size
+
+    def add_edge(self, a, b):
+        self.matrix[a][b] = 1
+        # also create a back-link B -> A
+        self.matrix[b][a] = 1
+
+    def has_edge(self, a, b):
+        return self.matrix[a][b] == 1
+
+    def neighbours(self, a):
+        """Return the numbers of all the caves linked to `a`, in ascending order"""
+        return [i for (i, link) in enumerate(self.matrix[a]) if link == 1]
+
+    def adjacency_lists(self):
+        """Return a list holding the neighbours of every cave"""
+        return [self.neighbours(a) for a in range(self.size)]
+
+
+class SparseLinks:
+    """Stores the links between caves as a list of neighbours for each cave
+
+    Memory grows with the number of links rather than size * size, and
+    finding the neighbours of a cave only touches that cave's own links.
+    Use this for large (generated) maps.
+    """
+
+    name = "sparse"
+
+    def __init__(self, size):
+        self.size = size
+        # adjacency[a] is a sorted list of the cave numbers linked to cave a.
+        # caves only have a handful of links, so a small list is both smaller
+        # and about as fast as a set here
+        self.adjacency = [[] for _ in range(size)]
+
+    def grow(self, new_size):
+        """Grow the adjacency list so it can hold `new_size` caves"""
+        extra = new_size - self.size
+        if extra <= 0:
+            return
+        self.adjacency.extend([] for _ in range(extra))
+        self.size = new_size
+
+    def add_edge(self, a, b):
+        if b in self.adjacency[a]:
+            return  # already linked
+        insort(self.adjacency[a], b)
+        # also create a back-link B -> A
+        insort(self.adjacency[b], a)
+
+    def has_edge(self, a, b):
+        return b in self.adjacency[a]
+
+    def neighbours(self, a):
+        """Return the numbers of all the caves linked to `a`, in ascending order"""
+        # copy so callers can't accidentally edit the map
+        return list(self.adjacency[a])
+
+    def adjacency_lists(self):
+        """Return a list holding the neighbours of every cave
+
+        This is the backend's own storage, so it must not be modified.
+        """
+        return self.adjacency
+
+
+class RoleIndex:
+    """Which caves hold characters of each role (see character.ROLES)
+
+    Kept up to date by Cave.add_character and remove_character, so finding
+    e.g. the boss doesn't mean looking through every cave.
+    """
+
+    def __init__(self):
+        # role -> {cave number: how many characters there have that role}
+        self.counts = {}
+
+    def add(self, role, num):
+        caves = self.counts.setdefault(role, {})
+        caves[num] = caves.get(num, 0) + 1
+
+    def remove(self, role, num):
+        caves = self.counts[role]
+        if caves[num] == 1:
+            del caves[num]
+        else:
+            caves[num] -= 1
+
+    def caves_with(self, role):
+        """The numbers of the caves with a character of this role, in ascending order"""
+        return sorted(self.counts.get(role, ()))
+
+
+class MapGraph:
+    """Represents the in-game map of caves with a graph data structure
+
+    You probably want to call the static method "generate" on this to
+    instantiate a pre-generated MapGraph with all the caves already filled in.
+
+    Each cave is a node whilst the available paths between caves is treated as
+    an edge. How the edges are stored depends on the backend:
+        - "matrix": a 2D list (matrix), good for small maps
+        - "sparse": a list of neighbours per cave, for large maps
+    A backend object can also be passed in directly, see mapfile.py.
+
+    The graph can be grown after instantiation, either with the grow method or
+    by adding a cave with a number past the current size.
+
+    This graph is undirected; if A -> B, then likewise B -> A implicitly.
+    """
+
+    def __init__(self, game, size, backend="matrix"):
+        self.game = game
+        self.size = size
+        # source of randomness, e.g. for ninjas. the game may swap in its own
+        # seeded random.Random
+        self.rng = random
+
+        match backend:
+            case "matrix":
+                self.links = MatrixLinks(size)
+            case "sparse":
+                self.links = SparseLinks(size)
+            case str():
+                raise ValueError(f"Unknown map backend '{backend}'")
+            case _:
+                # an already filled in backend, e.g. one loaded from a map file
+                self.links = backend
+        self.backend = self.links.name
+
         # list for storing the caves themselves, mapping them to their node IDs
         # in this graph
         self.cave_data = [None] * size
 
+        # distance index for route finding, built when first needed and
+        # thrown away whenever the links change
+        self.distances = None
+        # goes up whenever the links change, so anything worked out from them
+        # (e.g. a cave's status message) knows to work it out again
+        self.link_revision = 0
+        # which caves have which kinds of characters
+        self.roles = RoleIndex()
+        # the kinds of items for sale, shared by every shop's Stock
+        self.shop_catalog = ShopCatalog()
+
+    def grow(self, new_size):
+        """Grow the map so it can hold caves numbered up to `new_size` - 1
+
+        Does nothing if the map is already big enough.
+        """
+        if new_size <= self.size:
+            return
+
+        self.links.grow(new_size)
+        self.cave_data.extend([None] * (new_size - self.size))
+        self.size = new_size
+        self.distances = None
+
     def __add_edge(self, a, b):
         """Add a link between node `a` and `b`"""
 
         # a and b must be greater than or eq to 0 (min ID) and less than the
-        # total size of the matrix. also self-linking is prohibited, a != b
+        # total size of the map. also self-linking is prohibited, a != b
         if 0 <= a < self.size and 0 <= b < self.size and a != b:
-            self.matrix[a][b] = 1
-            # also create a back-link B -> A
-            self.matrix[b][a] = 1
+            self.links.add_edge(a, b)
+            self.distances = None
+            self.link_revision += 1
 
-    def __add_cave(self, cave, links):
+    def add_cave(self, cave, links):
         """Add a new Cave to the map, with a list of caves it is linked to
 
         Providing a cave with a duplicate number will OVERWRITE the existing
         cave but will NOT alter the existing links on the map, if any exist.
+        Providing a cave with a number past the end of the map grows the map.
 
         Note: back-links are automatically handled for so there is no need to
         specify them.
         """
 
+        if cave.num >= self.size:
+            self.grow(cave.num + 1)
+
         # add cave to data list
         self.cave_data[cave.num] = cave
 
@@ -72,7 +237,7 @@ class MapGraph:
         """Generate a new MapGraph with caves"""
 
         new_map = MapGraph(game, 13)
-        new_map.__add_cave(Cave(
+        new_map.add_cave(Cave(
             1, "Cave", "A small cave underground. No light seeps through although there are cracks in the ceiling", new_map), [])
 
         shop = Shop(
@@ -89,11 +254,11 @@ class MapGraph:
         shop.add_character(shopkeeper)
 
 
-        new_map.__add_cave(shop, [1])
+        new_map.add_cave(shop, [1])
 
         cave3 = Cave(
             3, "Bottomless Pit", "Deep, dark, bottomless, hole with a small ledge around the edge. Take care with your footing!", new_map)
-        new_map.__add_cave(cave3, [1])
+        new_map.add_cave(cave3, [1])
         skeleton = Enemy("Reanimated Skeleton", "A spooky scary skeleton... AAH IT MOVES!", 30, cave3)
         skeleton.set_conversation("*teeth chattering loudly*")
         cave3.add_character(skeleton)
@@ -104,11 +269,11 @@ class MapGraph:
         cave4.add_character(ninja)
         villager = Friendly("Lost Villager", "A disheveled villager with a cast on their right arm", cave4)
         villager.set_conversation("You need to help me to get out of this maze! The Shogun won't let us leave!")
-        new_map.__add_cave(cave4, [1])
+        new_map.add_cave(cave4, [1])
 
         cave5 = Cave(
             5, "Dungeon", "A large room with some equipment and metallic racks", new_map)
-        new_map.__add_cave(cave5, [1])
+        new_map.add_cave(cave5, [1])
         bat = Enemy(
             "Bat", "A small filthy creature with sharp teeth", 20, cave5)
         bat.set_weakness("Flamethrower")
@@ -116,7 +281,7 @@ class MapGraph:
 
         cave6 = Cave(
             6, "Lava Tube", "A long, cold tunnel lined with ancient lava flows", new_map)
-        new_map.__add_cave(cave6, [3, 2])
+        new_map.add_cave(cave6, [3, 2])
         slime = Friendly(
             "Red Slime", "A small red blob that's just ✨ vibing ✨", cave6)
         slime.set_conversation("Hello! It's cold in here, isn't it?")
@@ -130,7 +295,7 @@ class MapGraph:
         cave7.add_character(minchu)
         minchu.set_conversation(
             "Meow... I think my owner is in the cave next to here... *purrs*")
-        new_map.__add_cave(cave7, [5, 3])
+        new_map.add_cave(cave7, [5, 3])
 
         shop2 = Shop(
             8, "A small room lit by flickering candlelights. A counter and some products are for sale.", new_map)
@@ -143,8 +308,8 @@ class MapGraph:
         mysterious_shopkeeper = Friendly("Mysterious Shopkeeper", "A mysterious shopkeeper", shop2)
         mysterious_shopkeeper.set_conversation("Have you seen the key anywhere... I heard it's worth lots...")
         shop2.add_character(mysterious_shopkeeper)
-        new_map.__add_cave(shop2, [4, 5])
-        new_map.__add_cave(Cave(
+        new_map.add_cave(shop2, [4, 5])
+        new_map.add_cave(Cave(
             9, "Shallow Pit", "A shallow pit. Careful where you step!", new_map), [2, 4])
 
         cave10 = Cave(
@@ -152,11 +317,11 @@ class MapGraph:
         mage = Enemy("Dark Mage", "A tall figure in an obsidian-coloured trench coat", 50, cave10)
         mage.set_conversation("Have you seen the key somewhere? It is quite important...")
         cave10.add_character(mage)
-        new_map.__add_cave(cave10, [8, 9])
+        new_map.add_cave(cave10, [8, 9])
 
         cave11 = Cave(
             11, "Cavern", "An enormous space with a throne-like chair in the middle.", new_map)
-        new_map.__add_cave(cave11, [8, 7])
+        new_map.add_cave(cave11, [8, 7])
         shogun = Boss("Shogun of Bizarre",
                       "A strong and vigilant samurai with a sharp katana in hand", cave11)
         shogun.set_drop(Item(
@@ -166,7 +331,7 @@ class MapGraph:
 
         cave12 = Cave(
             12, "Grotto", "A shadowed sanctuary where time drips like water from the jagged limestone.", new_map)
-        new_map.__add_cave(cave12, [6, 7])
+        new_map.add_cave(cave12, [6, 7])
         goblin = Enemy(
             "Goblin", "A little green stinky beast with an eye for your gold", 5, cave12)
         goblin.set_conversation("Got any gold?")
@@ -175,9 +340,23 @@ class MapGraph:
 
         return new_map
 
+    def get_distances(self):
+        """Get the DistanceIndex for this map, building it if needed"""
+        if self.distances is None:
+            # only needed once someone travels, so not imported up front
+            from distance import DistanceIndex
+            self.distances = DistanceIndex(self)
+        return self.distances
+
     def random_cave(self):
         """Return a random cave"""
-        return random.choice(self.cave_data[1:])
+        # pick a number rather than slicing cave_data, which would copy (or
+        # load) every cave on large maps
+        return self.cave_data[self.rng.randrange(1, self.size)]
+
+    def caves_with(self, role):
+        """Get the caves with a character of a role (e.g. character.BOSS), in number order"""
+        return [self.cave_data[num] for num in self.roles.caves_with(role)]
 
     def get_cave(self, num):
         """Get a cave by number"""
@@ -195,7 +374,7 @@ class MapGraph:
         if a >= self.size or b >= self.size:
             return False
 
-        return self.matrix[a][b] == 1
+        return self.links.has_edge(a, b)
 
     def linked_caves(self, cave):
         """Return all the caves linked to the provided cave
@@ -203,14 +382,5 @@ class MapGraph:
         Pass a Cave instance, and returns a list of Cave instances
         """
 
-        # Find linked caves
-        links = self.matrix[cave.num]
-
-        linked_caves = []
-        for (i, link) in enumerate(links):
-            # for every link that is valid (== 1)
-            if link == 1:
-                # find that cave and append it to the linked_caves list
-                linked_caves.append(self.cave_data[i])
-
-        return linked_caves
+        # Find linked caves and look each one up
+        return [self.cave_data[i] for i in self.links.neighbours(cave.num)]
@@ -0,0 +1,448 @@
+# Compact binary map files, loaded lazily with mmap
+
+from map import MapGraph, RoleIndex
+from cave import Cave, Shop
+from item import Item, CATALOG
+from character import Enemy, Friendly, Boss, Ninja
+from character import ENEMY, BOSS, NINJA, FRIENDLY
+
+# stdlib
+from array import array
+from bisect import bisect_right
+import mmap
+import struct
+import sys
+
+# File layout (all numbers little-endian):
+#
+#   header       magic, version, map size and the (offset, length) of every
+#                section below, in order
+#   str_index    u32[strings + 1], start of each string in str_blob
+#   str_blob     UTF-8 text of every distinct string, back to back
+#   cave_kind    u8[size], one of the CAVE_* kinds below
+#   cave_name    u32[size], string IDs
+#   cave_desc    u32[size], string IDs
+#   link_index   u32[size + 1], start of each cave's links in links
+#   links        u32[], linked cave numbers, sorted per cave
+#   ent_index    u32[size + 1], start of each cave's characters in entities
+#   entities     ENTITY records
+#   items        ITEM records
+#   stock_index  u32[size + 1], start of each shop's stock in stock
+#   stock        u32[], item IDs
+#
+# Sections start on 8 byte boundaries so they can be viewed in place.
+
+MAGIC = b"SHGM"
+VERSION = 1
+NONE = 0xFFFFFFFF  # ID used for missing strings and items
+
+SECTIONS = ["str_index", "str_blob", "cave_kind", "cave_name", "cave_desc", "link_index",
+            "links", "ent_index", "entities", "items", "stock_index", "stock"]
+HEADER = struct.Struct("<4sHxxI" + "QQ" * len(SECTIONS))
+
+# kind, name, description, health, total health, weakness, conversation, drop
+ENTITY = struct.Struct("<B3xIIiiIII")
+# name, emoji, description, cost, damage
+ITEM = struct.Struct("<IIIii")
+
+CAVE_NONE = 0
+CAVE_CAVE = 1
+CAVE_SHOP = 2
+
+ENTITY_ENEMY = 1
+ENTITY_BOSS = 2
+ENTITY_NINJA = 3
+ENTITY_FRIENDLY = 4
+
+
+# character role -> ENTITY_* kind
+ROLE_KINDS = {
+    ENEMY: ENTITY_ENEMY,
+    BOSS: ENTITY_BOSS,
+    NINJA: ENTITY_NINJA,
+    FRIENDLY: ENTITY_FRIENDLY,
+}
+
+
+def _entity_kind(character):
+    """Return the ENTITY_* kind for a character"""
+    kind = ROLE_KINDS.get(character.role)
+    if kind is None:
+        raise ValueError(f"Can't save character '{character.name}' of type {type(character).__name__}")
+    return kind
+
+
+def _u32s(values):
+    """Convert an array of u32s to little-endian bytes"""
+    if sys.byteorder != "little":
+        values = array("I", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def save_map(map, path):
+    """Write a MapGraph to a binary map file at `path`
+
+    Every cave is written, so a lazily loaded map will be fully loaded.
+    """
+    # strings and items are only stored once, however often they're used
+    string_ids = {}
+    str_index = array("I", [0])
+    str_blob = bytearray()
+
+    def string_id(text):
+        if text is None:
+            return NONE
+        found = string_ids.get(text)
+        if found is None:
+            found = string_ids[text] = len(string_ids)
+            str_blob.extend(text.encode("utf-8"))
+            str_index.append(len(str_blob))
+        return found
+
+    item_ids = {}
+    items = bytearray()
+
+    def item_id(item):
+        if item is None:
+            return NONE
+        key = (item.name, item.emoji, item.description, item.cost, item.damage)
+        found = item_ids.get(key)
+        if found is None:
+            found = item_ids[key] = len(item_ids)
+            items.extend(ITEM.pack(string_id(item.name), string_id(item.emoji),
+                                   string_id(item.description), item.cost, item.damage))
+        return found
+
+    size = map.size
+    cave_kind = bytearray(size)
+    cave_name = array("I", [NONE]) * size
+    cave_desc = array("I", [NONE]) * size
+    link_index = array("I", [0])
+    links = array("I")
+    ent_index = array("I", [0])
+    entities = bytearray()
+    stock_index = array("I", [0])
+    stock = array("I")
+
+    for num in range(size):
+        links.extend(map.links.neighbours(num))
+        link_index.append(len(links))
+
+        cave = map.get_cave(num)
+        if cave is not None:
+            cave_kind[num] = CAVE_SHOP if isinstance(cave, Shop) else CAVE_CAVE
+            cave_name[num] = string_id(cave.name)
+            cave_desc[num] = string_id(cave.description)
+
+            for character in cave.get_characters():
+                kind = _entity_kind(character)
+                if kind == ENTITY_FRIENDLY:
+                    health = total_health = 0
+                    weakness = drop = None
+                else:
+                    health, total_health = character.health, character.total_health
+                    weakness, drop = character.weakness_item_name, character.drop
+                entities.extend(ENTITY.pack(
+                    kind, string_id(character.name), string_id(character.description),
+                    health, total_health, string_id(weakness),
+                    string_id(character.conversation), item_id(drop)))
+
+            if isinstance(cave, Shop):
+                for item in cave.for_sale:
+                    stock.extend([item_id(item)] * cave.for_sale.count(item))
+        ent_index.append(len(entities) // ENTITY.size)
+        stock_index.append(len(stock))
+
+    sections = {
+        "str_index": _u32s(str_index),
+        "str_blob": bytes(str_blob),
+        "cave_kind": bytes(cave_kind),
+        "cave_name": _u32s(cave_name),
+        "cave_desc": _u32s(cave_desc),
+        "link_index": _u32s(link_index),
+        "links": _u32s(links),
+        "ent_index": _u32s(ent_index),
+        "entities": bytes(entities),
+        "items": bytes(items),
+        "stock_index": _u32s(stock_index),
+        "stock": _u32s(stock),
+    }
+
+    # work out where each section goes, padded to 8 bytes
+    placement = []
+    offset = HEADER.size
+    for name in SECTIONS:
+        offset += -offset % 8
+        placement.extend((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, size, *placement))
+        for name in SECTIONS:
+            file.write(b"\0" * (-file.tell() % 8))
+            file.write(sections[name])
+
+
+class MapFile:
+    """A map file opened with mmap. Nothing is parsed until it is asked for"""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            # the mapping stays valid after the file is closed
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.mmap) < HEADER.size:
+            raise ValueError(f"'{path}' is not a map file")
+        magic, version, self.size, *placement = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a map file")
+        if version != VERSION:
+            raise ValueError(f"'{path}' is map file version {version}, expected {VERSION}")
+
+        data = memoryview(self.mmap)
+        views = {}
+        for (i, name) in enumerate(SECTIONS):
+            offset, length = placement[i * 2], placement[i * 2 + 1]
+            views[name] = data[offset:offset + length]
+
+        self.str_blob = views["str_blob"]
+        self.cave_kind = views["cave_kind"]
+        self.entities = views["entities"]
+        self.items = views["items"]
+        self.str_index = self.__u32s(views["str_index"])
+        self.cave_name = self.__u32s(views["cave_name"])
+        self.cave_desc = self.__u32s(views["cave_desc"])
+        self.link_index = self.__u32s(views["link_index"])
+        self.links = self.__u32s(views["links"])
+        self.ent_index = self.__u32s(views["ent_index"])
+        self.stock_index = self.__u32s(views["stock_index"])
+        self.stock = self.__u32s(views["stock"])
+
+        # decoded strings, so caves loaded later share the same str objects
+        self.strings = {}
+        # item ID -> ItemDefinition in the catalog
+        self.definitions = {}
+
+    def __u32s(self, view):
+        """View a section as u32s in place, or copy it on big-endian machines"""
+        if sys.byteorder == "little":
+            return view.cast("I")
+        values = array("I", view)
+        values.byteswap()
+        return values
+
+    def string(self, string_id):
+        """Decode a string by ID"""
+        if string_id == NONE:
+            return None
+        text = self.strings.get(string_id)
+        if text is None:
+            start, end = self.str_index[string_id], self.str_index[string_id + 1]
+            text = self.strings[string_id] = str(self.str_blob[start:end], "utf-8")
+        return text
+
+    def neighbours(self, num):
+        """Return the numbers of the caves linked to `num`, in ascending order"""
+        return self.links[self.link_index[num]:self.link_index[num + 1]].tolist()
+
+    def caves_with_kind(self, kind):
+        """Return the numbers of the caves with an ENTITY_* kind of character, in ascending order"""
+        # the kind is the first byte of each entity record
+        kinds = bytes(self.entities[::ENTITY.size])
+        found = []
+        i = kinds.find(kind)
+        while i != -1:
+            # the cave whose range of entities holds entity i
+            num = bisect_right(self.ent_index, i) - 1
+            if not found or found[-1] != num:
+                found.append(num)
+            i = kinds.find(kind, i + 1)
+        return found
+
+    def item(self, item_id):
+        """Make a new Item by ID"""
+        if item_id == NONE:
+            return None
+        definition = self.definitions.get(item_id)
+        if definition is None:
+            name, emoji, description, cost, damage = ITEM.unpack_from(self.items, item_id * ITEM.size)
+            definition = self.definitions[item_id] = CATALOG.define(
+                self.string(name), self.string(emoji), self.string(description), cost, damage)
+        return Item.from_definition(definition)
+
+    def cave(self, num, map):
+        """Build the Cave with number `num`, along with its characters and stock"""
+        kind = self.cave_kind[num]
+        if kind == CAVE_NONE:
+            return None
+
+        description = self.string(self.cave_desc[num])
+        if kind == CAVE_SHOP:
+            cave = Shop(num, description, map)
+            for i in range(self.stock_index[num], self.stock_index[num + 1]):
+                cave.add_shop_item(self.item(self.stock[i]))
+        else:
+            cave = Cave(num, self.string(self.cave_name[num]), description, map)
+
+        for i in range(self.ent_index[num], self.ent_index[num + 1]):
+            kind, name, description, health, total_health, weakness, conversation, drop = \
+                ENTITY.unpack_from(self.entities, i * ENTITY.size)
+            if kind == ENTITY_ENEMY:
+                character = Enemy(self.string(name), self.string(description), total_health, cave)
+            elif kind == ENTITY_BOSS:
+                character = Boss(self.string(name), self.string(description), cave)
+            elif kind == ENTITY_NINJA:
+                character = Ninja(cave)
+            else:
+                character = Friendly(self.string(name), self.string(description), cave)
+
+            if kind != ENTITY_FRIENDLY:
+                character.health = health
+                character.total_health = total_health
+                character.set_weakness(self.string(weakness))
+                character.set_drop(self.item(drop))
+            character.set_conversation(self.string(conversation))
+            cave.add_character(character)
+
+        return cave
+
+
+class MappedLinks:
+    """A MapGraph backend that reads links straight out of a map file
+
+    Links added after loading are kept in memory on top of the file's links.
+    """
+
+    name = "mapped"
+
+    def __init__(self, map_file):
+        self.file = map_file
+        self.size = map_file.size
+        self.added = {}  # cave number -> sorted list of extra links
+
+    def grow(self, new_size):
+        self.size = max(self.size, new_size)
+
+    def add_edge(self, a, b):
+        if self.has_edge(a, b):
+            return  # already linked
+        for (x, y) in ((a, b), (b, a)):
+            extra = self.added.setdefault(x, [])
+            extra.append(y)
+            extra.sort()
+
+    def has_edge(self, a, b):
+        return b in self.neighbours(a)
+
+    def neighbours(self, a):
+        """Return the numbers of all the caves linked to `a`, in ascending order"""
+        linked = self.file.neighbours(a) if a < self.file.size else []
+        extra = self.added.get(a)
+        if extra:
+            linked = sorted(linked + extra)
+        return linked
+
+    # a BFS can look up neighbours on this directly rather than copying
+    # every cave's links into a list first
+    __getitem__ = neighbours
+
+    def adjacency_lists(self):
+        """Return an object that can be indexed by cave number for its neighbours"""
+        return self
+
+
+class LazyCaves:
+    """Stands in for MapGraph.cave_data, building each Cave on first access"""
+
+    def __init__(self, map_file, map):
+        self.file = map_file
+        self.map = map
+        self.size = map_file.size
+        self.loaded = {}  # cave number -> Cave (or None)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, num):
+        if num < 0:
+            num += self.size
+        if not 0 <= num < self.size:
+            raise IndexError("cave number out of range")
+
+        if num in self.loaded:
+            return self.loaded[num]
+        cave = None
+        if num < self.file.size:
+            cave = self.file.cave(num, self.map)
+        self.loaded[num] = cave
+        return cave
+
+    def __setitem__(self, num, cave):
+        self.loaded[num] = cave
+
+    def extend(self, caves):
+        """Grow the list, new slots are set to whatever is in `caves`"""
+        for cave in caves:
+            self.loaded[self.size] = cave
+            self.size += 1
+
+
+class MappedRoles(RoleIndex):
+    """A MapGraph role index for a lazily loaded map
+
+    Caves that have been loaded are indexed as usual when their characters
+    are added; the rest are looked up in the file's entities, which are only
+    scanned (once per role) when first asked about.
+    """
+
+    def __init__(self, map_file, caves):
+        super().__init__()
+        self.file = map_file
+        self.caves = caves
+        self.in_file = {}  # role -> cave numbers with that role in the file
+
+    def caves_with(self, role):
+        in_file = self.in_file.get(role)
+        if in_file is None:
+            kind = ROLE_KINDS.get(role)
+            in_file = self.in_file[role] = self.file.caves_with_kind(kind) if kind is not None else []
+        found = set(self.counts.get(role, ()))
+        found.update(num for num in in_file if num not in self.caves.loaded)
+        return sorted(found)
+
+
+def load_map(game, path):
+    """Open a map file as a MapGraph without loading any caves up front"""
+    map_file = MapFile(path)
+    new_map = MapGraph(game, map_file.size, MappedLinks(map_file))
+    new_map.cave_data = LazyCaves(map_file, new_map)
+    new_map.roles = MappedRoles(map_file, new_map.cave_data)
+    return new_map
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Write a map to a binary map file")
+    parser.add_argument("path", help="where to write the map file")
+    parser.add_argument("--size", type=int, default=None,
+                        help="generate a procedural map with this many caves (default: the built-in map)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.size is None:
+        world = MapGraph.generate(None)
+    else:
+        from generator import ProceduralGenerator
+        world = ProceduralGenerator(args.size, seed=args.seed).generate(None)
+    generated = time.perf_counter()
+    save_map(world, args.path)
+    saved = time.perf_counter()
+    load_map(None, args.path)
+    loaded = time.perf_counter()
+
+    print(f"Generated in {generated - started:.3f}s, saved in {saved - generated:.3f}s, "
+          f"loaded in {loaded - saved:.4f}s")
@@ -0,0 +1,99 @@
+# Buffered output: one write per screen update
+#
+# The game prints a screen (status message, menu, box...) a line at a time,
+# and on a terminal each print() ends up as its own write to the terminal.
+# Output collects everything printed and sends it in one write when it's
+# flushed, which happens before the game waits for input (input() and
+# display.confirm flush stdout first). Stats counts what was asked for and
+# what was actually sent, so the saving can be seen.
+
+# stdlib
+import sys
+
+
+class Stats:
+    """How many writes and bytes were asked for, and how many were actually sent"""
+
+    def __init__(self):
+        self.writes = 0  # write() calls made by the game
+        self.bytes = 0
+        self.sent_writes = 0  # writes made to the terminal (or socket)
+        self.sent_bytes = 0
+
+    def asked(self, data):
+        """Count a write the game asked for, of text or bytes"""
+        self.writes += 1
+        self.bytes += len(data.encode("utf-8", "replace") if isinstance(data, str) else data)
+
+    def sent(self, data):
+        """Count a write actually made, of text or bytes"""
+        self.sent_writes += 1
+        self.sent_bytes += len(data.encode("utf-8", "replace") if isinstance(data, str) else data)
+
+    def add(self, other):
+        """Add another Stats' counts to these ones"""
+        self.writes += other.writes
+        self.bytes += other.bytes
+        self.sent_writes += other.sent_writes
+        self.sent_bytes += other.sent_bytes
+
+    @property
+    def writes_saved(self):
+        return self.writes - self.sent_writes
+
+    @property
+    def bytes_saved(self):
+        return self.bytes - self.sent_bytes
+
+    def summary(self):
+        """Describe the counts, as a list of lines"""
+        return [
+            f"Writes: {self.writes} asked for, {self.sent_writes} sent ({self.writes_saved} saved)",
+            f"Bytes: {self.bytes} asked for, {self.sent_bytes} sent ({self.bytes_saved} saved)",
+        ]
+
+
+class Output:
+    """A file-like stand-in for sys.stdout that holds on to what's written until it's flushed
+
+    Everything written between two flushes goes to the stream in a single
+    write. Nothing is split or reordered. When nobody is waiting to read the
+    output (see display.start_batch), `hold` can be set so that flushes are
+    skipped until that many characters are waiting.
+    """
+
+    def __init__(self, stream=None, stats=None):
+        self.stream = stream if stream is not None else sys.__stdout__
+        self.stats = stats if stats is not None else Stats()
+        self.pending = []
+        self.pending_size = 0
+        self.hold = 0
+
+    def write(self, text):
+        self.stats.asked(text)
+        self.pending.append(text)
+        self.pending_size += len(text)
+        return len(text)
+
+    def flush(self):
+        if self.pending_size < self.hold:
+            return
+        if self.pending:
+            text = "".join(self.pending)
+            self.pending.clear()
+            self.pending_size = 0
+            self.stats.sent(text)
+            self.stream.write(text)
+        self.stream.flush()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    @property
+    def closed(self):
+        # checked by Python before its last flush at exit
+        return self.stream.closed
+
+    @property
+    def encoding(self):
+        return getattr(self.stream, "encoding", None) or "utf-8"
@@ -0,0 +1,260 @@
+# Per-command profiling
+#
+# A Profiler times every command the Game runs, split into the time spent in
+# game logic, rendering (printing events and the status message) and waiting
+# for input (menus, confirmations, "Press Enter"...), and counts the bytes
+# the command printed and the game events it caused. Each measurement goes
+# into a histogram per command, which can be exported to a JSON file every
+# so often and read back with:
+#
+#   python src/main.py --profile profile.json
+#   python src/profiler.py show profile.json
+#
+# Profiling is off unless a Profiler is started (Game.profiler is None), and
+# then all the game pays is one attribute check per hook.
+
+# stdlib
+import json
+import os
+import sys
+import time
+
+# what's measured for every command, times in microseconds
+MEASURES = ("wall", "logic", "render", "input", "bytes", "events")
+PHASES = ("logic", "render", "input")
+
+
+class Histogram:
+    """Counts of non-negative whole numbers, in power-of-two buckets
+
+    Bucket n holds the values that are n bits long, i.e. 0, 1, 2-3, 4-7...
+    so percentiles are only known to within a factor of two, but adding a
+    value is cheap and the histogram stays small whatever it holds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.buckets = []
+
+    def add(self, value):
+        value = int(value)
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        bucket = value.bit_length()
+        if bucket >= len(self.buckets):
+            self.buckets.extend([0] * (bucket + 1 - len(self.buckets)))
+        self.buckets[bucket] += 1
+
+    def percentile(self, percent):
+        """The upper bound of the bucket holding the given percentile, None if empty"""
+        if not self.count:
+            return None
+        wanted = self.count * percent / 100
+        seen = 0
+        for (bucket, count) in enumerate(self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min((1 << bucket) - 1, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {"count": self.count, "total": self.total, "min": self.min, "max": self.max,
+                "buckets": self.buckets}
+
+    @staticmethod
+    def from_dict(saved):
+        histogram = Histogram()
+        histogram.count = saved["count"]
+        histogram.total = saved["total"]
+        histogram.min = saved["min"]
+        histogram.max = saved["max"]
+        histogram.buckets = list(saved["buckets"])
+        return histogram
+
+
+class Profiler:
+    """Times the commands a Game runs, see start_profiling
+
+    The Game calls start_command when a command starts and finish_command
+    once it's done, including redrawing the status message after it. In
+    between, enter/leave switch between the phases (logic, render, input)
+    so each moment is counted in exactly one of them.
+    """
+
+    def __init__(self, path=None, export_every=60.0, stats=None):
+        self.path = path  # where export writes to, if anywhere
+        self.export_every = export_every  # seconds between exports, None for only when asked
+        self.stats = stats  # output.Stats to count bytes from, if any
+        # command name -> {measure: Histogram}
+        self.histograms = {}
+        self.exported = time.perf_counter()
+
+        self.command = None  # the name of the command being run
+        self.phase = None
+        self.phase_started = 0.0
+        self.spent = dict.fromkeys(PHASES, 0.0)
+        self.started = 0.0
+        self.bytes = 0
+        self.events = 0
+
+    def start_command(self, name):
+        if self.command is not None:
+            self.finish_command()
+        now = time.perf_counter()
+        self.command = name
+        self.started = now
+        self.phase = "logic"
+        self.phase_started = now
+        for phase in PHASES:
+            self.spent[phase] = 0.0
+        self.bytes = self.stats.bytes if self.stats is not None else 0
+        self.events = 0
+
+    def enter(self, phase):
+        """Start counting time as `phase`, returning the phase to go back to with leave"""
+        previous = self.phase
+        if previous is not None and previous != phase:
+            now = time.perf_counter()
+            self.spent[previous] += now - self.phase_started
+            self.phase = phase
+            self.phase_started = now
+        return previous
+
+    def leave(self, previous):
+        """Go back to the phase enter returned"""
+        if self.phase is not None and previous is not None:
+            self.enter(previous)
+
+    def count_events(self, happened):
+        """EventBus subscriber counting the events the command caused"""
+        self.events += len(happened)
+
+    def finish_command(self):
+        """Record the command being run, if there is one"""
+        if self.command is None:
+            return
+        now = time.perf_counter()
+        self.spent[self.phase] += now - self.phase_started
+        measures = self.histograms.get(self.command)
+        if measures is None:
+            measures = self.histograms[self.command] = {measure: Histogram() for measure in MEASURES}
+        measures["wall"].add((now - self.started) * 1_000_000)
+        for phase in PHASES:
+            measures[phase].add(self.spent[phase] * 1_000_000)
+        if self.stats is not None:
+            measures["bytes"].add(self.stats.bytes - self.bytes)
+        measures["events"].add(self.events)
+        self.command = None
+        self.phase = None
+
+        if self.export_every is not None and self.path is not None \
+                and now - self.exported >= self.export_every:
+            self.export()
+
+    def to_dict(self):
+        return {command: {measure: histogram.to_dict() for (measure, histogram) in measures.items()}
+                for (command, measures) in self.histograms.items()}
+
+    def export(self, path=None):
+        """Write the histograms to a JSON file, replacing it"""
+        path = path if path is not None else self.path
+        self.exported = time.perf_counter()
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"exported": time.time(), "commands": self.to_dict()}, file)
+        os.replace(temporary, path)
+
+    def summary(self):
+        return summary(self.histograms)
+
+
+def summary(histograms):
+    """Describe {command: {measure: Histogram}}, as a list of lines"""
+    lines = [f"{'command':<12}{'count':>8}  {'measure':<8}{'mean':>10}{'p50':>10}{'p99':>10}{'max':>10}"]
+    for (command, measures) in sorted(histograms.items(), key=lambda item: -item[1]["wall"].total):
+        # exports from before a measure was added don't have it
+        for (i, measure) in enumerate(measure for measure in MEASURES if measure in measures):
+            histogram = measures[measure]
+            unit = {"bytes": "B", "events": ""}.get(measure, "us")
+            numbers = (histogram.mean, histogram.percentile(50), histogram.percentile(99), histogram.max)
+            line = f"{command if i == 0 else '':<12}{histogram.count if i == 0 else '':>8}  {measure:<8}" \
+                + "".join(f"{number:>8.0f}{unit:<2}" if number is not None else f"{'-':>10}" for number in numbers)
+            lines.append(line.rstrip())
+    return lines
+
+
+class TimedInput:
+    """Stands in for sys.stdin, counting time spent waiting for a line as input"""
+
+    def __init__(self, stream, profiler):
+        self.stream = stream
+        self.profiler = profiler
+
+    def readline(self, *args):
+        previous = self.profiler.enter("input")
+        try:
+            return self.stream.readline(*args)
+        finally:
+            self.profiler.leave(previous)
+
+    def read(self, *args):
+        return self.stream.read(*args)
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    @property
+    def encoding(self):
+        return getattr(self.stream, "encoding", None) or "utf-8"
+
+
+def start_profiling(game, path=None, export_every=60.0):
+    """Profile a game's commands, returning the Profiler
+
+    Counts bytes printed if sys.stdout keeps output.Stats (see
+    display.set_renderer). Replaces sys.stdin, so call it after
+    display.start_line_editor.
+    """
+    profiler = Profiler(path, export_every, getattr(sys.stdout, "stats", None))
+    game.profiler = profiler
+    game.bus.subscribe(profiler.count_events)
+    sys.stdin = TimedInput(sys.stdin, profiler)
+    return profiler
+
+
+def read_export(path):
+    """Read the histograms written by Profiler.export"""
+    with open(path, encoding="utf-8") as file:
+        saved = json.load(file)
+    try:
+        return {command: {measure: Histogram.from_dict(histogram) for (measure, histogram) in measures.items()}
+                for (command, measures) in saved["commands"].items()}
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError(f"'{path}' is not a profile")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect exported command profiles")
+    commands = parser.add_subparsers(dest="action", required=True)
+    show_parser = commands.add_parser("show", help="print a table of an exported profile")
+    show_parser.add_argument("path")
+    args = parser.parse_args()
+
+    print("\n".join(summary(read_export(args.path))))
+
+
+if __name__ == "__main__":
+    main()
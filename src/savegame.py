@@ -0,0 +1,155 @@
+# Saving and loading games
+#
+# A save doesn't hold the whole world, only how it differs from the world
+# the game started from: the player (cave, purse, items...) plus the caves
+# the player has changed, i.e. fought in or bought from (Engine.touched).
+# Loading builds the starting world again, from the built-in map or the
+# same world template, and puts those caves back the way they were saved.
+# So saving costs the same on a huge map as a small one, and is cheap
+# enough to do after every command that changes something.
+#
+# Saves are JSON, written to a temporary file and then renamed over the
+# old save, so a crash mid-save leaves the previous save intact.
+
+from engine import Engine
+from character import Enemy, Boss, Ninja, Friendly, ROLES
+from cave import Shop
+from item import Item, CATALOG
+from inventory import Inventory
+
+# stdlib
+import json
+import os
+
+VERSION = 2
+
+
+def _item(item):
+    if item is None:
+        return None
+    return [item.name, item.emoji, item.description, item.cost, item.damage]
+
+
+def _load_item(saved):
+    if saved is None:
+        return None
+    (name, emoji, description, cost, damage) = saved
+    return Item.from_definition(CATALOG.define(name, emoji, description, cost, damage))
+
+
+def _character(character):
+    saved = {"name": character.name, "description": character.description,
+             "conversation": character.conversation}
+    if character.role not in ROLES:
+        raise ValueError(f"Can't save character '{character.name}' of type {type(character).__name__}")
+    saved["kind"] = character.role
+    if isinstance(character, Enemy):
+        saved.update(health=character.health, total_health=character.total_health,
+                     weakness=character.weakness_item_name, drop=_item(character.drop))
+    return saved
+
+
+def _load_character(saved, cave):
+    match saved["kind"]:
+        case "boss":
+            character = Boss(saved["name"], saved["description"], cave)
+        case "ninja":
+            character = Ninja(cave)
+        case "enemy":
+            character = Enemy(saved["name"], saved["description"], saved["total_health"], cave)
+        case "friendly":
+            character = Friendly(saved["name"], saved["description"], cave)
+        case kind:
+            raise ValueError(f"Unknown character kind '{kind}' in save")
+    if isinstance(character, Enemy):
+        character.health = saved["health"]
+        character.total_health = saved["total_health"]
+        character.set_weakness(saved["weakness"])
+        character.set_drop(_load_item(saved["drop"]))
+    character.set_conversation(saved["conversation"])
+    return character
+
+
+def snapshot(engine, world=None):
+    """Everything needed to restore a game, as JSON-ready data
+
+    `world` is the path of the world template the game started from, None
+    for the built-in map.
+    """
+    caves = {}
+    for num in sorted(engine.touched):
+        cave = engine.map.get_cave(num)
+        saved = {"characters": [_character(character) for character in cave.characters]}
+        if isinstance(cave, Shop):
+            saved["stock"] = [[_item(item), cave.for_sale.count(item)] for item in cave.for_sale]
+        caves[str(num)] = saved
+
+    return {
+        "version": VERSION,
+        "world": world,
+        "cave": engine.current_cave.num,
+        "purse": engine.purse,
+        "items": [_item(item) for item in engine.items],
+        "alive": engine.alive,
+        "won": engine.won,
+        "unclaimed_drop": _item(engine.unclaimed_drop),
+        "caves": caves,
+    }
+
+
+def save(engine, path, world=None, durable=False):
+    """Save a game to a file, replacing any earlier save there
+
+    With durable=True the save is synced to disk before it replaces the old
+    one, which survives power cuts too but costs a lot more per save.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(snapshot(engine, world), file, separators=(",", ":"), ensure_ascii=False)
+        if durable:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def restore(engine, saved):
+    """Put a freshly built engine's game back to a snapshot"""
+    if saved.get("version") != VERSION:
+        raise ValueError(f"Save is version {saved.get('version')}, expected {VERSION}")
+
+    world = engine.map
+    for (num, saved_cave) in saved["caves"].items():
+        cave = world.get_cave(int(num))
+        if cave is None:
+            raise ValueError(f"Save has cave {num}, which isn't in this world")
+        cave.clear_characters()
+        for saved_character in saved_cave["characters"]:
+            cave.add_character(_load_character(saved_character, cave))
+        if isinstance(cave, Shop):
+            cave.clear_shop_items()
+            for (saved_item, count) in saved_cave.get("stock", []):
+                cave.add_shop_item(_load_item(saved_item), count)
+        engine.touched.add(cave.num)
+
+    engine.current_cave = world.get_cave(saved["cave"])
+    if engine.current_cave is None:
+        raise ValueError(f"Save is in cave {saved['cave']}, which isn't in this world")
+    engine.purse = saved["purse"]
+    engine.items = Inventory(_load_item(item) for item in saved["items"])
+    engine.alive = saved["alive"]
+    engine.won = saved["won"]
+    engine.unclaimed_drop = _load_item(saved["unclaimed_drop"])
+
+
+def load(path, seed=None):
+    """Load a saved game, returning (engine, world template path or None)"""
+    with open(path, encoding="utf-8") as file:
+        saved = json.load(file)
+    world = saved.get("world")
+    if world is None:
+        engine = Engine(seed=seed)
+    else:
+        import contentpack
+        engine = Engine(lambda engine: contentpack.load_world(engine, world), seed=seed)
+    restore(engine, saved)
+    return engine, world
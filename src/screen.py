@@ -0,0 +1,401 @@
+# Diff-based screen renderer
+#
+# Normally every new screen (status message, alert box...) is drawn by
+# clearing the terminal and printing everything again. In diff mode sys.stdout
+# is replaced with a Screen, which keeps a model of what's on the terminal.
+# display.clear() starts a new frame, the game prints into it as usual, and
+# when the output is flushed (e.g. before waiting for input) only the rows
+# that changed are sent, each with a cursor move in front. Rows that start
+# the same as before only have the part after the common start sent.
+#
+# The player's typing is echoed by the terminal, not printed by us, so reads
+# go through ScreenInput to let the Screen know which row the echo landed on.
+# If a frame gets taller than the terminal it scrolls and the model no longer
+# matches, so the Screen gives up and prints normally until the next frame.
+
+import width
+import output
+
+# stdlib
+import re
+import shutil
+import sys
+
+# escape sequences the model understands, plus anything else ANSI
+TOKEN = re.compile(r"\x1b\[([0-9;?]*)([A-Za-z])|\x1b\][^\x07]*\x07|[\r\n]|[^\x1b\r\n]+|\x1b")
+
+# don't bother moving the cursor past a common start shorter than this
+MIN_SKIP = 8
+
+
+class Tainted:
+    """A row of the terminal we don't know the contents of, e.g. where the player typed"""
+
+    def __repr__(self):
+        return "<tainted>"
+
+
+def _pieces(row):
+    """Split a row into (text, columns) pieces: escape sequences, and single characters"""
+    for match in TOKEN.finditer(row):
+        token = match.group()
+        if token[0] == "\x1b":
+            yield token, 0
+        else:
+            for char in token:
+                yield char, width.char_width(char)
+
+
+def _cut(row, col):
+    """The part of a row before column `col`, padded with spaces if the row is shorter"""
+    kept = []
+    columns = 0
+    for (text, text_columns) in _pieces(row):
+        if text_columns and columns + text_columns > col:
+            break
+        kept.append(text)
+        columns += text_columns
+    return "".join(kept) + " " * (col - columns)
+
+
+def _skip(row, col):
+    """The part of a row from column `col` on, keeping any styling from before it"""
+    kept = []
+    columns = 0
+    for (text, text_columns) in _pieces(row):
+        if columns >= col or not text_columns:
+            kept.append(text)
+        columns += text_columns
+    return "".join(kept)
+
+
+class Screen:
+    """A file-like stand-in for sys.stdout that only redraws what changed between frames"""
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.__stdout__
+        self.encoding = getattr(self.stream, "encoding", None) or "utf-8"
+
+        # the frame being built: rows of text (with styling) and the cursor
+        self.rows = [""]
+        self.row = 0
+        self.col = 0
+        # what the terminal is showing: (start row on the terminal, text) for each
+        # row, or None if we don't know (nothing drawn yet, or it scrolled)
+        self.shown = None
+        self.shown_cursor = None
+        # whether this frame outgrew the terminal, see flush
+        self.overflowed = False
+        self.pending = []  # output waiting for flush while overflowed
+
+        self.frames = 0
+        self.stats = output.Stats()  # what was printed, against what was sent
+
+    # ---
+    # File interface
+    # ---
+
+    def write(self, text):
+        self.stats.asked(text)
+        if self.overflowed:
+            self.pending.append(text)
+        else:
+            self.__apply(text)
+        return len(text)
+
+    def flush(self):
+        if self.overflowed:
+            self.__send("".join(self.pending))
+            self.pending.clear()
+        else:
+            self.__draw()
+        self.stream.flush()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    @property
+    def closed(self):
+        return self.stream.closed
+
+    # ---
+    # Frames
+    # ---
+
+    def begin_frame(self):
+        """Start drawing a new screen, from the top left (instead of clearing the terminal)"""
+        if self.shown is not None or self.rows != [""]:
+            self.flush()
+        self.frames += 1
+        self.rows = [""]
+        self.row = 0
+        self.col = 0
+        if self.overflowed:
+            self.overflowed = False
+            self.shown = None
+
+    def input_read(self, line):
+        """Note that the player typed a line, which the terminal echoed at the cursor"""
+        if self.overflowed or not line.endswith("\n"):
+            return
+        size = self.__terminal_size()
+        if self.shown_cursor is None or self.shown_cursor[0] + 1 >= size.lines \
+                or self.shown_cursor[1] + width.text_width(line[:-1]) >= size.columns:
+            # Enter scrolled the terminal, or we've lost track of the cursor:
+            # carry on without diffing until the next frame
+            self.overflowed = True
+            self.shown = None
+            self.shown_cursor = None
+            return
+        # the echo is now part of this row, and Enter moved the cursor down
+        tainted = Tainted()
+        self.rows[self.row] = tainted
+        if self.row < len(self.shown):
+            self.shown[self.row] = (self.shown[self.row][0], tainted)
+        self.__move(self.row + 1, 0)
+        self.shown_cursor = (self.shown_cursor[0] + 1, 0)
+
+    # ---
+    # The model of the terminal
+    # ---
+
+    def __move(self, row, col):
+        while len(self.rows) <= row:
+            self.rows.append("")
+        self.row = row
+        self.col = max(0, col)
+
+    def __current(self):
+        row = self.rows[self.row]
+        return "" if isinstance(row, Tainted) else row
+
+    def __put(self, text, columns):
+        """Write some text at the cursor, over whatever is there"""
+        row = self.__current()
+        row_width = width.text_width(row)
+        if self.col >= row_width:
+            row = row + " " * (self.col - row_width) + text
+        else:
+            row = _cut(row, self.col) + text + _skip(row, self.col + columns)
+        self.rows[self.row] = row
+        self.col += columns
+
+    def __apply(self, text):
+        for match in TOKEN.finditer(text):
+            token = match.group()
+            if token == "\n":
+                self.__move(self.row + 1, 0)
+            elif token == "\r":
+                self.col = 0
+            elif match.group(2) is not None:
+                self.__csi(token, match.group(1), match.group(2))
+            elif token[0] == "\x1b":
+                self.__put(token, 0)  # some other escape, kept as it is
+            else:
+                self.__put(token, width.text_width(token))
+
+    def __csi(self, token, params, command):
+        numbers = [int(n) if n.isdigit() else 0 for n in params.split(";")] if params else []
+        n = numbers[0] if numbers else 0
+        match command:
+            case "C":
+                self.col += max(n, 1)
+            case "D":
+                self.col = max(0, self.col - max(n, 1))
+            case "A":
+                self.__move(max(0, self.row - max(n, 1)), self.col)
+            case "B":
+                self.__move(self.row + max(n, 1), self.col)
+            case "G":
+                self.col = max(n, 1) - 1
+            case "H":
+                row = numbers[0] if len(numbers) > 0 and numbers[0] else 1
+                col = numbers[1] if len(numbers) > 1 and numbers[1] else 1
+                self.__move(row - 1, col - 1)
+            case "K" if n == 0:
+                if self.col < width.text_width(self.__current()):
+                    self.rows[self.row] = _cut(self.__current(), self.col)
+            case "K" if n == 2:
+                self.rows[self.row] = ""
+            case "J" if n == 0:
+                if self.col < width.text_width(self.__current()):
+                    self.rows[self.row] = _cut(self.__current(), self.col)
+                del self.rows[self.row + 1:]
+            case "J" if n == 2:
+                self.rows = [""] * len(self.rows)
+            case _:
+                # styling and anything else stay in the row, taking up no space
+                self.__put(token, 0)
+
+    # ---
+    # Drawing
+    # ---
+
+    def __terminal_size(self):
+        return shutil.get_terminal_size()
+
+    def __layout(self):
+        """Where each row starts on the terminal, as (start, text), allowing for long rows wrapping"""
+        columns = self.__terminal_size().columns
+        layout = []
+        start = 0
+        for row in self.rows:
+            layout.append((start, row))
+            row_width = 0 if isinstance(row, Tainted) else width.text_width(row)
+            start += max(1, -(-row_width // columns))
+        return layout
+
+    def __draw(self):
+        """Bring the terminal up to date with the frame"""
+        layout = self.__layout()
+        size = self.__terminal_size()
+        if layout[-1][0] + 1 + self.__lines(layout[-1][1], size.columns) > size.lines:
+            self.__overflow(layout, size)
+            return
+        cursor = (layout[self.row][0] + self.col // size.columns, self.col % size.columns)
+
+        if self.shown is None:
+            out = self.__redraw(layout, cursor, size.columns)
+        else:
+            out = self.__changes(layout, cursor, size.columns)
+            # when most of the screen changed, starting again can be shorter
+            if not any(isinstance(row, Tainted) for (_, row) in layout):
+                redraw = self.__redraw(layout, cursor, size.columns)
+                if len(redraw) < len(out):
+                    out = redraw
+        self.__send(out)
+        self.shown = layout
+        self.shown_cursor = cursor
+
+    def __redraw(self, layout, cursor, columns):
+        """The output to clear the terminal and draw the whole frame"""
+        rows = ["" if isinstance(row, Tainted) else row for (_, row) in layout]
+        out = "\x1b[H\x1b[J" + "\n".join(rows)
+        if cursor != self.__end(layout[-1][0], rows[-1], columns):
+            out += f"\x1b[{cursor[0] + 1};{cursor[1] + 1}H"
+        return out
+
+    def __changes(self, layout, cursor, columns):
+        """The output to turn what's shown into the frame"""
+        shown = self.shown
+        # everything below what's shown is blank
+        blank_from = shown[-1][0] + 1 + self.__lines(shown[-1][1], columns) if shown else 0
+        at = self.shown_cursor  # where the terminal's cursor is, if we know
+
+        out = []
+        for (i, (start, row)) in enumerate(layout):
+            if isinstance(row, Tainted):
+                continue
+            old = shown[i][1] if i < len(shown) and shown[i][0] == start else None
+            if not isinstance(old, str):
+                old = "" if start >= blank_from else None  # None: don't know what's there
+            if old == row:
+                continue
+
+            # the part of the row that needs sending, and the column it starts at
+            (col, text) = (0, row) if old is None else self.__changed_part(old, row)
+            if at is not None and at[0] + 1 == start and col == 0:
+                out.append("\n")  # shorter than moving the cursor
+            elif at != (start, col):
+                out.append(f"\x1b[{start + 1};{col + 1}H")
+            out.append(text)
+            # clear the rest of the row, if there might be something there
+            if old is None or width.text_width(old) > width.text_width(row) \
+                    or self.__lines(old, columns) != self.__lines(row, columns):
+                out.append("\x1b[K")
+            at = self.__end(start, row, columns)
+        end = layout[-1][0] + 1 + self.__lines(layout[-1][1], columns)
+        if end < blank_from:
+            # the frame is shorter than the last one, clear the rest
+            out.append(f"\x1b[{end + 1};1H\x1b[J")
+            at = None
+
+        if cursor != at:
+            out.append(f"\x1b[{cursor[0] + 1};{cursor[1] + 1}H")
+        return "".join(out)
+
+    def __end(self, start, row, columns):
+        """Where the cursor ends up after drawing a row from the start of a line"""
+        lines = self.__lines(row, columns)
+        return (start + lines, width.text_width(row) - lines * columns)
+
+    def __lines(self, row, columns):
+        """How many lines a row wraps onto, after the first"""
+        if isinstance(row, Tainted):
+            return 0
+        return max(0, width.text_width(row) - 1) // columns
+
+    def __changed_part(self, old, new):
+        """Return (column, text) to send to turn one row into another, skipping the start they share"""
+        same = 0
+        for (a, b) in zip(old, new):
+            if a != b:
+                break
+            same += 1
+        # don't stop halfway through an escape sequence, or split a character
+        # from the marks combined with it
+        escape = new.rfind("\x1b", 0, same)
+        if escape != -1 and not width.ANSI.match(new, escape, same):
+            same = escape
+        while 0 < same < len(new) and width.char_width(new[same]) == 0:
+            same -= 1
+        if same < MIN_SKIP:
+            return 0, new
+        # styling set in the skipped part still applies to the rest, so send it
+        # again (only colours and such, anything else is sent the long way)
+        styling = width.ANSI.findall(new, 0, same)
+        if not all(code.endswith("m") for code in styling):
+            return 0, new
+        return width.text_width(new[:same]), "".join(styling) + new[same:]
+
+    def __overflow(self, layout, size):
+        """The frame doesn't fit, so the terminal has to scroll
+
+        Draws the rows that fit as usual, then prints the rest after them
+        like plain output would, and stops diffing until the next frame.
+        """
+        fits = [(start, row) for (start, row) in layout
+                if start + self.__lines(row, size.columns) < size.lines]
+        rest = ["" if isinstance(row, Tainted) else row for (_, row) in layout[len(fits):]]
+        if not fits:
+            out = "\x1b[H\x1b[J" + "\n".join(rest)
+        else:
+            (start, last) = fits[-1]
+            end = self.__end(start, last, size.columns)
+            if self.shown is None:
+                out = self.__redraw(fits, end, size.columns)
+            else:
+                out = self.__changes(fits, end, size.columns)
+            out += "\n" + "\n".join(rest)
+        self.__send(out)
+        self.overflowed = True
+        self.shown = None
+        self.shown_cursor = None
+
+    def __send(self, text):
+        if text:
+            self.stats.sent(text)
+            self.stream.write(text)
+
+
+class ScreenInput:
+    """Wraps sys.stdin so the Screen knows when the player has typed a line"""
+
+    def __init__(self, screen, stream=None):
+        self.screen = screen
+        self.stream = stream if stream is not None else sys.__stdin__
+
+    def readline(self, *args):
+        self.screen.flush()
+        line = self.stream.readline(*args)
+        self.screen.input_read(line)
+        return line
+
+    def read(self, *args):
+        # raw keypresses, which the terminal doesn't echo
+        self.screen.flush()
+        return self.stream.read(*args)
+
+    def __getattr__(self, name):
+        # fileno, isatty... for tty/termios
+        return getattr(self.stream, name)
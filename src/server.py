@@ -0,0 +1,326 @@
+# Multi-player server: many games over TCP on one asyncio event loop
+#
+# Each connection gets its own Engine and talks to it with a simple
+# telnet-style line protocol: one command per line, e.g. "move 2" or
+# "fight 1 1". Type "help" once connected for the list of commands.
+#
+#   python src/server.py [--host 127.0.0.1] [--port 4000] [--world PATH]
+
+from engine import Engine
+from character import BOSS
+from cave import Shop
+import contentpack
+import events
+import output
+
+# stdlib
+import asyncio
+import re
+
+# telnet clients send option negotiation (IAC ...) sequences, which are
+# dropped rather than treated as commands
+TELNET_COMMAND = re.compile(rb"\xff[\xfb-\xfe].|\xff[\xf0-\xfa]", re.DOTALL)
+
+HELP = [
+    "Commands:",
+    "  look              Show where you are",
+    "  move <cave>       Move to a connected cave",
+    "  travel <cave>     Travel to any cave you can reach",
+    "  fight             List who you can fight, and with what",
+    "  fight <who> <item>",
+    "  talk [who]        List who you can talk to, or talk to them",
+    "  shop              List the items for sale here",
+    "  buy <item>        Buy an item from the shop",
+    "  inv               Check your items and money",
+    "  continue          Carry on exploring after defeating the boss",
+    "  quit              Leave the game",
+]
+
+
+class Session:
+    """One connected player and their game"""
+
+    def __init__(self, reader, writer, engine, stats=None):
+        self.reader = reader
+        self.writer = writer
+        self.engine = engine
+        self.stats = stats if stats is not None else output.Stats()
+        self.pending = []  # lines waiting for flush
+
+    def send(self, lines):
+        """Queue some lines for the player, flush sends them"""
+        self.stats.asked(("\r\n".join(lines) + "\r\n").encode("utf-8"))
+        self.pending.extend(lines)
+
+    async def flush(self):
+        """Send the queued lines to the player, in one write
+
+        Waits until the client has taken the data if its buffer is full, so
+        a client that stops reading can't make the server buffer output
+        forever; it just stops being served.
+        """
+        if not self.pending:
+            return
+        data = ("\r\n".join(self.pending) + "\r\n").encode("utf-8")
+        self.pending.clear()
+        self.stats.sent(data)
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def run(self):
+        self.send(["", "Welcome to the Shogunate's Caverns! Type 'help' for a list of commands.", ""])
+        self.send(self.status())
+
+        while True:
+            # the reply to the last command goes out with the prompt
+            self.send([self.prompt()])
+            await self.flush()
+            try:
+                data = await self.reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                self.send(["That line is too long, goodbye!"])
+                await self.flush()
+                return
+            if not data:
+                return  # client disconnected
+
+            line = TELNET_COMMAND.sub(b"", data).decode("utf-8", "replace").strip()
+            if not line:
+                continue
+            if line == "quit":
+                self.send(["Thank you for playing Shogunate's Caverns!"])
+                await self.flush()
+                return
+
+            self.send(self.handle(line))
+
+    def prompt(self):
+        return "> "
+
+    # ---
+    # Turning commands and events into text
+    # ---
+
+    def handle(self, line):
+        """Carry out a command, returning the lines to send back"""
+        command, _, arg = line.partition(" ")
+        engine = self.engine
+        match (command, arg.strip()):
+            case ("help", _):
+                return HELP
+            case ("look", _):
+                return self.status()
+            case ("inv", _):
+                return self.inventory()
+            case ("fight", ""):
+                blocked = engine.fight_blocked()
+                if blocked is not None:
+                    return self.describe([blocked])
+                return (["Characters:"] + self.numbered(self.character_label(c) for c in engine.current_cave.characters)
+                        + ["Items:"] + self.numbered(self.item_label(engine, item) for item in engine.items.kinds())
+                        + ["Fight with 'fight <character> <item>'"])
+            case ("talk", ""):
+                blocked = engine.talk_blocked()
+                if blocked is not None:
+                    return self.describe([blocked])
+                return (self.numbered(self.character_label(c) for c in engine.current_cave.characters)
+                        + ["Talk with 'talk <character>'"])
+            case ("shop", _):
+                blocked = engine.shop_blocked()
+                if blocked is not None:
+                    return self.describe([blocked])
+                return ([f"You have ${engine.purse} | The following items are for sale:"]
+                        + self.numbered(f"{item.emoji} {item.name} (${item.cost}) - {item.description}"
+                                        for item in engine.current_cave.for_sale)
+                        + ["Buy with 'buy <item>'"])
+
+        happened = engine.execute(line)
+        lines = self.describe(happened)
+        # the player is somewhere new, tell them about it
+        if any(isinstance(event, (events.Moved, events.Teleported)) for event in happened):
+            lines.extend(self.status())
+        return lines
+
+    def numbered(self, labels):
+        return [f"  [{i + 1}] {label}" for (i, label) in enumerate(labels)]
+
+    def item_label(self, engine, item):
+        count = engine.items.count(item)
+        return f"{item.emoji} {item.name}" + (f" x{count}" if count > 1 else "")
+
+    def character_label(self, character):
+        if character.role == BOSS:
+            return f"The {character.name}: {character.description}"
+        return f"A {character.name}: {character.description}"
+
+    def status(self):
+        """The description of the player's current cave"""
+        cave = self.engine.current_cave
+        linked = ", ".join(f"[{linked.num}]" for linked in self.engine.map.linked_caves(cave))
+        lines = [
+            "---*---*---",
+            f"You are in cave [{cave.num}]: A {cave.name}",
+            cave.description,
+            f"This cave is linked to caves {linked}",
+        ]
+        if isinstance(cave, Shop):
+            lines.append("There is a shop here! Use the 'shop' command to check it out!")
+        if len(cave.characters) > 0:
+            lines.append("You aren't alone in here! You see:")
+            lines.extend(f"  {self.character_label(character)}" for character in cave.characters)
+        else:
+            lines.append("It seems like there is no one else here")
+        lines.append("---*---*---")
+        return lines
+
+    def inventory(self):
+        engine = self.engine
+        lines = [f"You have {len(engine.items)} item(s) and ${engine.purse}"]
+        lines.extend(f"  {self.item_label(engine, item)}" for item in engine.items.kinds())
+        return lines
+
+    def describe(self, happened):
+        """Return the lines describing a list of events"""
+        lines = []
+        for event in happened:
+            match event:
+                case events.Rejected():
+                    lines.append(self.rejection(event))
+                case events.Moved():
+                    lines.append(f"You walk into cave [{event.to_cave.num}].")
+                case events.SecretUnlocked():
+                    lines.extend([
+                        "A loud rumbling sound fills the cave as an ancient hallway breaks apart...",
+                        "You've unlocked a pathway to the hall of memorials.",
+                        "There stood three named statues: Jim, Max, and Gavin",
+                    ])
+                case events.Talked():
+                    lines.append(f"{event.character.name}: \"{event.conversation}\"")
+                case events.ItemIneffective():
+                    lines.append(f"You try to use your {event.item.name} but to no avail! It is not very effective.")
+                case events.EnemyDamaged():
+                    lines.append(f"You use your {event.item.name} to fight the {event.enemy.name}, dealing {event.damage} damage! "
+                                 f"({event.enemy.get_health()}/{event.enemy.get_total_health()}HP left)")
+                    if not event.defeated:
+                        lines.append(f"The {event.enemy.name} is not defeated!")
+                case events.EnemyDefeated():
+                    lines.append(f"Bravo! You have defeated this {event.enemy.name}! For this you have received ${event.reward}.")
+                case events.Teleported():
+                    lines.append(f"You try to fight the ninja with your {event.item.name}, but they quickly drop a smoke bomb!")
+                    lines.append("The smoke clears and you're suddenly in a different cave!")
+                case events.PlayerDied():
+                    lines.append(f"You use your {event.item.name}, but the {event.enemy.name} doesn't even budge!")
+                    lines.append("He strikes you with one fell swoop of his katana... GAME OVER!!!")
+                case events.BossDefeated():
+                    lines.append(f"A mighty thud echoes around the cavern, as the {event.boss.name} falls to the ground.")
+                    lines.append("CONGRATULATIONS for defeating the final boss and escaping the Shogunate's Caverns!")
+                    lines.append("Type 'continue' to keep exploring, or 'quit' to leave.")
+                case events.ItemReceived():
+                    lines.append(f"You receive the {event.item.emoji} {event.item.name}.")
+                case events.ItemBought():
+                    lines.append(f"You've bought a brand new {event.item.emoji} {event.item.name}! You now have ${event.purse}.")
+        return lines
+
+    def rejection(self, event):
+        match event.reason:
+            case events.SAME_CAVE:
+                return f"You're already at cave {event.subject}!"
+            case events.NO_LINK:
+                return "You can't go that way!"
+            case events.INVALID_CAVE | events.BAD_ARGUMENT:
+                return f"'{event.subject}' was not a valid option!"
+            case events.NO_ROUTE:
+                return "There's no way to get there from here!"
+            case events.NO_CHARACTERS:
+                return "There is no one here."
+            case events.NO_ITEMS:
+                return "You have no items to fight with! Buy items in shops."
+            case events.INVALID_CHARACTER:
+                return "There's no one here by that number."
+            case events.INVALID_ITEM:
+                return "There's no item by that number."
+            case events.FRIENDLY:
+                return f"{event.subject.name} is a friend, not a foe! You can't fight them"
+            case events.SILENT:
+                return f"This {event.subject.name} doesn't want to talk to you."
+            case events.NOT_A_SHOP:
+                return "There isn't a shop here!"
+            case events.OUT_OF_STOCK:
+                return "This shop is out of stock!"
+            case events.CANNOT_AFFORD:
+                return f"Hey! You can't afford that item. You only have ${self.engine.purse}"
+            case events.DEAD:
+                return "You have died. Type 'quit' to leave."
+            case events.UNKNOWN_COMMAND:
+                return "Command not found. Type 'help' for a list of commands."
+            case _:
+                return "You can't do that right now."
+
+
+class Server:
+    """Accepts connections and runs a Session for each one"""
+
+    def __init__(self, host="127.0.0.1", port=4000, max_line=1024, write_buffer=64 * 1024, backlog=1024,
+                 world=None):
+        self.host = host
+        self.port = port
+        self.backlog = backlog  # connections waiting to be accepted
+        self.max_line = max_line  # longest line a client may send, in bytes
+        self.write_buffer = write_buffer  # bytes buffered per client before waiting
+        self.sessions = set()
+        self.stats = output.Stats()  # writes to every client so far
+        # world template every session starts from, None for the built-in map.
+        # a content pack is compiled once here, then each session just opens
+        # the compiled map file
+        self.world = world
+        if world is not None and world.endswith(".toml"):
+            self.world = contentpack.compile_pack(world) or world
+
+    def new_engine(self):
+        if self.world is None:
+            return Engine()
+        return Engine(lambda engine: contentpack.load_world(engine, self.world))
+
+    async def handle_client(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        session = Session(reader, writer, self.new_engine(), self.stats)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        except ConnectionError:
+            pass  # client went away mid-write
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self):
+        server = await asyncio.start_server(
+            self.handle_client, self.host, self.port, limit=self.max_line, backlog=self.backlog)
+        print(f"Serving Shogunate's Caverns on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Host Shogunate's Caverns for many players over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--world", default=None,
+                        help="start every game from this world template (a map file or a content pack)")
+    parser.add_argument("--output-stats", action="store_true",
+                        help="print how many writes to clients were saved, when the server stops")
+    args = parser.parse_args()
+
+    server = Server(args.host, args.port, world=args.world)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    if args.output_stats:
+        print("\n".join(server.stats.summary()))
@@ -0,0 +1,317 @@
+# Monte Carlo balance simulator
+#
+# Plays lots of games with a bot policy across a pool of processes and
+# reports win rate, turns to win, gold over time and which items get bought.
+# Prices, enemy health and the reward curve can be tweaked to see how they
+# change the balance.
+#
+#   python src/simulate.py --games 100000 --policy scripted --seed 1
+
+from engine import Engine
+from map import MapGraph
+from character import ENEMY, BOSS
+from cave import Shop
+from item import Item, CATALOG
+import events
+
+# stdlib
+from collections import Counter
+from functools import partial
+import multiprocessing
+import random
+import time
+import weakref
+
+
+class Settings:
+    """Balance knobs and limits for a simulation run"""
+
+    def __init__(self, reward_factor=Engine.reward_factor, price_scale=1.0, health_scale=1.0,
+                 max_turns=200, size=None):
+        self.reward_factor = reward_factor
+        self.price_scale = price_scale  # multiplies every shop price
+        self.health_scale = health_scale  # multiplies every regular enemy's health
+        self.max_turns = max_turns  # games still going after this many commands are abandoned
+        self.size = size  # generate procedural maps of this size instead of the built-in map
+
+
+def build_map(settings, engine):
+    """Generate a world for a simulated game, with the balance knobs applied"""
+    if settings.size is None:
+        world = MapGraph.generate(engine)
+    else:
+        from generator import ProceduralGenerator
+        world = ProceduralGenerator(settings.size, seed=engine.rng.random()).generate(engine)
+
+    if settings.price_scale == 1.0 and settings.health_scale == 1.0:
+        return world
+
+    for num in range(world.size):
+        cave = world.get_cave(num)
+        if cave is None:
+            continue
+        if isinstance(cave, Shop) and settings.price_scale != 1.0:
+            stocked = [(item, cave.for_sale.count(item)) for item in cave.for_sale]
+            cave.clear_shop_items()
+            for (item, count) in stocked:
+                cave.add_shop_item(Item.from_definition(CATALOG.define(
+                    item.name, item.emoji, item.description,
+                    round(item.cost * settings.price_scale), item.damage)), count)
+        for character in cave.characters:
+            if character.role == ENEMY:
+                character.health = character.total_health = max(
+                    1, round(character.total_health * settings.health_scale))
+    return world
+
+
+# ---
+# Policies: given an engine, return the next command to play, or None to
+# give up on the game (e.g. stuck in a cave with no links)
+# ---
+
+def random_policy(engine, rng):
+    """Does anything it is allowed to, at random"""
+    cave = engine.current_cave
+    options = [f"move {linked.num}" for linked in engine.map.linked_caves(cave)]
+    if cave.characters and engine.items:
+        options.append(f"fight {rng.randint(1, len(cave.characters))} {rng.randint(1, len(engine.items.kinds()))}")
+    if isinstance(cave, Shop) and cave.for_sale:
+        options.append(f"buy {rng.randint(1, len(cave.for_sale))}")
+    return rng.choice(options) if options else None
+
+
+def best_item(items, enemy):
+    """Return the number (from 1) of the best item to fight an enemy with, or None"""
+    return items.number(items.best_against(enemy))
+
+
+def scripted_policy(engine, rng):
+    """Plays like a sensible player
+
+    Fights enemies for gold, buys the best weapon it can afford, and goes
+    after the boss once it has the boss's weakness.
+    """
+    cave = engine.current_cave
+    world = engine.map
+    owned = engine.items.by_name
+
+    for (i, character) in enumerate(cave.characters):
+        if character.role == BOSS:
+            if character.weakness_item_name in owned:
+                return f"fight {i + 1} {best_item(engine.items, character)}"
+        elif character.role == ENEMY:
+            item_num = best_item(engine.items, character)
+            if item_num is not None:
+                return f"fight {i + 1} {item_num}"
+
+    if isinstance(cave, Shop):
+        for (i, item) in enumerate(cave.for_sale):
+            if worth_buying(engine, item, owned):
+                return f"buy {i + 1}"
+
+    target = pick_target(engine, owned)
+    if target is not None and target != cave.num:
+        next_cave = world.get_distances().next_hop(cave.num, target)
+        if next_cave is not None:
+            return f"move {next_cave}"
+
+    linked = world.linked_caves(cave)
+    if not linked:
+        return None  # nowhere left to go
+    return f"move {rng.choice(linked).num}"
+
+
+def worth_buying(engine, item, owned):
+    """Whether the scripted player wants an item: the boss's weakness, or a better weapon"""
+    if item.cost > engine.purse or item.name in owned:
+        return False
+    if item.name == boss_weakness(engine.map):
+        return True
+    strongest = engine.items.strongest()
+    return item.damage > (strongest.damage if strongest is not None else 0)
+
+
+def boss_weakness(world):
+    """The name of the item that defeats the boss, or None if there's no boss"""
+    for cave in world.caves_with(BOSS):
+        return cave.characters.of_role(BOSS)[0].weakness_item_name
+    return None
+
+
+# MapGraph -> its shops. shops are never added or removed mid-game, so each
+# world is only searched for them once
+_shops = weakref.WeakKeyDictionary()
+
+
+def shops(world):
+    """The shops in a world, in number order"""
+    found = _shops.get(world)
+    if found is None:
+        found = _shops[world] = [cave for cave in world.cave_data if isinstance(cave, Shop)]
+    return found
+
+
+def pick_target(engine, owned):
+    """Pick which cave the scripted player should head for next"""
+    world = engine.map
+    distances = world.get_distances()
+    here = engine.current_cave.num
+
+    wanted = set()
+    if boss_weakness(world) in owned:
+        wanted.update(cave.num for cave in world.caves_with(BOSS))
+    if engine.items.strongest() is not None:
+        wanted.update(cave.num for cave in world.caves_with(ENEMY))
+    for shop in shops(world):
+        if any(worth_buying(engine, item, owned) for item in shop.for_sale):
+            wanted.add(shop.num)
+
+    best = None
+    for num in wanted:
+        distance = distances.distance(here, num)
+        # the lowest numbered of the nearest caves
+        if distance is not None and (best is None or (distance, num) < best):
+            best = (distance, num)
+    return None if best is None else best[1]
+
+
+POLICIES = {
+    "random": random_policy,
+    "scripted": scripted_policy,
+}
+
+
+class Results:
+    """Totals from a batch of simulated games. Batches can be merged in any order"""
+
+    def __init__(self, max_turns):
+        self.games = 0
+        self.wins = 0
+        self.deaths = 0
+        self.turns_to_win = Counter()  # turns -> number of games won in that many
+        # gold_total[t] / gold_games[t] is the average purse after turn t,
+        # over the games that were still going at that point
+        self.gold_total = [0] * (max_turns + 1)
+        self.gold_games = [0] * (max_turns + 1)
+        self.purchases = Counter()  # item name -> times bought
+
+    def merge(self, other):
+        self.games += other.games
+        self.wins += other.wins
+        self.deaths += other.deaths
+        self.turns_to_win.update(other.turns_to_win)
+        for t in range(len(self.gold_total)):
+            self.gold_total[t] += other.gold_total[t]
+            self.gold_games[t] += other.gold_games[t]
+        self.purchases.update(other.purchases)
+        return self
+
+    def summary(self):
+        """Return a dict of the aggregated results, ready to print or save as JSON"""
+        won = sum(self.turns_to_win.values())
+        mean_turns = sum(t * n for (t, n) in self.turns_to_win.items()) / won if won else None
+        return {
+            "games": self.games,
+            "win_rate": self.wins / self.games if self.games else 0,
+            "death_rate": self.deaths / self.games if self.games else 0,
+            "mean_turns_to_win": mean_turns,
+            "turns_to_win": dict(sorted(self.turns_to_win.items())),
+            "gold_curve": [total / games if games else None
+                           for (total, games) in zip(self.gold_total, self.gold_games)],
+            "purchases": dict(self.purchases.most_common()),
+        }
+
+
+def play(seed, policy, settings, results):
+    """Play one game and add it to the results"""
+    engine = Engine(partial(build_map, settings), seed=seed)
+    engine.reward_factor = settings.reward_factor
+    # the policy gets its own random numbers so it doesn't change the game's
+    rng = random.Random(f"policy:{seed}")
+
+    results.games += 1
+    results.gold_total[0] += engine.purse
+    results.gold_games[0] += 1
+    for turn in range(1, settings.max_turns + 1):
+        command = policy(engine, rng)
+        if command is None:
+            return  # the bot is stuck, abandon the game like one that runs out of turns
+        for event in engine.execute(command):
+            if isinstance(event, events.ItemBought):
+                results.purchases[event.item.name] += 1
+            elif isinstance(event, events.BossDefeated):
+                results.wins += 1
+                results.turns_to_win[turn] += 1
+            elif isinstance(event, events.PlayerDied):
+                results.deaths += 1
+        results.gold_total[turn] += engine.purse
+        results.gold_games[turn] += 1
+        if engine.won or not engine.alive:
+            return
+
+
+def run_batch(seed, start, count, policy_name, settings):
+    """Play games number start to start + count - 1. Runs in a worker process"""
+    results = Results(settings.max_turns)
+    policy = POLICIES[policy_name]
+    for game in range(start, start + count):
+        # every game's seed depends only on the run's seed and its number, so
+        # results don't depend on how games are split between processes
+        play(f"{seed}:{game}", policy, settings, results)
+    return results
+
+
+def simulate(games, seed=0, policy="scripted", settings=None, processes=None, batch_size=1000):
+    """Play `games` games across a process pool and return the merged Results"""
+    settings = settings or Settings()
+    batches = [(seed, start, min(batch_size, games - start), policy, settings)
+               for start in range(0, games, batch_size)]
+
+    results = Results(settings.max_turns)
+    if processes == 1:
+        for batch in batches:
+            results.merge(run_batch(*batch))
+        return results
+
+    with multiprocessing.Pool(processes) as pool:
+        for batch_results in pool.starmap(run_batch, batches):
+            results.merge(batch_results)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Simulate many games to check the game's balance")
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="scripted")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--reward-factor", type=float, default=Engine.reward_factor)
+    parser.add_argument("--price-scale", type=float, default=1.0)
+    parser.add_argument("--health-scale", type=float, default=1.0)
+    parser.add_argument("--max-turns", type=int, default=200)
+    parser.add_argument("--size", type=int, default=None,
+                        help="play on procedural maps of this size instead of the built-in map")
+    parser.add_argument("--json", default=None, help="also write the full results to this file")
+    args = parser.parse_args()
+
+    settings = Settings(args.reward_factor, args.price_scale, args.health_scale, args.max_turns, args.size)
+    started = time.perf_counter()
+    summary = simulate(args.games, args.seed, args.policy, settings, args.processes).summary()
+    elapsed = time.perf_counter() - started
+
+    print(f"{summary['games']} games in {elapsed:.1f}s ({summary['games'] / elapsed:,.0f} games/s)")
+    print(f"Win rate: {summary['win_rate']:.1%}, death rate: {summary['death_rate']:.1%}")
+    if summary["mean_turns_to_win"] is not None:
+        print(f"Mean turns to win: {summary['mean_turns_to_win']:.1f}")
+    curve = summary["gold_curve"]
+    print("Average gold by turn: " + ", ".join(
+        f"{t}: {curve[t]:.0f}" for t in range(0, len(curve), max(1, len(curve) // 10)) if curve[t] is not None))
+    print("Purchases: " + ", ".join(f"{name} x{count}" for (name, count) in summary["purchases"].items()))
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(summary, file, indent=2)
@@ -0,0 +1,148 @@
+# What shops have for sale
+#
+# A ShopCatalog holds every kind of item (the catalog definition, plus its
+# damage if that was changed) stocked anywhere in a world, each with its
+# place in price order, and is shared by all the world's shops. A Stock is
+# one shop's counts of those kinds, plus its own price-sorted list of the
+# kinds it has, so a map with thousands of shops stocking the same things
+# only keeps each kind (and the Item shown for it) once, and each shop just
+# a count and a reference per kind. "What can the player afford" is a
+# bisection, and the shop menu can be shown a page at a time.
+
+from item import Item
+
+# stdlib
+from bisect import bisect_left, bisect_right, insort
+
+
+class _Kind:
+    """One kind of item in a ShopCatalog"""
+    __slots__ = ("item", "price_key")
+
+    def __init__(self, item, seq):
+        self.item = item  # shown in menus for every unit of this kind, in every shop
+        # (cost, when it was first stocked), so items with the same price keep
+        # the order they were first stocked in
+        self.price_key = (item.cost, seq)
+
+
+def _price_key(kind):
+    return kind.price_key
+
+
+def _kind(item):
+    return (item.definition, item.damage_override)
+
+
+class ShopCatalog:
+    """The kinds of items stocked by a world's shops, shared between their Stocks"""
+    __slots__ = ("kinds", "seq")
+
+    def __init__(self):
+        # (definition, damage override) -> _Kind
+        self.kinds = {}
+        self.seq = 0
+
+    def kind(self, item):
+        """The _Kind for an item, added if it's new"""
+        key = _kind(item)
+        found = self.kinds.get(key)
+        if found is None:
+            found = self.kinds[key] = _Kind(item, self.seq)
+            self.seq += 1
+        return found
+
+    def find(self, item):
+        """The _Kind for an item, or None if no shop has ever stocked it"""
+        return self.kinds.get(_kind(item))
+
+
+class Stock:
+    """The kinds of items for sale in a shop, cheapest first, with how many of each
+
+    Reads like a list of items, one per kind (len, iteration, indexing from
+    0), in price order; items with the same price stay in the order they were
+    first stocked. Adding or taking a unit of a kind that's already stocked
+    is O(1), a new or sold out kind is a bisection.
+
+    Shops in the same world should share a ShopCatalog (see MapGraph), a
+    Stock on its own gets a catalog of its own.
+    """
+    __slots__ = ("catalog", "counts", "by_price", "units", "listed")
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog if catalog is not None else ShopCatalog()
+        # _Kind -> how many are in stock
+        self.counts = {}
+        # every _Kind in stock, cheapest first
+        self.by_price = []
+        self.units = 0  # how many items there are, counting every unit
+        self.listed = None  # the items in price order, made when first asked for after a change
+
+    def add(self, item, count=1):
+        """Stock `count` more of an item"""
+        kind = self.catalog.kind(item)
+        stocked = self.counts.get(kind)
+        if stocked is None:
+            stocked = 0
+            insort(self.by_price, kind, key=_price_key)
+            self.listed = None
+        self.counts[kind] = stocked + count
+        self.units += count
+
+    def take(self, item):
+        """Take one unit of an item's kind out of stock, returning it as a new Item
+
+        Raises ValueError if it's out of stock (like list.remove).
+        """
+        kind = self.catalog.find(item)
+        stocked = self.counts.get(kind) if kind is not None else None
+        if stocked is None:
+            raise ValueError(f"{item.name} is not in stock")
+        self.units -= 1
+        if stocked == 1:
+            # sold out
+            del self.by_price[bisect_left(self.by_price, kind.price_key, key=_price_key)]
+            del self.counts[kind]
+            self.listed = None
+        else:
+            self.counts[kind] = stocked - 1
+        bought = Item.from_definition(item.definition)
+        bought.damage_override = item.damage_override
+        return bought
+
+    def count(self, item):
+        """How many of an item's kind are in stock"""
+        kind = self.catalog.find(item)
+        return self.counts.get(kind, 0) if kind is not None else 0
+
+    def affordable(self, purse):
+        """How many kinds cost no more than `purse`. They're the first ones, prices are sorted"""
+        return bisect_right(self.by_price, (purse, self.catalog.seq), key=_price_key)
+
+    def items(self):
+        """One item of each kind, cheapest first"""
+        if self.listed is None:
+            self.listed = [kind.item for kind in self.by_price]
+        return self.listed
+
+    def page(self, number, size):
+        """The items on a page (from 0) of a menu showing `size` per page"""
+        return self.items()[number * size:(number + 1) * size]
+
+    def pages(self, size):
+        """How many pages a menu showing `size` per page needs, at least 1"""
+        return max(1, -(-len(self.by_price) // size))
+
+    def __len__(self):
+        return len(self.by_price)
+
+    def __iter__(self):
+        return iter(self.items())
+
+    def __getitem__(self, index):
+        return self.items()[index]
+
+    def __contains__(self, item):
+        kind = self.catalog.find(item)
+        return kind is not None and kind in self.counts
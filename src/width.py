@@ -0,0 +1,94 @@
+# Display width of text in the terminal
+#
+# How many columns a string takes up once printed: ANSI styling codes take
+# none, wide East Asian characters and emoji take two, and combining marks,
+# variation selectors and zero width joiners take none (they change the
+# character before them instead). Widths are cached, the game measures the
+# same few lines over and over.
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# ANSI escape sequences: CSI (colours, cursor movement...) and OSC
+ANSI = re.compile(
+    r"[\u001B\u009B][\[\]()#;?]*(?:(?:(?:(?:;[-a-zA-Z\d\/#&.:=?%@~_]+)*|[a-zA-Z\d]+(?:;[-a-zA-Z\d\/#&.:=?%@~_]*)*)?"
+    r"(?:\u0007|\u001B\u005C|\u009C))|(?:(?:\d{1,4}(?:;\d{0,4})*)?[\dA-PR-TZcf-nq-uy=><~]))")
+
+ZWJ = "\u200d"  # zero width joiner, glues emoji together e.g. 👨‍👩‍👧
+VS15 = "\ufe0e"  # show the character before as text (narrow)
+VS16 = "\ufe0f"  # show the character before as an emoji (wide)
+
+
+def strip_ansi(text):
+    """Remove ANSI escape sequences from some text"""
+    return ANSI.sub("", text)
+
+
+@lru_cache(maxsize=4096)
+def char_width(char):
+    """The number of columns a single character takes up: 0, 1 or 2"""
+    if char < "\u0300":
+        # ASCII and Latin, the usual case; control characters take no space
+        return 1 if " " <= char < "\x7f" or char >= "\xa0" else 0
+    if unicodedata.combining(char) or unicodedata.category(char) in ("Mn", "Me", "Cf"):
+        return 0  # combining marks, variation selectors, joiners...
+    if "\U0001f3fb" <= char <= "\U0001f3ff":
+        return 2  # skin tone modifiers, 0 when they follow an emoji (see text_width)
+    if unicodedata.east_asian_width(char) in ("W", "F"):
+        return 2
+    return 1
+
+
+@lru_cache(maxsize=4096)
+def text_width(text):
+    """The number of columns some text takes up in the terminal
+
+    ANSI styling is ignored. Emoji sequences joined with ZWJ count as one
+    emoji, and VS16/VS15 make the character before wide/narrow.
+    """
+    text = strip_ansi(text)
+    if text.isascii() and text.isprintable():
+        return len(text)
+
+    width = 0
+    last = 0  # width of the last character that took up space
+    joined = False  # whether the last character was a ZWJ
+    for char in text:
+        if joined:
+            # part of the emoji before
+            joined = False
+            continue
+        if char == ZWJ:
+            joined = True
+        elif char == VS16:
+            if last == 1:
+                width += 1
+                last = 2
+        elif char == VS15:
+            if last == 2:
+                width -= 1
+                last = 1
+        elif "\U0001f3fb" <= char <= "\U0001f3ff" and last == 2:
+            pass  # skin tone of the emoji before
+        else:
+            char_columns = char_width(char)
+            if char_columns:
+                width += char_columns
+                last = char_columns
+    return width
+
+
+def widths(lines):
+    """The width of each of many lines, as a list"""
+    return list(map(text_width, lines))
+
+
+def max_width(lines):
+    """The width of the widest of some lines, 0 if there aren't any"""
+    return max(map(text_width, lines), default=0)
+
+
+def pad(text, width):
+    """Add spaces to the end of some text so it takes up `width` columns"""
+    return text + " " * max(0, width - text_width(text))